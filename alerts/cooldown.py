@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database.models import AlertCooldown
+from config import Config
+
+class MemoryCooldownStore:
+    """
+    Process-local cooldowns keyed by (website_id, alert_type), O(1) per lookup.
+    Entries are kept in expiry order, so expired ones are evicted from the front as new ones arrive,
+    and never more than `max_keys` are held (the oldest go first).
+    """
+
+    def __init__(self, ttl: float = Config.ALERT_COOLDOWN, max_keys: int = Config.ALERT_COOLDOWN_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._expiry = OrderedDict()  # key -> monotonic expiry
+        self._lock = threading.Lock()
+
+    def acquire(self, key) -> bool:
+        """True if the key is not cooling down, in which case its cooldown starts now."""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._expiry.get(key)
+            if expires is not None and expires > now:
+                return False
+            self._set(key, now + self.ttl, now)
+            return True
+
+    def release(self, key):
+        """Ends a cooldown early, e.g. when the alert that started it was never delivered."""
+        with self._lock:
+            self._expiry.pop(key, None)
+
+    def remaining(self, key) -> float:
+        with self._lock:
+            return max(0.0, self._expiry.get(key, 0.0) - time.monotonic())
+
+    def remember(self, key, seconds: float):
+        """Records a cooldown learned elsewhere (the shared store) so it is answered locally."""
+        now = time.monotonic()
+        with self._lock:
+            self._set(key, now + seconds, now)
+
+    def _set(self, key, expires, now):
+        self._expiry[key] = expires
+        self._expiry.move_to_end(key)
+        while self._expiry:
+            oldest, oldest_expiry = next(iter(self._expiry.items()))
+            if oldest_expiry > now and len(self._expiry) <= self.max_keys:
+                break
+            del self._expiry[oldest]
+
+    def __len__(self):
+        return len(self._expiry)
+
+class DBCooldownStore:
+    """
+    Cooldowns in the alert_cooldowns table, shared across processes and kept over restarts.
+    Each acquire is one primary-key UPDATE (plus an INSERT the first time a key is seen); the
+    database arbitrates races, so only one process wins a given cooldown. Keys known to be cooling
+    down are also cached in memory so repeated suppressed alerts don't touch the database.
+    """
+
+    def __init__(self, db_manager, ttl: float = Config.ALERT_COOLDOWN, max_keys: int = Config.ALERT_COOLDOWN_MAX_KEYS):
+        self.db = db_manager
+        self.ttl = ttl
+        self._local = MemoryCooldownStore(ttl, max_keys)
+
+    def acquire(self, key) -> bool:
+        if self._local.remaining(key):
+            return False
+        website_id, alert_type = key
+        now = datetime.utcnow()
+        try:
+            with self.db.get_session() as session:
+                # Take over an expired cooldown; the WHERE makes this a no-op if it is still running
+                claimed = session.query(AlertCooldown).filter(
+                    AlertCooldown.website_id == website_id, AlertCooldown.alert_type == alert_type,
+                    AlertCooldown.expires_at <= now
+                ).update({"expires_at": now + timedelta(seconds=self.ttl)}, synchronize_session=False)
+                if not claimed:
+                    existing = session.get(AlertCooldown, (website_id, alert_type))
+                    if existing is not None:
+                        self._local.remember(key, (existing.expires_at - now).total_seconds())
+                        return False
+                    session.add(AlertCooldown(website_id=website_id, alert_type=alert_type,
+                                              expires_at=now + timedelta(seconds=self.ttl)))
+        except IntegrityError:
+            # Another process inserted the same key first
+            self._local.remember(key, self.ttl)
+            return False
+        return True
+
+    def release(self, key):
+        self._local.release(key)
+        website_id, alert_type = key
+        with self.db.get_session() as session:
+            session.query(AlertCooldown).filter(
+                AlertCooldown.website_id == website_id, AlertCooldown.alert_type == alert_type
+            ).delete(synchronize_session=False)
+
+def build_cooldown_store(db_manager=None, kind: str = Config.ALERT_COOLDOWN_STORE):
+    if kind == "db" and db_manager is not None:
+        return DBCooldownStore(db_manager)
+    return MemoryCooldownStore()
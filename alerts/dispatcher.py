@@ -0,0 +1,250 @@
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from database.models import AlertOutbox
+from monitors.metrics import ALERT_SEND, ALERTS_SENT
+from .cooldown import build_cooldown_store
+from .telegram_bot import MAX_MESSAGE_LENGTH, TelegramBot, TelegramError
+from config import Config
+
+class TokenBucket:
+    """Allows `rate` events per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Empties the bucket for `seconds`, e.g. after Telegram answers 429 retry_after."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+class AlertDispatcher:
+    """
+    Delivers alerts from the durable outbox (AlertOutbox) on a background thread.
+    Checks never talk to Telegram: prepare() turns an alert into an outbox row that the DB writer
+    commits alongside the check's results, so a slow or unreachable API can't hold up a check or
+    a transaction, and queued alerts survive a restart.
+    - Cooldowns are applied when a row is sent, not when it is queued, so with the DB cooldown store
+      a restarted or second process doesn't repeat an alert that already went out.
+    - Pending rows for one chat are held until the oldest is `coalesce_window` seconds old, then
+      sent as one message (split at Telegram's length limit).
+    - Token buckets keep each chat and the bot as a whole under Telegram's rate limits; a 429
+      pauses the bucket for the `retry_after` Telegram asks for.
+    - Failed sends back off exponentially with jitter; after `max_attempts` a row is marked failed.
+      When Telegram rejects a coalesced message outright (e.g. markup it can't parse), its rows are
+      retried one per message, so only the alerts that fail on their own are marked failed.
+    Rows are claimed with a per-dispatcher token before sending, so several processes can share one
+    outbox. Delivery is at-least-once: a crash between sending and deleting resends the message.
+    """
+
+    def __init__(self, db_manager, bot: TelegramBot = None, coalesce_window=Config.ALERT_COALESCE_SECONDS,
+                 chat_rate=Config.ALERT_CHAT_RATE, global_rate=Config.ALERT_GLOBAL_RATE,
+                 max_attempts=Config.ALERT_MAX_ATTEMPTS, poll_interval=Config.ALERT_POLL_INTERVAL):
+        self.db = db_manager
+        self.bot = bot or TelegramBot(cooldowns=build_cooldown_store(db_manager))
+        self.coalesce_window = coalesce_window
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.id = uuid.uuid4().hex
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets = OrderedDict()
+        self._isolated = set()  # ids of rows to send on their own after their batch was rejected
+        self._stop = threading.Event()
+        self._thread = None
+
+    def prepare(self, message: str, website_id: int = None, alert_type: str = None) -> dict:
+        """
+        Outbox mapping for an alert, or None when no bot is configured (the alert is then printed
+        locally as before). Called from the check path; never blocks or touches the database.
+        """
+        if not self.bot.configured:
+            print(f"[LOCAL ALERT] {message}")
+            return None
+        now = datetime.utcnow()
+        return {
+            "chat_id": str(self.bot.chat_id),
+            "website_id": website_id,
+            "alert_type": alert_type,
+            "message": message[:MAX_MESSAGE_LENGTH],
+            "created_at": now,
+            "next_attempt_at": now,
+            "status": "pending",
+            "attempts": 0,
+        }
+
+    def start(self):
+        if self.bot.configured and not (self._thread and self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.dispatch_once()
+            except Exception as e:
+                print(f"[!] Alert dispatch failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+            if len(self._chat_buckets) > 1024:
+                self._chat_buckets.popitem(last=False)
+        self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def dispatch_once(self) -> int:
+        """Sends every batch that is due and allowed by the rate limits. Returns messages sent."""
+        sent = 0
+        for chat_id, rows in self._due_batches().items():
+            bucket = self._chat_bucket(chat_id)
+            for batch in self._split(rows):
+                if not (bucket.available() and self._global_bucket.available()):
+                    break
+                claimed = self._claim(batch)
+                if not claimed:
+                    continue
+                deliver = [row for row in claimed if not self.bot.is_suppressed(row.website_id, row.alert_type)]
+                if len(deliver) < len(claimed):
+                    ALERTS_SENT.labels("suppressed").inc(len(claimed) - len(deliver))
+                if not deliver:
+                    self._delete(claimed)
+                    continue
+                bucket.take()
+                self._global_bucket.take()
+                try:
+                    with ALERT_SEND.time():
+                        self.bot.post("\n\n".join(row.message for row in deliver), chat_id)
+                except TelegramError as e:
+                    ALERTS_SENT.labels("failed").inc()
+                    if e.retry_after:
+                        bucket.pause(e.retry_after)
+                    # Not delivered, so the cooldowns it started must not hold back the retry
+                    for row in deliver:
+                        if row.website_id and row.alert_type:
+                            self.bot.cooldowns.release((row.website_id, row.alert_type))
+                    if e.permanent and len(deliver) > 1:
+                        # One bad alert mustn't take the rest of the batch down with it
+                        self._isolated.update(row.id for row in deliver)
+                        self._unclaim(deliver)
+                    else:
+                        self._fail(deliver, e)
+                    self._delete([row for row in claimed if row not in deliver])
+                    break
+                self._delete(claimed)
+                ALERTS_SENT.labels("sent").inc()
+                sent += 1
+        return sent
+
+    def _due_batches(self, limit: int = 500) -> dict:
+        now = datetime.utcnow()
+        with self.db.get_session() as session:
+            rows = session.query(AlertOutbox).filter(
+                AlertOutbox.status == "pending", AlertOutbox.next_attempt_at <= now
+            ).order_by(AlertOutbox.id).limit(limit).all()
+            session.expunge_all()
+        by_chat = {}
+        for row in rows:
+            by_chat.setdefault(row.chat_id, []).append(row)
+        # Hold a chat's alerts until its oldest has waited out the window, so a burst goes out together
+        ready = now - timedelta(seconds=self.coalesce_window)
+        return {chat: rows for chat, rows in by_chat.items() if rows[0].created_at <= ready}
+
+    def _split(self, rows):
+        """Groups rows into messages that fit Telegram's length limit."""
+        batch, length = [], 0
+        for row in rows:
+            if row.id in self._isolated:
+                yield [row]
+                continue
+            size = len(row.message) + 2
+            if batch and length + size > MAX_MESSAGE_LENGTH:
+                yield batch
+                batch, length = [], 0
+            batch.append(row)
+            length += size
+        if batch:
+            yield batch
+
+    def _claim(self, rows) -> list:
+        """Takes ownership of rows for one send; rows another dispatcher claimed first are dropped."""
+        ids = [row.id for row in rows]
+        now = datetime.utcnow()
+        with self.db.get_session() as session:
+            # The lease hides the rows from other dispatchers while this one is sending
+            session.query(AlertOutbox).filter(
+                AlertOutbox.id.in_(ids), AlertOutbox.status == "pending", AlertOutbox.next_attempt_at <= now
+            ).update({"claimed_by": self.id, "next_attempt_at": now + timedelta(seconds=60)}, synchronize_session=False)
+        with self.db.get_session() as session:
+            claimed = session.query(AlertOutbox).filter(
+                AlertOutbox.id.in_(ids), AlertOutbox.claimed_by == self.id
+            ).order_by(AlertOutbox.id).all()
+            session.expunge_all()
+        return claimed
+
+    def _unclaim(self, rows):
+        """Returns claimed rows to the outbox, due again straight away and without using up an attempt."""
+        with self.db.get_session() as session:
+            session.query(AlertOutbox).filter(AlertOutbox.id.in_([row.id for row in rows])).update(
+                {"claimed_by": None, "next_attempt_at": datetime.utcnow()}, synchronize_session=False
+            )
+
+    def _delete(self, rows):
+        self._isolated.difference_update(row.id for row in rows)
+        with self.db.get_session() as session:
+            session.query(AlertOutbox).filter(
+                AlertOutbox.id.in_([row.id for row in rows])
+            ).delete(synchronize_session=False)
+
+    def _fail(self, rows, error: TelegramError):
+        now = datetime.utcnow()
+        # Being rate limited isn't the message's fault, so it doesn't use up an attempt
+        attempts = max(row.attempts or 0 for row in rows) + (0 if error.retry_after else 1)
+        if error.retry_after:
+            delay = error.retry_after
+        else:
+            # 1s, 2s, 4s ... capped at 10 minutes, with jitter so retries don't line up
+            delay = min(600, 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        # The batch shares one retry time so it is coalesced again on the next attempt
+        failed = error.permanent or attempts >= self.max_attempts
+        updates = [{
+            "id": row.id,
+            "attempts": attempts,
+            "status": "failed" if failed else "pending",
+            "next_attempt_at": now + timedelta(seconds=delay),
+            "claimed_by": None,
+            "last_error": str(error)[:500],
+        } for row in rows]
+        if failed:
+            self._isolated.difference_update(row.id for row in rows)
+        print(f"[!] Telegram delivery failed for {len(rows)} alert(s): {error}")
+        with self.db.get_session() as session:
+            session.bulk_update_mappings(AlertOutbox, updates)
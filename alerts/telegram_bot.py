@@ -1,38 +1,79 @@
 import requests
 from config import Config
-import time
+from .cooldown import MemoryCooldownStore
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+def escape_markdown(text: str) -> str:
+    """Escapes arbitrary text (e.g. page content) for the legacy Markdown parse mode messages are sent in."""
+    for char in ("_", "*", "`", "["):
+        text = text.replace(char, "\\" + char)
+    return text
+
+class TelegramError(Exception):
+    """A failed sendMessage call. `retry_after` is set on 429s; `permanent` errors will fail again if retried."""
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
 
 class TelegramBot:
-    def __init__(self, token=Config.TELEGRAM_BOT_TOKEN, chat_id=Config.TELEGRAM_CHAT_ID):
+    def __init__(self, token=Config.TELEGRAM_BOT_TOKEN, chat_id=Config.TELEGRAM_CHAT_ID, cooldowns=None):
         self.token = token
         self.chat_id = chat_id
-        self.last_sent = {} # Rate limiting: {website_id_alert_type: timestamp}
-        self.cooldown = 600 # 10 minutes cooldown for same alert type per site
+        # Rate limiting: cooldown per (website_id, alert_type); see alerts.cooldown for the shared store
+        self.cooldowns = cooldowns if cooldowns is not None else MemoryCooldownStore()
+        self.http = requests.Session()
 
-    def send_message(self, message: str, website_id: int = None, alert_type: str = None):
-        if not self.token or not self.chat_id:
-            print(f"[LOCAL ALERT] {message}")
-            return False
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.chat_id)
 
-        # Basic Rate Limiting
-        if website_id and alert_type:
-            key = f"{website_id}_{alert_type}"
-            now = time.time()
-            if key in self.last_sent and (now - self.last_sent[key]) < self.cooldown:
-                print(f"Alert suppressed (rate limit): {key}")
-                return False
-            self.last_sent[key] = now
+    def is_suppressed(self, website_id: int = None, alert_type: str = None) -> bool:
+        """Per-site, per-type cooldown; records the alert as sent when it is let through."""
+        if not website_id or not alert_type:
+            return False
+        if not self.cooldowns.acquire((website_id, alert_type)):
+            print(f"Alert suppressed (rate limit): {website_id}_{alert_type}")
+            return True
+        return False
 
+    def post(self, message: str, chat_id: str = None):
+        """Calls sendMessage once; raises TelegramError on failure."""
         url = f"https://api.telegram.org/bot{self.token}/sendMessage"
         payload = {
-            "chat_id": self.chat_id,
+            "chat_id": chat_id or self.chat_id,
             "text": message,
             "parse_mode": "Markdown"
         }
-        
         try:
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
+            response = self.http.post(url, json=payload, timeout=10)
+        except requests.RequestException as e:
+            raise TelegramError(str(e))
+        if response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            raise TelegramError("Too Many Requests", retry_after=retry_after or 1)
+        if response.status_code >= 400:
+            # Other 4xx are bad requests (markup, chat id, token) that a retry won't fix
+            raise TelegramError(f"HTTP {response.status_code}: {response.text[:200]}", permanent=response.status_code < 500)
+
+    def send_message(self, message: str, website_id: int = None, alert_type: str = None):
+        """Sends right away, blocking; alerts from checks go through AlertDispatcher instead."""
+        if not self.configured:
+            print(f"[LOCAL ALERT] {message}")
+            return False
+
+        # Basic Rate Limiting
+        if self.is_suppressed(website_id, alert_type):
+            return False
+
+        try:
+            self.post(message)
             return True
         except Exception as e:
             print(f"Failed to send Telegram message: {e}")
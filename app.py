@@ -1,11 +1,15 @@
+import html
+from datetime import datetime, timedelta
 import streamlit as st
 import plotly.express as px
+from database.archive import CheckArchive
 from database.db_manager import DBManager
-from database.models import CheckLog, AlertLog
-import time
-from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
+from database.status_feed import StatusFeed
 from monitors.checker import SiteChecker
+from monitors.probes import CHECK_MODES
+from monitors.scheduler import MonitorScheduler
+from monitors.sharding import ShardCoordinator
+from config import Config
 import os
 
 st.set_page_config(
@@ -90,14 +94,38 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-db = DBManager()
+# One engine and schema check per server process, not per rerun
+@st.cache_resource
+def get_db():
+    return DBManager()
+
+db = get_db()
+
+# --- Read model: shared by all sessions, so concurrent viewers cost one change-feed query per poll ---
+@st.cache_resource
+def get_feed():
+    return StatusFeed(get_db())
+
+feed = get_feed()
+
+# `version` is the site's last change in the feed, so a new check result loads fresh charts right away
+@st.cache_data(ttl=Config.DASHBOARD_CACHE_TTL, show_spinner=False, max_entries=500)
+def load_site_details(website_id: int, version: int):
+    return get_db().get_latency_rollups(website_id, "minute", limit=50), get_db().get_recent_alerts(website_id, limit=10)
+
+# Sketches are checkpointed every SKETCH_CHECKPOINT_INTERVAL, so caching them longer than that gains nothing
+@st.cache_data(ttl=min(Config.DASHBOARD_CACHE_TTL, Config.SKETCH_CHECKPOINT_INTERVAL), show_spinner=False, max_entries=500)
+def load_latency_quantiles(website_id: int):
+    return get_db().get_latency_quantiles(website_id)
+
+# Archived days never change, so their summaries are cached far longer than live data
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=200)
+def load_archive_history(website_id: int, days: int):
+    return CheckArchive().daily_summary(website_id, start=(datetime.utcnow() - timedelta(days=days)).date())
 
 # --- Background Monitor Initialization (Singleton) ---
 @st.cache_resource
 def start_monitor():
-    scheduler = BackgroundScheduler()
-    checker = SiteChecker(db)
-    
     # --- Auto-Seeding for Cloud (Ensure all 33+ are present) ---
     sites = [
         ("GKToday - SSC/UPSC", "https://www.gktoday.in/"),
@@ -134,37 +162,20 @@ def start_monitor():
         ("Zenver Technologies", "https://www.zenver.in/"),
         ("WhatsApp", "https://www.whatsapp.com/"),
     ]
-    for name, url in sites:
-        db.add_website(name, url, 300) # add_website handles duplicates internally
-    
-    websites = db.get_active_websites()
+    db.bulk_upsert_websites(sites, interval=300) # one transaction; URLs already present are skipped
 
-    for site in websites:
-        scheduler.add_job(
-            checker.check_site, 
-            'interval', 
-            seconds=site.check_interval, 
-            args=[site.id],
-            id=f"site_{site.id}",
-            replace_existing=True
-        )
+    # Spread, jittered jobs; sites added from the sidebar are picked up by the reconcile job.
+    # With SHARDING on, the dashboard joins the worker ring instead of re-checking every site.
+    checker = SiteChecker(db, shard=ShardCoordinator(db) if Config.SHARDING else None)
+    scheduler = MonitorScheduler(checker)
     scheduler.start()
     return scheduler
 
-# Start the engine
-if "monitor_started" not in st.session_state:
+# Start the engine, unless checks run in separate main.py processes (DASHBOARD_ONLY)
+if not Config.DASHBOARD_ONLY and "monitor_started" not in st.session_state:
     start_monitor()
     st.session_state.monitor_started = True
 
-# --- Helper Functions ---
-def get_uptime_percentage(website_id, days=7):
-    with db.get_session() as session:
-        since = datetime.utcnow() - timedelta(days=days)
-        total = session.query(CheckLog).filter(CheckLog.website_id == website_id, CheckLog.timestamp >= since).count()
-        if total == 0: return 100.0
-        up_count = session.query(CheckLog).filter(CheckLog.website_id == website_id, CheckLog.timestamp >= since, CheckLog.is_up == True).count()
-        return (up_count / total) * 100
-
 # --- Sidebar Management ---
 with st.sidebar:
     st.image("https://cdn-icons-png.flaticon.com/512/2622/2622244.png", width=80)
@@ -180,6 +191,7 @@ with st.sidebar:
                 result = db.add_website(new_name, new_url, new_interval)
                 if result:
                     st.success(f"Added {new_name}!")
+                    feed.invalidate()
                     st.rerun()
                 else:
                     st.error(f"Error: A target with URL '{new_url}' is already being monitored.")
@@ -189,86 +201,161 @@ with st.sidebar:
     st.markdown("---")
     st.caption("Background service handles OSINT & Alerts.")
     if st.button("🔄 Refresh Data", use_container_width=True):
+        feed.invalidate()
+        load_site_details.clear()
         st.rerun()
+    # Live mode reruns only the status and chart fragments, fed from the shared change feed
+    live_mode = st.checkbox(f"Real-time Mode ({Config.DASHBOARD_POLL_SECONDS:g}s live updates)", value=False)
 
 # --- Main Dashboard Logic ---
 tab_overview, tab_details, tab_help = st.tabs(["📊 Overview", "📈 Site Details", "📩 Setup Guide"])
 
-websites = db.get_all_websites()
+live_every = Config.DASHBOARD_POLL_SECONDS if live_mode else None
 
-if not websites:
-    with tab_overview:
+@st.fragment(run_every=live_every)
+def render_overview():
+    version = feed.poll()
+    websites = feed.snapshot()
+    if not websites:
         st.info("No targets found. Use the sidebar to add your first website!")
-else:
-    # --- OVERVIEW TAB ---
-    with tab_overview:
-        total_sites = len(websites)
-        up_sites = sum(1 for w in websites if w.is_up)
-        down_sites = total_sites - up_sites
-        
-        c1, c2, c3 = st.columns(3)
-        with c1:
-            st.markdown(f'<div class="metric-card"><div style="color: #94a3b8; font-size: 0.875rem;">Total Targets</div><div class="metric-value">{total_sites}</div></div>', unsafe_allow_html=True)
-        with c2:
-            st.markdown(f'<div class="metric-card"><div style="color: #4ade80; font-size: 0.875rem;">Online</div><div class="metric-value" style="background: linear-gradient(to right, #4ade80, #2dd4bf); -webkit-background-clip: text;">{up_sites}</div></div>', unsafe_allow_html=True)
-        with c3:
-            color = "#f87171" if down_sites > 0 else "#94a3b8"
-            st.markdown(f'<div class="metric-card"><div style="color: {color}; font-size: 0.875rem;">Offline</div><div class="metric-value" style="background: linear-gradient(to right, #f87171, #fb923c); -webkit-background-clip: text;">{down_sites}</div></div>', unsafe_allow_html=True)
+        return
 
-        st.markdown("### 📋 Live Monitor Status")
-        
-        table_header = "| Name | Status | Latency | Uptime (7d) | Last Check |"
-        table_sep = "| :--- | :--- | :--- | :--- | :--- |"
-        table_rows = []
+    # Toast UP/DOWN transitions this viewer hasn't seen yet
+    seen = st.session_state.setdefault("seen_version", version)
+    for change_version, site in feed.changes:
+        if change_version > seen:
+            st.toast(f"{site['name']} is {'back ONLINE' if site['is_up'] else 'OFFLINE'}", icon="✅" if site["is_up"] else "🚨")
+    st.session_state.seen_version = version
+
+    total_sites = len(websites)
+    up_sites = sum(1 for w in websites if w["is_up"])
+    down_sites = total_sites - up_sites
+    
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.markdown(f'<div class="metric-card"><div style="color: #94a3b8; font-size: 0.875rem;">Total Targets</div><div class="metric-value">{total_sites}</div></div>', unsafe_allow_html=True)
+    with c2:
+        st.markdown(f'<div class="metric-card"><div style="color: #4ade80; font-size: 0.875rem;">Online</div><div class="metric-value" style="background: linear-gradient(to right, #4ade80, #2dd4bf); -webkit-background-clip: text;">{up_sites}</div></div>', unsafe_allow_html=True)
+    with c3:
+        color = "#f87171" if down_sites > 0 else "#94a3b8"
+        st.markdown(f'<div class="metric-card"><div style="color: {color}; font-size: 0.875rem;">Offline</div><div class="metric-value" style="background: linear-gradient(to right, #f87171, #fb923c); -webkit-background-clip: text;">{down_sites}</div></div>', unsafe_allow_html=True)
+
+    st.markdown("### 📋 Live Monitor Status")
+    
+    table_header = "| Name | Status | Latency | Uptime (7d) | Last Check |"
+    table_sep = "| :--- | :--- | :--- | :--- | :--- |"
+    table_rows = []
+    
+    for site in websites:
+        uptime = site["uptime"] if site["uptime"] is not None else 100.0
+        status_style = "status-up" if site["is_up"] else "status-down"
+        status_text = "ONLINE" if site["is_up"] else "OFFLINE"
+        latency = f"{site['last_response_time']:.2f}s" if site["last_response_time"] else "--"
+        last_check = site["last_check_at"].strftime("%H:%M:%S") if site["last_check_at"] else "Never"
         
-        for site in websites:
-            uptime = get_uptime_percentage(site.id)
-            status_style = "status-up" if site.is_up else "status-down"
-            status_text = "ONLINE" if site.is_up else "OFFLINE"
-            latency = f"{site.last_response_time:.2f}s" if site.last_response_time else "--"
-            last_check = site.last_check_at.strftime("%H:%M:%S") if site.last_check_at else "Never"
-            
-            table_rows.append(f"| **{site.name}** | <span class='status-badge {status_style}'>{status_text}</span> | `{latency}` | `{uptime:.1f}%` | {last_check} |")
+        table_rows.append(f"| **{site['name']}** | <span class='status-badge {status_style}'>{status_text}</span> | `{latency}` | `{uptime:.1f}%` | {last_check} |")
+    
+    st.markdown("\n".join([table_header, table_sep] + table_rows), unsafe_allow_html=True)
+
+@st.fragment(run_every=live_every)
+def render_details():
+    feed.poll()
+    sites_by_id = {w["id"]: w for w in feed.snapshot()}
+    if not sites_by_id:
+        return
+    site_select = st.selectbox("🎯 Target Analysis", options=list(sites_by_id), index=0,
+                               format_func=lambda site_id: sites_by_id[site_id]["name"])
+    selected_site = sites_by_id[site_select]
+    
+    # Cached per change version: between check results a live refresh reruns no queries
+    points, alerts = load_site_details(selected_site["id"], feed.site_version(selected_site["id"]))
+    if points:
+        times = [p[0] for p in points]
+        latencies = [p[1] for p in points]
         
-        st.markdown("\n".join([table_header, table_sep] + table_rows), unsafe_allow_html=True)
+        # Plotly Chart with custom theme
+        fig = px.area(x=times, y=latencies, title=f"Latency History: {selected_site['name']}",
+                      labels={'x': 'Time', 'y': 'Response Time (s)'},
+                      template="plotly_dark")
+        fig.update_traces(line_color='#60a5fa', fillcolor='rgba(96, 165, 250, 0.1)', name="avg", showlegend=True)
+        fig.add_scatter(x=times, y=[p[2] for p in points], mode="lines", name="p95",
+                        line=dict(color="#a855f7", dash="dot"))
+        fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+                          font_color="#94a3b8", margin=dict(l=0, r=0, t=40, b=0))
+        st.plotly_chart(fig, use_container_width=True)
 
-    # --- DETAILS TAB ---
-    with tab_details:
-        site_select = st.selectbox("🎯 Target Analysis", options=[w.name for w in websites], index=0)
-        selected_site = next(w for w in websites if w.name == site_select)
+        if Config.LATENCY_SKETCHES:
+            quantiles = load_latency_quantiles(selected_site["id"])
+            fmt = lambda value: f"{value:.3f}s" if value is not None else "--"
+            rows = [f"| {window} | {stats['count']} | `{fmt(stats['p50'])}` | `{fmt(stats['p95'])}` | `{fmt(stats['p99'])}` |"
+                    for window, stats in quantiles.items()]
+            st.markdown("\n".join(["| Window | Checks | p50 | p95 | p99 |", "| :--- | ---: | ---: | ---: | ---: |"] + rows))
         
-        with db.get_session() as session:
-            logs = session.query(CheckLog).filter(CheckLog.website_id == selected_site.id).order_by(CheckLog.timestamp.desc()).limit(50).all()
-            
-            if logs:
-                times = [l.timestamp for l in logs]
-                latencies = [l.response_time for l in logs]
-                
-                # Plotly Chart with custom theme
-                fig = px.area(x=times, y=latencies, title=f"Latency History: {selected_site.name}",
-                              labels={'x': 'Time', 'y': 'Response Time (s)'},
+        # Alerts Expander
+        if alerts:
+            st.markdown("#### 🔔 Recent Security & Health Alerts")
+            for a in alerts:
+                icon = "🚨" if "DOWN" in a["alert_type"] else "✅" if "UP" in a["alert_type"] else "🔍"
+                st.markdown(f"""
+                <div style="background: rgba(30,41,59,0.5); padding: 12px; border-left: 4px solid #3b82f6; border-radius: 4px; margin-bottom: 8px;">
+                    <span style="color: #64748b; font-size: 0.8rem;">{a['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}</span><br/>
+                    {icon} <strong>{a['alert_type']}</strong>: {html.escape(a['message']).replace(chr(10), '<br/>')}
+                </div>
+                """, unsafe_allow_html=True)
+        else:
+            st.success("No critical alerts recorded for this target.")
+    else:
+        st.info("Awaiting first check data...")
+
+    if Config.ARCHIVE_ENABLED:
+        with st.expander("📦 Long-Term History", expanded=False):
+            span = st.select_slider("Window", options=[30, 90, 180, 365], value=90, format_func=lambda d: f"{d}d",
+                                    key=f"archive_span_{site_select}")
+            history = load_archive_history(site_select, span)
+            if history:
+                checks = sum(day["checks"] for day in history)
+                uptime = sum(day["uptime"] * day["checks"] for day in history) / checks
+                st.metric("Uptime", f"{uptime:.2f}%", help=f"{checks} archived checks over {len(history)} days")
+                fig = px.line(x=[day["day"] for day in history], y=[day["p95"] for day in history],
+                              title="Daily p95 Latency", labels={'x': 'Day', 'y': 'Response Time (s)'},
                               template="plotly_dark")
-                fig.update_traces(line_color='#60a5fa', fillcolor='rgba(96, 165, 250, 0.1)')
                 fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
                                   font_color="#94a3b8", margin=dict(l=0, r=0, t=40, b=0))
                 st.plotly_chart(fig, use_container_width=True)
-                
-                # Alerts Expander
-                alerts = session.query(AlertLog).filter(AlertLog.website_id == selected_site.id).order_by(AlertLog.timestamp.desc()).limit(10).all()
-                if alerts:
-                    st.markdown("#### 🔔 Recent Security & Health Alerts")
-                    for a in alerts:
-                        icon = "🚨" if "DOWN" in a.alert_type else "✅" if "UP" in a.alert_type else "🔍"
-                        st.markdown(f"""
-                        <div style="background: rgba(30,41,59,0.5); padding: 12px; border-left: 4px solid #3b82f6; border-radius: 4px; margin-bottom: 8px;">
-                            <span style="color: #64748b; font-size: 0.8rem;">{a.timestamp.strftime('%Y-%m-%d %H:%M:%S')}</span><br/>
-                            {icon} <strong>{a.alert_type}</strong>: {a.message}
-                        </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.success("No critical alerts recorded for this target.")
             else:
-                st.info("Awaiting first check data...")
+                st.info("No archived days yet. The monitor archives each day once it has closed.")
+
+    # A form, so live refreshes and typing don't rerun anything until the rules are saved
+    with st.expander("🧹 Change Detection Rules", expanded=False):
+        rules = db.get_ignore_rules(site_select)
+        with st.form(f"ignore_rules_{site_select}"):
+            selectors = st.text_area("Ignored elements (one selector per line: tag, .class, #id, [attr=value])",
+                                     value=rules["ignore_selectors"] or "", placeholder=".ad-banner\n#clock\ntime")
+            regexes = st.text_area("Ignored text (one regex per line)", value=rules["ignore_regexes"] or "",
+                                   placeholder="Updated \\d+ minutes ago")
+            if st.form_submit_button("Save Rules"):
+                db.update_website_status(site_select, ignore_selectors=selectors.strip() or None,
+                                         ignore_regexes=regexes.strip() or None)
+                st.success("Saved. Monitors apply it at their next reconcile and re-baseline the page hash.")
+
+    with st.expander("📡 Check Mode", expanded=False):
+        modes = db.get_check_mode(site_select)
+        labels = {"full": "Full content check", "head": "HTTP HEAD", "range": f"GET first {Config.PROBE_RANGE_BYTES} bytes",
+                  "tcp": "TCP connect", "tls": "TLS handshake"}
+        with st.form(f"check_mode_{site_select}"):
+            mode = st.selectbox("Mode", options=list(CHECK_MODES), format_func=labels.get,
+                                index=CHECK_MODES.index(modes["check_mode"] or Config.CHECK_MODE))
+            every = st.number_input("Full content check every N runs (0 = never; probe modes only)", min_value=0,
+                                    value=Config.FULL_CHECK_EVERY if modes["full_check_every"] is None
+                                    else modes["full_check_every"])
+            if st.form_submit_button("Save Mode"):
+                db.update_website_status(site_select, check_mode=mode, full_check_every=int(every))
+                st.success("Saved. Monitors switch modes at their next reconcile.")
+
+with tab_overview:
+    render_overview()
+with tab_details:
+    render_details()
 
 # --- HELP TAB (Telegram Setup) ---
 with tab_help:
@@ -311,7 +398,3 @@ with tab_help:
         else:
             st.error("Failed to send. Double check your Token and Chat ID in `.env`")
 
-# Auto-refresh logic (only if enabled)
-if st.sidebar.checkbox("Real-time Mode (10s Auto-refresh)", value=False):
-    time.sleep(10)
-    st.rerun()
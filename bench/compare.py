@@ -0,0 +1,65 @@
+"""
+Compares two benchmark result files run by run (matched on engine and target count).
+
+    python -m bench.compare bench/results/before.json bench/results/after.json
+"""
+import argparse
+import json
+
+# (label, path into a run, True if higher is better)
+METRICS = [
+    ("checks/s", ("checks_per_sec",), True),
+    ("lag p50 ms", ("scheduling_lag_ms", "p50"), False),
+    ("lag p95 ms", ("scheduling_lag_ms", "p95"), False),
+    ("lag p99 ms", ("scheduling_lag_ms", "p99"), False),
+    ("db rows/s", ("db", "rows_per_sec_while_flushing"), True),
+    ("flush p95 ms", ("db", "flush_ms", "p95"), False),
+    ("cpu ms/check", ("cpu_ms_per_check",), False),
+    ("rss MB", ("rss_mb",), False),
+]
+
+def _get(run: dict, path):
+    for key in path:
+        run = (run or {}).get(key)
+    return run
+
+def _index(report: dict) -> dict:
+    return {(run["engine"], run["targets"]): run for run in report.get("runs", [])}
+
+def compare(before: dict, after: dict, threshold: float = 0.1) -> list:
+    """Rows of (scenario, metric, before, after, change, regressed)."""
+    rows = []
+    old_runs, new_runs = _index(before), _index(after)
+    for key in sorted(set(old_runs) & set(new_runs)):
+        for label, path, higher_is_better in METRICS:
+            old, new = _get(old_runs[key], path), _get(new_runs[key], path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            regressed = change < -threshold if higher_is_better else change > threshold
+            rows.append((f"{key[0]}/{key[1]}", label, old, new, change, regressed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two bench/run_bench.py result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+
+    rows = compare(before, after, args.threshold)
+    print(f"{'scenario':<18}{'metric':<14}{'before':>12}{'after':>12}{'change':>10}")
+    for scenario, label, old, new, change, regressed in rows:
+        flag = "  <-- regression" if regressed else ""
+        print(f"{scenario:<18}{label:<14}{old:>12}{new:>12}{change:>+10.1%}{flag}")
+    regressions = sum(1 for row in rows if row[5])
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    raise SystemExit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
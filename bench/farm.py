@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import multiprocessing
+import random
+
+def build_page(body_kb: int, version: int = 0) -> bytes:
+    """HTML page of roughly `body_kb` KB with a script/style mix like a real site; `version` changes the visible text."""
+    parts = ["<html><head><title>Bench</title><style>p{margin:0}</style>",
+             "<script>var tracking = Date.now();</script></head><body>",
+             f"<h1>Version {version}</h1>"]
+    paragraph = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit &amp; sed do eiusmod tempor.</p>\n"
+    parts.extend([paragraph] * max(1, body_kb * 1024 // len(paragraph)))
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+class FarmSettings:
+    """Behaviour of every fake site in the farm."""
+
+    def __init__(self, latency_ms=50.0, jitter_ms=20.0, status_mix=None, body_kb=20, mutate_rate=0.0, etags=True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.status_mix = status_mix or {200: 1.0}  # status code -> share of responses
+        self.body_kb = body_kb
+        self.mutate_rate = mutate_rate  # chance per request that a site's content changes
+        self.etags = etags
+
+    def pick_status(self) -> int:
+        roll = random.random()
+        for status, share in self.status_mix.items():
+            roll -= share
+            if roll < 0:
+                return status
+        return 200
+
+class _Farm:
+    def __init__(self, settings: FarmSettings):
+        self.settings = settings
+        self.versions = {}  # path -> content version
+        self.pages = {}     # version -> (body, etag)
+
+    def page(self, version: int):
+        page = self.pages.get(version)
+        if page is None:
+            body = build_page(self.settings.body_kb, version)
+            page = self.pages[version] = (body, '"%s"' % hashlib.md5(body).hexdigest()[:16])
+        return page
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                settings = self.settings
+                delay = random.gauss(settings.latency_ms, settings.jitter_ms) if settings.jitter_ms else settings.latency_ms
+                if delay > 0:
+                    await asyncio.sleep(delay / 1000)
+
+                version = self.versions.get(path, 0)
+                if settings.mutate_rate and random.random() < settings.mutate_rate:
+                    version = self.versions[path] = version + 1
+                body, etag = self.page(version)
+                status = settings.pick_status()
+                extra = ""
+                if status == 200 and settings.etags:
+                    extra = f"ETag: {etag}\r\n"
+                    if headers.get("if-none-match") == etag:
+                        status, body = 304, b""
+                if status >= 400:
+                    body = b"<html><body>Error</body></html>"
+                byte_range = headers.get("range", "")
+                if status == 200 and byte_range.startswith("bytes=0-"):
+                    # Only the prefix ranges the probes send
+                    end = min(int(byte_range[8:] or len(body) - 1), len(body) - 1)
+                    extra += f"Content-Range: bytes 0-{end}/{len(body)}\r\n"
+                    status, body = 206, body[:end + 1]
+                if method == "HEAD":
+                    length, body = len(body), b""
+                else:
+                    length = len(body)
+                writer.write((f"HTTP/1.1 {status} Bench\r\nContent-Type: text/html; charset=utf-8\r\n"
+                              f"Content-Length: {length}\r\n{extra}\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    return
+        finally:
+            writer.close()
+
+async def _serve(ports, settings, ready, stop):
+    farm = _Farm(settings)
+    servers = [await asyncio.start_server(farm.handle, "127.0.0.1", port, backlog=1024) for port in ports]
+    ready.set()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, stop.wait)
+    for server in servers:
+        server.close()
+
+def _farm_process(ports, settings, ready, stop):
+    asyncio.run(_serve(ports, settings, ready, stop))
+
+class SiteFarm:
+    """
+    Local fake websites for benchmarks, served by asyncio in separate processes so the farm's CPU
+    doesn't compete with the checker being measured. `hosts` ports are opened (one per fake host,
+    so connection pooling behaves as with distinct sites) and any path on them is a page.
+    """
+
+    def __init__(self, settings: FarmSettings, hosts: int = 16, base_port: int = 18000, processes: int = 2):
+        self.settings = settings
+        self.ports = [base_port + i for i in range(hosts)]
+        self.processes = max(1, min(processes, hosts))
+        self._procs = []
+        self._stop = multiprocessing.Event()
+
+    def url(self, site_number: int) -> str:
+        return f"http://127.0.0.1:{self.ports[site_number % len(self.ports)]}/site/{site_number}"
+
+    def start(self):
+        for index in range(self.processes):
+            ready = multiprocessing.Event()
+            proc = multiprocessing.Process(
+                target=_farm_process, args=(self.ports[index::self.processes], self.settings, ready, self._stop),
+                name=f"bench-farm-{index}", daemon=True,
+            )
+            proc.start()
+            if not ready.wait(10):
+                raise RuntimeError("Bench farm failed to start")
+            self._procs.append(proc)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for proc in self._procs:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
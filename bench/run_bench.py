@@ -0,0 +1,319 @@
+"""
+Offline benchmark for the check pipeline: fake site farm -> checker -> scheduler -> DB writer.
+
+    python -m bench.run_bench --targets 100,1000,10000 --interval 10 --duration 60
+    python -m bench.compare bench/results/old.json bench/results/new.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from config import Config
+from database.db_manager import DBManager
+from database.models import Website
+from alerts.dispatcher import AlertDispatcher
+from alerts.telegram_bot import TelegramBot
+from monitors.checker import SiteChecker
+from monitors.content_diff import StreamingHasher
+from monitors.probes import CHECK_MODES
+from monitors.scheduler import MonitorScheduler, scheduled_slot
+from .farm import FarmSettings, SiteFarm, build_page
+
+def percentiles(values, points=(50, 95, 99)) -> dict:
+    if not values:
+        return dict({f"p{p}": None for p in points}, max=None)
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+    result["max"] = ordered[-1]
+    return result
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def _cpu_seconds(who=resource.RUSAGE_SELF) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+class Probe:
+    """Counts checks, scheduling lag and DB flushes by wrapping the real checker and writer."""
+
+    def __init__(self, checker: SiteChecker):
+        self.lags = []
+        self.checks = 0
+        self.deferred = 0  # threaded engine: runs put off by the per-host limits, retried later
+        self.flush_times = []
+        self.rows_flushed = 0
+        self._lock = threading.Lock()
+        self._wrap_writer(checker.writer)
+
+    def record_check(self, deferred: bool = False):
+        with self._lock:
+            if deferred:
+                self.deferred += 1
+            else:
+                self.checks += 1
+
+    def record_start(self):
+        # Lag = how late the request started relative to the slot it was scheduled for, host waits included.
+        # Checks that joined an identical request in flight never take a host slot and aren't counted here.
+        lag = time.time() - scheduled_slot.get()
+        with self._lock:
+            self.lags.append(lag * 1000)
+
+    def wrap_host_limiter(self, limiter):
+        """Records the start of each request once its host lets it through (threaded limiter)."""
+        acquire = limiter.acquire
+
+        def timed_acquire(url):
+            wait = acquire(url)
+            if not wait:
+                self.record_start()
+            return wait
+        limiter.acquire = timed_acquire
+
+    def wrap_async_host_slots(self, limiter):
+        slot = limiter.slot
+
+        @contextlib.asynccontextmanager
+        async def timed_slot(url):
+            async with slot(url):
+                self.record_start()
+                yield
+        limiter.slot = timed_slot
+
+    def _wrap_writer(self, writer):
+        flush = writer._flush
+
+        def timed_flush(batch, *args, **kwargs):
+            start = time.perf_counter()
+            flush(batch, *args, **kwargs)
+            if batch:
+                self.flush_times.append((time.perf_counter() - start) * 1000)
+                self.rows_flushed += len(batch)
+        writer._flush = timed_flush
+
+def _seed(db: DBManager, farm: SiteFarm, targets: int, interval: int):
+    run = datetime.utcnow().strftime("%H%M%S")
+    rows = [{"name": f"bench-{n}", "url": f"{farm.url(n)}?run={run}", "check_interval": interval, "is_active": True,
+             "is_up": True, "consecutive_failures": 0} for n in range(targets)]
+    with db.get_session() as session:
+        session.bulk_insert_mappings(Website, rows)
+
+def _offline_checker(db: DBManager) -> SiteChecker:
+    # Never talk to the real Telegram API from a benchmark
+    dispatcher = AlertDispatcher(db, TelegramBot(token=None, chat_id=None))
+    return SiteChecker(db, dispatcher=dispatcher)
+
+def _run_threaded(checker, probe, duration, workers):
+    check_site = checker.check_site
+
+    def timed_check(site_id):
+        deferred = check_site(site_id)
+        probe.record_check(bool(deferred))
+        return deferred
+    checker.check_site = timed_check
+    probe.wrap_host_limiter(checker.hosts)
+    scheduler = MonitorScheduler(checker, max_workers=workers)
+    scheduler.start()
+    time.sleep(duration)
+    scheduler.shutdown()
+
+def _run_async(checker, probe, duration, concurrency):
+    from monitors.async_checker import AsyncCheckEngine
+    engine = AsyncCheckEngine(checker, max_concurrency=concurrency)
+    check_site = engine.check_site
+
+    async def timed_check(site):
+        probe.record_check()
+        await check_site(site)
+    engine.check_site = timed_check
+    probe.wrap_async_host_slots(engine.hosts)
+
+    async def bounded():
+        try:
+            await asyncio.wait_for(engine.run(), duration)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(bounded())
+
+def run_scenario(args, farm: SiteFarm, targets: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    db_url = args.db or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    db = DBManager(db_url)
+    if args.db:
+        with db.get_session() as session:
+            # Never benchmark against (or alter) real targets
+            if session.query(Website).filter(~Website.name.like("bench-%")).count():
+                raise SystemExit("[!] --db must point at a database used only for benchmarks")
+            # Earlier runs' sites stay for their history but aren't checked again
+            session.query(Website).update({"is_active": False}, synchronize_session=False)
+    _seed(db, farm, targets, args.interval)
+
+    quiet = io.StringIO() if not args.verbose else None
+    with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+        checker = _offline_checker(db)
+        probe = Probe(checker)
+        cpu_start = _cpu_seconds()
+        wall_start = time.perf_counter()
+        if args.engine == "async":
+            _run_async(checker, probe, args.duration, args.concurrency)
+        else:
+            _run_threaded(checker, probe, args.duration, args.workers)
+        wall = time.perf_counter() - wall_start
+        cpu = _cpu_seconds() - cpu_start
+        rss = _rss_mb()
+        drain_start = time.perf_counter()
+        checker.close()
+        drain = time.perf_counter() - drain_start
+    db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    flush_total = sum(probe.flush_times) / 1000
+    return {
+        "targets": targets,
+        "engine": args.engine,
+        "interval": args.interval,
+        "duration": round(wall, 2),
+        "checks": probe.checks,
+        "deferred_checks": probe.deferred,
+        "checks_per_sec": round(probe.checks / wall, 1),
+        "expected_checks_per_sec": round(targets / args.interval, 1),
+        "scheduling_lag_ms": {k: round(v, 1) if v is not None else None for k, v in percentiles(probe.lags).items()},
+        "db": {
+            "rows": probe.rows_flushed,
+            "flushes": len(probe.flush_times),
+            "rows_per_sec_while_flushing": round(probe.rows_flushed / flush_total, 1) if flush_total else None,
+            "flush_ms": {k: round(v, 1) if v is not None else None for k, v in percentiles(probe.flush_times).items()},
+            "drain_seconds": round(drain, 2),
+        },
+        "cpu_percent": round(cpu / wall * 100, 1),
+        "cpu_ms_per_check": round(cpu * 1000 / probe.checks, 3) if probe.checks else None,
+        "rss_mb": round(rss, 1) if rss else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+def hash_benchmark(sizes_kb=(10, 100, 1000), repeat: int = 5) -> list:
+    """Cost of content normalization + hashing per page, for each hash mode."""
+    results = []
+    for size in sizes_kb:
+        body = build_page(size)
+        for mode in ("stream", "soup"):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                hasher = StreamingHasher("utf-8", max_bytes=0, mode=mode)
+                for offset in range(0, len(body), 64 * 1024):
+                    hasher.update(body[offset:offset + 64 * 1024])
+                hasher.hexdigest()
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results.append({"body_kb": size, "mode": mode, "ms_per_page": round(best * 1000, 2),
+                            "mb_per_sec": round(len(body) / best / 2**20, 1)})
+    return results
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def parse_status_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        status, share = part.split(":")
+        mix[int(status)] = float(share)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the check pipeline against a local fake-site farm")
+    parser.add_argument("--targets", default="100,1000", help="comma-separated site counts, one run each")
+    parser.add_argument("--engine", choices=["threaded", "async"], default=Config.ENGINE_MODE)
+    parser.add_argument("--interval", type=int, default=10, help="check interval of every site, seconds")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run")
+    parser.add_argument("--workers", type=int, default=Config.SCHEDULER_WORKERS, help="threaded engine pool size")
+    parser.add_argument("--concurrency", type=int, default=Config.MAX_CONCURRENT_CHECKS, help="async engine requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--status-mix", default="200:0.97,500:0.02,404:0.01", help="status:share,...")
+    parser.add_argument("--body-kb", type=int, default=20)
+    parser.add_argument("--mutate-rate", type=float, default=0.01, help="chance a response has changed content")
+    parser.add_argument("--no-etags", action="store_true", help="don't send ETags, so every check downloads the body")
+    # The farm's few ports stand in for many real hosts, so per-host limits are off unless asked for
+    parser.add_argument("--host-concurrency", type=int, default=0, help="checks in flight per farm host (0 = unlimited)")
+    parser.add_argument("--host-rate", type=float, default=0, help="request starts per second per farm host (0 = unlimited)")
+    parser.add_argument("--check-mode", choices=CHECK_MODES, default="full", help="check mode of every site")
+    parser.add_argument("--full-every", type=int, default=0, help="probe modes: full content check every Nth run")
+    parser.add_argument("--hosts", type=int, default=16, help="distinct fake hosts (ports)")
+    parser.add_argument("--farm-processes", type=int, default=2)
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--db", help="database URL (default: a fresh SQLite file per run)")
+    parser.add_argument("--skip-hash", action="store_true", help="skip the content hashing micro-benchmark")
+    parser.add_argument("--out", help="JSON output path (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--verbose", action="store_true", help="keep the checker's console output")
+    args = parser.parse_args()
+
+    # Check slots exactly on time, so lag measures the engine rather than deliberate jitter
+    Config.SCHEDULE_JITTER = 0
+    Config.CHECK_MODE, Config.FULL_CHECK_EVERY = args.check_mode, args.full_every
+    Config.HOST_MAX_CONCURRENCY, Config.HOST_RATE = args.host_concurrency, args.host_rate
+
+    settings = FarmSettings(args.latency_ms, args.jitter_ms, parse_status_mix(args.status_mix), args.body_kb,
+                            args.mutate_rate, etags=not args.no_etags)
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+    farm = SiteFarm(settings, hosts=args.hosts, base_port=args.base_port, processes=args.farm_processes).start()
+    try:
+        for targets in [int(count) for count in args.targets.split(",")]:
+            print(f"[*] {targets} targets, {args.engine} engine, {args.duration:.0f}s...")
+            result = run_scenario(args, farm, targets)
+            report["runs"].append(result)
+            print(f"[+] {result['checks_per_sec']}/s of {result['expected_checks_per_sec']}/s expected, "
+                  f"lag p95 {result['scheduling_lag_ms']['p95']} ms, CPU {result['cpu_percent']}%, "
+                  f"RSS {result['rss_mb']} MB")
+    finally:
+        farm.stop()
+    # Farm processes have exited, so their CPU shows up in the children's usage now
+    report["meta"]["farm_cpu_seconds"] = round(_cpu_seconds(resource.RUSAGE_CHILDREN), 2)
+
+    if not args.skip_hash:
+        report["hash"] = hash_benchmark()
+        for row in report["hash"]:
+            print(f"[+] hash {row['mode']:6} {row['body_kb']:>5} KB: {row['ms_per_page']} ms/page")
+
+    out = args.out or os.path.join("bench", "results", datetime.utcnow().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"[+] Results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -42,21 +42,10 @@ def bulk_add():
     ]
     
     print(f"Starting bulk add of {len(sites)} websites...")
-    added_count = 0
-    error_count = 0
-    
-    for name, url in sites:
-        try:
-            # Using default interval of 60s for all
-            db.add_website(name, url, 60)
-            print(f" [+] Added: {name}")
-            added_count += 1
-        except Exception as e:
-            # Likely unique constraint if already exists
-            print(f" [!] Skip/Error {name}: {e}")
-            error_count += 1
-            
-    print(f"\nFinished. Added: {added_count}, Skipped/Errors: {error_count}")
+    # Using default interval of 60s for all; URLs already tracked are skipped
+    result = db.bulk_upsert_websites(sites, interval=60)
+
+    print(f"\nFinished. Added: {result['inserted']}, Skipped: {result['skipped']}")
     print("Note: Restart the background monitor to start tracking new sites.")
 
 if __name__ == "__main__":
@@ -3,9 +3,29 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Check modes (described in monitors.probes, which imports this module)
+CHECK_MODES = ("full", "head", "range", "tcp", "tls")
+
+def _check_mode(value: str) -> str:
+    """Normalised CHECK_MODE; an unknown mode fails at startup instead of in every check."""
+    mode = value.strip().lower()
+    if mode not in CHECK_MODES:
+        raise ValueError(f"CHECK_MODE must be one of {', '.join(CHECK_MODES)}, not {value!r}")
+    return mode
+
 class Config:
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./monitor.db")
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")      # WAL: readers don't block the writer
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")     # NORMAL is crash-safe with WAL
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)) # bytes of the file read via mmap
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))  # wait this long for a lock before failing
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))          # PostgreSQL: connections kept open
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))    # PostgreSQL: extra connections under bursts
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))    # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds before a connection is replaced
+    PG_COPY = os.getenv("PG_COPY", "true").lower() == "true"   # PostgreSQL: COPY check results in bulk
+    PG_COPY_MIN_ROWS = int(os.getenv("PG_COPY_MIN_ROWS", 50))  # smaller batches use plain INSERTs
     
     # Telegram
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -14,10 +34,101 @@ class Config:
     # Monitoring Defaults
     DEFAULT_INTERVAL = 60  # seconds
     REQUEST_TIMEOUT = 10   # seconds
+
+    # Check Engine
+    ENGINE_MODE = os.getenv("ENGINE_MODE", "threaded")  # threaded | async
+    MAX_CONCURRENT_CHECKS = int(os.getenv("MAX_CONCURRENT_CHECKS", 500)) # async engine: requests in flight
+
+    # Probe modes: cheap uptime-only checks between full content checks
+    CHECK_MODE = _check_mode(os.getenv("CHECK_MODE") or "full")   # default for sites without one: full | head | range | tcp | tls
+    FULL_CHECK_EVERY = int(os.getenv("FULL_CHECK_EVERY", 0))      # probe sites: every Nth run is a full check (0 = never)
+    PROBE_RANGE_BYTES = int(os.getenv("PROBE_RANGE_BYTES", 1024)) # bytes requested by "range" probes
+
+    # Per-host politeness: limits shared by every target on the same host:port
+    HOST_MAX_CONCURRENCY = int(os.getenv("HOST_MAX_CONCURRENCY", 4))  # checks in flight per host (0 = unlimited)
+    HOST_RATE = float(os.getenv("HOST_RATE", 5.0))                    # request starts per second per host (0 = unlimited)
+    HOST_RETRY_AFTER_MAX = int(os.getenv("HOST_RETRY_AFTER_MAX", 300)) # longest pause a 429/503 Retry-After puts on a host, seconds
+    COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true" # identical checks in flight share one request
+
+    # Scheduler
+    SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 20))   # threaded engine: checks in flight
+    SCHEDULE_JITTER = float(os.getenv("SCHEDULE_JITTER", 2.0))     # max random delay added to each run, seconds
+    RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", 60))  # seconds between DB-vs-scheduler diffs
+
+    # Adaptive intervals: check changing/failing sites more often, stable ones less
+    ADAPTIVE_INTERVALS = os.getenv("ADAPTIVE_INTERVALS", "false").lower() == "true"
+    ADAPTIVE_RANGE = float(os.getenv("ADAPTIVE_RANGE", 4.0))          # default bounds: check_interval / N .. * N
+    ADAPTIVE_MIN_INTERVAL = int(os.getenv("ADAPTIVE_MIN_INTERVAL", 15)) # default lower bound never goes below this, seconds
+    ADAPTIVE_TIGHTEN = float(os.getenv("ADAPTIVE_TIGHTEN", 0.5))       # interval factor after a content change
+    ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", 1.25))      # interval factor after an unchanged check
+
+    # Sharding: split sites across several checker processes sharing one database
+    SHARDING = os.getenv("SHARDING", "false").lower() == "true"
+    SHARD_HEARTBEAT = int(os.getenv("SHARD_HEARTBEAT", 10))   # seconds between lease renewals
+    SHARD_LEASE_TTL = int(os.getenv("SHARD_LEASE_TTL", 30))   # a worker silent this long is considered dead
+    SHARD_VNODES = int(os.getenv("SHARD_VNODES", 128))        # hash ring points per worker
+
+    # Dashboard
+    DASHBOARD_ONLY = os.getenv("DASHBOARD_ONLY", "false").lower() == "true" # app.py only reads; checks run in main.py
+    DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", 10))         # seconds a status snapshot is shared between viewers
+    DASHBOARD_POLL_SECONDS = float(os.getenv("DASHBOARD_POLL_SECONDS", 2.0)) # real-time mode: how often the change feed is read
+    DASHBOARD_SNAPSHOT_REFRESH = int(os.getenv("DASHBOARD_SNAPSHOT_REFRESH", 300)) # seconds between full reloads (uptime, new sites)
+    STATUS_EVENTS = os.getenv("STATUS_EVENTS", "true").lower() == "true"   # engine appends check results to status_events
+    STATUS_EVENT_RETENTION = int(os.getenv("STATUS_EVENT_RETENTION", 3600)) # seconds events are kept
+
+    # Metrics
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))       # main.py serves /metrics here (0 = off)
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+    # HTTP Connection Pool
+    HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 256))     # hosts kept warm in the shared pool
+    HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", 4)) # idle keep-alive connections per host
+    DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", 300))         # seconds
+    RECORD_TIMINGS = os.getenv("RECORD_TIMINGS", "false").lower() == "true" # store connect/TLS/first-byte times in CheckLog
+
+    # Write-behind DB writer
+    WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 500))   # results per transaction
+    WRITE_FLUSH_MS = int(os.getenv("WRITE_FLUSH_MS", 500))        # max delay before a partial batch is written
+    WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", 10000))  # queued results before checks block
+
+    # Retention
+    RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", 7))          # raw check_logs kept; older rows live on as rollups
+    RETENTION_MINUTE_DAYS = int(os.getenv("RETENTION_MINUTE_DAYS", 2))    # minute rollups kept
+    RETENTION_HOUR_DAYS = int(os.getenv("RETENTION_HOUR_DAYS", 90))       # hour rollups kept (day rollups are kept forever)
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 2000))   # rows per delete transaction
+    RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 3600))       # seconds between retention runs
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true" # keep raw history as columnar files
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")                   # one subdirectory per archived UTC day
+    ARCHIVE_CLOSE_DELAY = int(os.getenv("ARCHIVE_CLOSE_DELAY", 3600))     # seconds after midnight before a day is archived
+
+    # Latency sketches: rolling 1h/24h/7d percentiles per site, kept in memory and checkpointed to the DB
+    LATENCY_SKETCHES = os.getenv("LATENCY_SKETCHES", "true").lower() == "true"
+    SKETCH_ACCURACY = float(os.getenv("SKETCH_ACCURACY", 0.01))                 # max relative error of a reported percentile
+    SKETCH_CHECKPOINT_INTERVAL = int(os.getenv("SKETCH_CHECKPOINT_INTERVAL", 60)) # seconds between DB checkpoints
     
     # OSINT / Content Change
     USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) WebsiteMonitor/1.0"
+    CONTENT_HASH_MODE = os.getenv("CONTENT_HASH_MODE", "stream")  # stream | soup (BeautifulSoup, legacy)
+    MAX_CONTENT_BYTES = int(os.getenv("MAX_CONTENT_BYTES", 5 * 1024 * 1024))  # body bytes hashed per check, 0 = no cap
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", 0))  # processes for parsing/hashing, 0 = hash in the checking thread
+    HASH_WORKER_RECYCLE = int(os.getenv("HASH_WORKER_RECYCLE", 1000))  # tasks before the pool is replaced
+    HASH_OFFLOAD_MIN_BYTES = int(os.getenv("HASH_OFFLOAD_MIN_BYTES", 64 * 1024))  # smaller bodies are hashed inline
+    CONTENT_IGNORE_SELECTORS = os.getenv("CONTENT_IGNORE_SELECTORS", "")  # comma-separated, e.g. ".ad,#clock,time" (all sites)
+    CONTENT_IGNORE_REGEX = os.getenv("CONTENT_IGNORE_REGEX", "")          # text removed before hashing (all sites)
+    CONTENT_SNAPSHOTS = os.getenv("CONTENT_SNAPSHOTS", "false").lower() == "true" # store page text; change alerts show a diff
+    SNAPSHOT_MAX_CHAIN = int(os.getenv("SNAPSHOT_MAX_CHAIN", 10))          # deltas before a full copy is stored again
+    SNAPSHOT_DIFF_MAX_LINES = int(os.getenv("SNAPSHOT_DIFF_MAX_LINES", 2000)) # larger changed regions aren't line-matched
     
     # Alerting Thresholds
     CONSECUTIVE_FAILURES_THRESHOLD = int(os.getenv("FAILURE_THRESHOLD", 3))
     RESPONSE_TIME_THRESHOLD = float(os.getenv("MAX_RESPONSE_TIME", 5.0)) # seconds
+
+    # Alert Dispatch
+    ALERT_COOLDOWN = int(os.getenv("ALERT_COOLDOWN", 600))  # seconds before the same alert type is re-sent for a site
+    ALERT_COOLDOWN_STORE = os.getenv("ALERT_COOLDOWN_STORE", "db")  # db (shared, survives restarts) | memory
+    ALERT_COOLDOWN_MAX_KEYS = int(os.getenv("ALERT_COOLDOWN_MAX_KEYS", 100000))  # in-memory entries kept
+    ALERT_COALESCE_SECONDS = float(os.getenv("ALERT_COALESCE_SECONDS", 3.0)) # alerts to one chat within this window go out as one message
+    ALERT_CHAT_RATE = float(os.getenv("ALERT_CHAT_RATE", 1.0))     # messages/s per chat (Telegram allows ~1)
+    ALERT_GLOBAL_RATE = float(os.getenv("ALERT_GLOBAL_RATE", 25.0)) # messages/s across all chats (Telegram allows ~30)
+    ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", 8))    # deliveries tried before a message is marked failed
+    ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", 1.0)) # seconds between outbox scans
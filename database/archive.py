@@ -0,0 +1,206 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+import numpy as np
+from sqlalchemy import func, select
+from .models import CheckLog
+from config import Config
+
+# Fixed-width column types; content_hash and error_message are stored as int32 codes into a per-partition dictionary
+COLUMNS = {
+    "website_id": np.int32,
+    "timestamp": "datetime64[us]",
+    "status_code": np.int16,
+    "response_time": np.float32,
+    "is_up": np.bool_,
+    "content_hash": np.int32,
+    "error_message": np.int32,
+    "connect_time": np.float32,
+    "tls_time": np.float32,
+    "first_byte_time": np.float32,
+}
+DICTIONARY_COLUMNS = ("content_hash", "error_message")
+FORMAT_VERSION = 1
+
+class CheckArchive:
+    """
+    Append-only columnar archive of raw check history (Config.ARCHIVE_ENABLED).
+    Each closed UTC day becomes one directory of .npy files, one per column, sorted by
+    (website_id, timestamp). Hashes and error messages are dictionary-encoded, and NULLs become
+    -1 codes, NaN floats or status 0, for under 40 bytes per check instead of a few hundred in
+    check_logs.
+    Reads memory-map the files, so a scan only touches the columns (and, with a single site,
+    the row range) it needs, and repeated scans come from the page cache.
+    Partitions are written to a temporary directory and renamed into place; a day is never
+    rewritten once it exists.
+    """
+
+    def __init__(self, root: str = Config.ARCHIVE_DIR):
+        self.root = root
+
+    # --- Writing ---
+
+    def archive_closed_days(self, db_manager, now: datetime = None, close_delay=Config.ARCHIVE_CLOSE_DELAY) -> int:
+        """
+        Archives every day with check_logs that ended at least `close_delay` seconds ago and isn't archived yet.
+        Returns the number of rows written. Runs before retention deletes raw rows, so nothing is lost.
+        """
+        now = now or datetime.utcnow()
+        last_day = (now - timedelta(seconds=close_delay)).date() - timedelta(days=1)
+        with db_manager.get_session() as session:
+            first = session.query(func.min(CheckLog.timestamp)).scalar()
+        if first is None:
+            return 0
+        total = 0
+        day = first.date()
+        while day <= last_day:
+            if not self.has(day):
+                total += self.write_day(db_manager, day)
+            day += timedelta(days=1)
+        return total
+
+    def write_day(self, db_manager, day: date, chunk_size: int = 100000) -> int:
+        start = datetime.combine(day, time())
+        columns = {name: [] for name in COLUMNS}
+        dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+        statement = select(*(getattr(CheckLog, name) for name in COLUMNS)).where(
+            CheckLog.timestamp >= start, CheckLog.timestamp < start + timedelta(days=1)
+        ).execution_options(yield_per=chunk_size)
+        with db_manager.get_session() as session:
+            for rows in session.execute(statement).partitions():
+                for name, values in zip(COLUMNS, zip(*rows)):
+                    columns[name].append(self._encode(name, values, dictionaries))
+        count = sum(len(chunk) for chunk in columns["website_id"])
+        if not count:
+            return 0
+        arrays = {name: np.concatenate(chunks) for name, chunks in columns.items()}
+        order = np.lexsort((arrays["timestamp"], arrays["website_id"]))
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{day.isoformat()}-", dir=self.root)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f"{name}.npy"), array[order])
+            for name, codes in dictionaries.items():
+                with open(os.path.join(staging, f"{name}.dict.json"), "w", encoding="utf-8") as handle:
+                    json.dump(list(codes), handle)
+            with open(os.path.join(staging, "meta.json"), "w") as handle:
+                json.dump({"day": day.isoformat(), "rows": count, "version": FORMAT_VERSION,
+                           "written_at": datetime.utcnow().isoformat()}, handle)
+            os.rename(staging, self._path(day))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if self.has(day):
+                return 0  # another worker archived the day first
+            raise
+        return count
+
+    @staticmethod
+    def _encode(name, values, dictionaries) -> np.ndarray:
+        if name in dictionaries:
+            codes = dictionaries[name]
+            return np.fromiter((-1 if value is None else codes.setdefault(value, len(codes)) for value in values),
+                               dtype=np.int32, count=len(values))
+        if name == "timestamp":
+            return np.array(values, dtype=COLUMNS[name])
+        if name == "status_code":
+            return np.fromiter((value or 0 for value in values), dtype=np.int16, count=len(values))
+        if name == "is_up":
+            return np.fromiter((bool(value) for value in values), dtype=np.bool_, count=len(values))
+        # None -> NaN for the float columns
+        return np.array(values, dtype=np.float64).astype(COLUMNS[name])
+
+    # --- Reading ---
+
+    def days(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for entry in os.listdir(self.root):
+            try:
+                found.append(date.fromisoformat(entry))
+            except ValueError:
+                continue  # staging directories and stray files
+        return sorted(found)
+
+    def has(self, day: date) -> bool:
+        return os.path.isdir(self._path(day))
+
+    def load_day(self, day: date, columns=None) -> dict:
+        """Memory-mapped columns of one partition (dictionary columns as int32 codes)."""
+        path = self._path(day)
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in columns or COLUMNS}
+
+    def dictionary(self, day: date, name: str) -> list:
+        with open(os.path.join(self._path(day), f"{name}.dict.json"), encoding="utf-8") as handle:
+            return json.load(handle)
+
+    def scan(self, start: datetime = None, end: datetime = None, website_id: int = None,
+             columns=("website_id", "timestamp", "is_up", "response_time"), decode: bool = False) -> dict:
+        """
+        Column arrays for archived checks in [start, end), optionally for one site, concatenated over days.
+        Dictionary columns are int32 codes unless `decode`, which maps them back to Python objects.
+        """
+        columns = list(columns)
+        needed = list(dict.fromkeys(columns + ["timestamp"] + (["website_id"] if website_id is not None else [])))
+        parts = {name: [] for name in columns}
+        for day in self.days():
+            if start is not None and day < start.date() or end is not None and day > end.date():
+                continue
+            data = self.load_day(day, needed)
+            rows = slice(None)
+            if website_id is not None:
+                # Sorted by site, so one site is a contiguous row range found by binary search
+                ids = data["website_id"]
+                rows = slice(np.searchsorted(ids, website_id, "left"), np.searchsorted(ids, website_id, "right"))
+            mask = None
+            stamps = data["timestamp"][rows]
+            if start is not None and day == start.date():
+                mask = stamps >= np.datetime64(start, "us")
+            if end is not None and day == end.date():
+                before_end = stamps < np.datetime64(end, "us")
+                mask = before_end if mask is None else mask & before_end
+            for name in columns:
+                values = data[name][rows]
+                if mask is not None:
+                    values = values[mask]
+                if decode and name in DICTIONARY_COLUMNS:
+                    lookup = np.array(self.dictionary(day, name) + [None], dtype=object)
+                    values = lookup[values]  # code -1 picks the trailing None
+                parts[name].append(values)
+        return {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=object if decode and name in DICTIONARY_COLUMNS
+                                                                   else COLUMNS[name])
+                for name, chunks in parts.items()}
+
+    def to_frame(self, start: datetime = None, end: datetime = None, website_id: int = None, columns=tuple(COLUMNS)):
+        """pandas DataFrame of archived checks, with hashes and errors decoded back to strings."""
+        import pandas as pd
+        return pd.DataFrame(self.scan(start, end, website_id, columns, decode=True))
+
+    def daily_summary(self, website_id: int, start: date = None, end: date = None) -> list:
+        """Per-day (day, checks, uptime %, avg and p95 latency of successful checks) for one site, days in [start, end]."""
+        summary = []
+        for day in self.days():
+            if start is not None and day < start or end is not None and day > end:
+                continue
+            data = self.load_day(day, ("website_id", "is_up", "response_time"))
+            ids = data["website_id"]
+            rows = slice(np.searchsorted(ids, website_id, "left"), np.searchsorted(ids, website_id, "right"))
+            is_up = data["is_up"][rows]
+            if not len(is_up):
+                continue
+            latencies = data["response_time"][rows][is_up]
+            latencies = latencies[~np.isnan(latencies)]
+            summary.append({
+                "day": day,
+                "checks": len(is_up),
+                "uptime": round(float(is_up.mean()) * 100, 2),
+                "avg": float(latencies.mean()) if len(latencies) else None,
+                "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            })
+        return summary
+
+    def _path(self, day: date) -> str:
+        return os.path.join(self.root, day.isoformat())
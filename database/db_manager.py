@@ -1,14 +1,57 @@
-from sqlalchemy import create_engine
+from datetime import datetime
+from itertools import islice
+from urllib.parse import urlparse
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, Session
-from .models import Base, Website, CheckLog, AlertLog
+from .models import Base, Website, CheckLog, AlertLog, CheckRollup, MonitorMeta, StatusEvent, LatencySketchSlot
+from .rollups import histogram_quantile, parse_histogram, window_start
+from .sketches import SketchMapping, window_quantiles
+from .storage import build_engine
+from monitors.probes import CHECK_MODES
 from config import Config
 from contextlib import contextmanager
 
 class DBManager:
     def __init__(self, db_url=Config.DATABASE_URL):
-        self.engine = create_engine(db_url, connect_args={"check_same_thread": False} if "sqlite" in db_url else {})
+        self.engine = build_engine(db_url)
         Base.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self._create_missing_indexes()
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._init_meta()
+
+    def _add_missing_columns(self):
+        """create_all() never alters existing tables, so add nullable columns introduced since the DB was created."""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {col["name"] for col in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        col_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+
+    def _create_missing_indexes(self):
+        """Same for indexes: create_all() skips tables that already exist, so their new indexes are added here."""
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+
+    def _init_meta(self):
+        # Rollups only cover checks written after this point; older CheckLog rows are not aggregated
+        with self.get_session() as session:
+            if session.get(MonitorMeta, "rollups_since") is None:
+                session.add(MonitorMeta(key="rollups_since", value=datetime.utcnow().isoformat()))
+
+    def get_meta(self, key: str, default: str = None) -> str:
+        with self.get_session() as session:
+            meta = session.get(MonitorMeta, key)
+            return meta.value if meta else default
+
+    def set_meta(self, key: str, value: str):
+        with self.get_session() as session:
+            session.merge(MonitorMeta(key=key, value=value))
 
     @contextmanager
     def get_session(self) -> Session:
@@ -45,6 +88,112 @@ class DBManager:
         finally:
             session.close()
 
+    def bulk_upsert_websites(self, sites, interval: int = 60, update_existing: bool = False,
+                             batch_size: int = 500) -> dict:
+        """
+        Adds many sites with one INSERT ... ON CONFLICT (url) per batch instead of a round trip per site.
+        `sites` may be a generator of dicts (name, url, check_interval/interval, is_active, the adaptive
+        scheduling bounds min_interval/max_interval, the change-detection rules ignore_selectors/
+        ignore_regexes, as newline-separated text or lists, and check_mode/full_check_every) or
+        (name, url[, interval]) tuples, so large imports stream. Existing URLs are left alone unless
+        `update_existing`, in which case a changed name, interval, bounds, rules, mode or is_active is written back.
+        Returns {"inserted", "updated", "skipped"} counts.
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        sites = iter(sites)
+        while True:
+            batch = list(islice(sites, batch_size))
+            if not batch:
+                return counts
+            rows = {}
+            for site in batch:
+                row = self._website_row(site, interval)
+                if row is None or row["url"] in rows:
+                    counts["skipped"] += 1  # no URL, bad interval, or repeated within the batch
+                else:
+                    rows[row["url"]] = row
+            with self.get_session() as session:
+                self._upsert_batch(session, rows, update_existing, counts)
+
+    @staticmethod
+    def _website_row(site, interval: int):
+        if isinstance(site, dict):
+            name, url = site.get("name"), site.get("url")
+            check_interval = site.get("check_interval") or site.get("interval") or interval
+            is_active = site.get("is_active", True)
+            bounds = (site.get("min_interval"), site.get("max_interval"))
+            rules = [site.get("ignore_selectors"), site.get("ignore_regexes")]
+            check_mode, full_check_every = site.get("check_mode"), site.get("full_check_every")
+        else:
+            name, url = site[0], site[1]
+            check_interval = site[2] if len(site) > 2 and site[2] else interval
+            is_active = True
+            bounds = (None, None)
+            rules = [None, None]
+            check_mode, full_check_every = None, None
+        for index, value in enumerate(rules):
+            if isinstance(value, (list, tuple)):
+                value = "\n".join(value)
+            rules[index] = value.strip() if isinstance(value, str) and value.strip() else None
+        url = (url or "").strip()
+        try:
+            check_interval = int(check_interval)
+            min_interval, max_interval = (int(bound) if bound not in (None, "") else None for bound in bounds)
+            full_check_every = int(full_check_every) if full_check_every not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+        check_mode = (check_mode or "").strip().lower() or None
+        if not url or check_interval <= 0 or check_mode not in (None,) + CHECK_MODES or (full_check_every or 0) < 0:
+            return None
+        if isinstance(is_active, str):
+            is_active = is_active.strip().lower() not in ("0", "false", "no", "")
+        return {"name": (name or "").strip() or urlparse(url).netloc or url, "url": url,
+                "check_interval": check_interval, "is_active": bool(is_active),
+                "min_interval": min_interval, "max_interval": max_interval,
+                "ignore_selectors": rules[0], "ignore_regexes": rules[1],
+                "check_mode": check_mode, "full_check_every": full_check_every}
+
+    def _upsert_batch(self, session, rows: dict, update_existing: bool, counts: dict):
+        existing = {
+            row.url: row for row in session.query(
+                Website.id, Website.url, Website.name, Website.check_interval, Website.is_active,
+                Website.min_interval, Website.max_interval, Website.ignore_selectors, Website.ignore_regexes,
+                Website.check_mode, Website.full_check_every
+            ).filter(Website.url.in_(list(rows)))
+        }
+        fields = ("name", "check_interval", "is_active", "min_interval", "max_interval",
+                  "ignore_selectors", "ignore_regexes", "check_mode", "full_check_every")
+        new = [row for url, row in rows.items() if url not in existing]
+        changed = []
+        if update_existing:
+            changed = [row for url, row in rows.items() if url in existing and
+                       tuple(getattr(existing[url], field) for field in fields) != tuple(row[field] for field in fields)]
+        counts["skipped"] += len(rows) - len(new) - len(changed)
+
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            # Core executemany rather than .values(rows): the statement compiles once and is cached
+            connection = session.connection()
+            if new:
+                # DO NOTHING also covers URLs another process inserted since the SELECT above
+                result = connection.execute(insert(Website).on_conflict_do_nothing(index_elements=["url"]), new)
+                inserted = result.rowcount if result.rowcount >= 0 else len(new)
+                counts["inserted"] += inserted
+                counts["skipped"] += len(new) - inserted
+            if changed:
+                statement = insert(Website)
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=["url"], set_={field: statement.excluded[field] for field in fields}
+                ), changed)
+                counts["updated"] += len(changed)
+        else:
+            # No portable upsert elsewhere; the SELECT above already split new from existing rows
+            session.bulk_insert_mappings(Website, [dict(row, is_up=True, consecutive_failures=0) for row in new])
+            session.bulk_update_mappings(Website, [dict(row, id=existing[row["url"]].id) for row in changed])
+            counts["inserted"] += len(new)
+            counts["updated"] += len(changed)
+
     def get_all_websites(self):
         with self.get_session() as session:
             sites = session.query(Website).all()
@@ -72,3 +221,98 @@ class DBManager:
             alert = AlertLog(website_id=website_id, alert_type=alert_type, message=message)
             session.add(alert)
             return alert
+
+    def get_uptime_percentages(self, days: int = 7) -> dict:
+        """Uptime % per website id over the last `days` days, from the daily rollups in a single query."""
+        uptime = self._uptime_subquery(days)
+        with self.get_session() as session:
+            rows = session.query(uptime.c.website_id, uptime.c.up_count, uptime.c.check_count).all()
+        return {website_id: (up / total) * 100 for website_id, up, total in rows if total}
+
+    def get_status_snapshot(self, days: int = 7) -> list:
+        """
+        Dashboard read model: every site's current state (kept up to date on the websites row by the
+        DB writer) joined with its uptime from the daily rollups, in one query. Returns plain dicts
+        so the result can be cached and shared between dashboard sessions.
+        """
+        uptime = self._uptime_subquery(days)
+        with self.get_session() as session:
+            rows = session.query(
+                Website.id, Website.name, Website.url, Website.check_interval, Website.is_active, Website.is_up,
+                Website.last_status_code, Website.last_response_time, Website.last_check_at,
+                uptime.c.up_count, uptime.c.check_count,
+            ).outerjoin(uptime, uptime.c.website_id == Website.id).order_by(Website.id).all()
+        snapshot = []
+        for row in rows:
+            site = row._asdict()
+            up, total = site.pop("up_count"), site.pop("check_count")
+            site["uptime"] = (up / total) * 100 if total else None
+            snapshot.append(site)
+        return snapshot
+
+    def get_status_events(self, after_id: int = 0, limit: int = 5000) -> list:
+        """Change-feed rows newer than `after_id`, oldest first, as plain dicts."""
+        with self.get_session() as session:
+            rows = session.query(
+                StatusEvent.id, StatusEvent.website_id, StatusEvent.timestamp, StatusEvent.kind,
+                StatusEvent.is_up, StatusEvent.status_code, StatusEvent.response_time,
+            ).filter(StatusEvent.id > after_id).order_by(StatusEvent.id).limit(limit).all()
+            return [row._asdict() for row in rows]
+
+    def get_last_status_event_id(self) -> int:
+        with self.get_session() as session:
+            return session.query(func.max(StatusEvent.id)).scalar() or 0
+
+    def get_ignore_rules(self, website_id: int) -> dict:
+        with self.get_session() as session:
+            row = session.query(Website.ignore_selectors, Website.ignore_regexes).filter(
+                Website.id == website_id).first()
+            return row._asdict() if row else {"ignore_selectors": None, "ignore_regexes": None}
+
+    def get_latency_quantiles(self, website_id: int) -> dict:
+        """
+        Rolling latency percentiles from the monitor's checkpointed sketches, without touching check_logs:
+        {"1h": {"count", "p50", "p95", "p99"}, "24h": ..., "7d": ...}, seconds, None while a window is empty.
+        """
+        with self.get_session() as session:
+            rows = session.query(
+                LatencySketchSlot.window_name, LatencySketchSlot.slot_start, LatencySketchSlot.buckets
+            ).filter(LatencySketchSlot.website_id == website_id).all()
+        return window_quantiles(SketchMapping(), rows)
+
+    def get_check_mode(self, website_id: int) -> dict:
+        with self.get_session() as session:
+            row = session.query(Website.check_mode, Website.full_check_every).filter(
+                Website.id == website_id).first()
+            return row._asdict() if row else {"check_mode": None, "full_check_every": None}
+
+    def get_recent_alerts(self, website_id: int, limit: int = 10) -> list:
+        with self.get_session() as session:
+            rows = session.query(AlertLog.timestamp, AlertLog.alert_type, AlertLog.message).filter(
+                AlertLog.website_id == website_id
+            ).order_by(AlertLog.timestamp.desc()).limit(limit).all()
+            return [row._asdict() for row in rows]
+
+    @staticmethod
+    def _uptime_subquery(days: int):
+        return select(
+            CheckRollup.website_id,
+            func.sum(CheckRollup.up_count).label("up_count"),
+            func.sum(CheckRollup.check_count).label("check_count"),
+        ).where(
+            CheckRollup.granularity == "day", CheckRollup.bucket_start >= window_start(days)
+        ).group_by(CheckRollup.website_id).subquery()
+
+    def get_latency_rollups(self, website_id: int, granularity: str = "minute", limit: int = 50):
+        """Most recent `limit` rollup buckets for a site, oldest first, as (bucket_start, avg, p95) tuples."""
+        with self.get_session() as session:
+            rows = session.query(CheckRollup).filter(
+                CheckRollup.website_id == website_id, CheckRollup.granularity == granularity
+            ).order_by(CheckRollup.bucket_start.desc()).limit(limit).all()
+            points = []
+            for row in reversed(rows):
+                if not row.up_count:
+                    continue
+                p95 = histogram_quantile(parse_histogram(row.latency_histogram), 0.95, row.latency_min, row.latency_max)
+                points.append((row.bucket_start, row.latency_sum / row.up_count, p95))
+            return points
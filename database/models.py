@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -11,6 +11,19 @@ class Website(Base):
     name = Column(String(100), nullable=False)
     url = Column(String(500), nullable=False, unique=True)
     check_interval = Column(Integer, default=60) # in seconds
+    # Adaptive scheduling (Config.ADAPTIVE_INTERVALS): optional per-site bounds and the interval in use
+    min_interval = Column(Integer)
+    max_interval = Column(Integer)
+    effective_interval = Column(Integer)
+
+    # Change detection filters (newline-separated): simple CSS selectors and regexes left out of the hash
+    ignore_selectors = Column(Text)
+    ignore_regexes = Column(Text)
+
+    # Check mode (monitors.probes.CHECK_MODES; NULL = Config.CHECK_MODE) and, for probe modes, a full
+    # content check every Nth run (NULL = Config.FULL_CHECK_EVERY, 0 = never)
+    check_mode = Column(String(10))
+    full_check_every = Column(Integer)
     is_active = Column(Boolean, default=True)
     
     # Monitoring State
@@ -20,6 +33,10 @@ class Website(Base):
     last_check_at = Column(DateTime)
     last_content_hash = Column(String(64))
     consecutive_failures = Column(Integer, default=0)
+
+    # HTTP validators from the last full download, sent back as If-None-Match / If-Modified-Since
+    etag = Column(String(255))
+    last_modified = Column(String(64))
     
     logs = relationship("CheckLog", back_populates="website", cascade="all, delete-orphan")
     alerts = relationship("AlertLog", back_populates="website", cascade="all, delete-orphan")
@@ -29,6 +46,13 @@ class Website(Base):
 
 class CheckLog(Base):
     __tablename__ = 'check_logs'
+    __table_args__ = (
+        # Every history query filters by site and orders/ranges by time; is_up rides along so
+        # uptime counts over (site, time range) are answered from the index alone
+        Index('ix_check_logs_website_time_up', 'website_id', 'timestamp', 'is_up'),
+        # Retention sweeps old rows across all sites
+        Index('ix_check_logs_timestamp', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     website_id = Column(Integer, ForeignKey('websites.id'))
@@ -38,11 +62,17 @@ class CheckLog(Base):
     is_up = Column(Boolean)
     content_hash = Column(String(64))
     error_message = Column(Text)
+
+    # Optional latency breakdown (Config.RECORD_TIMINGS), all in seconds
+    connect_time = Column(Float)  # TCP connect incl. DNS; NULL when a pooled connection was reused
+    tls_time = Column(Float)      # TLS handshake; NULL for plain HTTP or reused connections
+    first_byte_time = Column(Float)  # request start until response headers
     
     website = relationship("Website", back_populates="logs")
 
 class AlertLog(Base):
     __tablename__ = 'alert_logs'
+    __table_args__ = (Index('ix_alert_logs_website_time', 'website_id', 'timestamp'),)
     
     id = Column(Integer, primary_key=True)
     website_id = Column(Integer, ForeignKey('websites.id'))
@@ -51,3 +81,115 @@ class AlertLog(Base):
     message = Column(Text)
     
     website = relationship("Website", back_populates="alerts")
+
+class CheckRollup(Base):
+    """Per-site check aggregates for one minute/hour/day bucket, maintained by the DB writer as checks land."""
+    __tablename__ = 'check_rollups'
+    __table_args__ = (
+        UniqueConstraint('website_id', 'granularity', 'bucket_start'),
+        # Cross-site range scans: the dashboard's uptime window and rollup pruning
+        Index('ix_check_rollups_granularity_bucket', 'granularity', 'bucket_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    website_id = Column(Integer, ForeignKey('websites.id'))
+    granularity = Column(String(10)) # minute, hour, day
+    bucket_start = Column(DateTime)
+    check_count = Column(Integer, default=0)
+    up_count = Column(Integer, default=0)
+
+    # Latency of successful checks only; failures are mostly timeouts and would swamp the percentiles
+    latency_min = Column(Float)
+    latency_max = Column(Float)
+    latency_sum = Column(Float, default=0.0)
+    latency_histogram = Column(Text) # comma-separated counts per rollups.LATENCY_BUCKETS bucket
+
+class StatusEvent(Base):
+    """Change feed of site state, appended by the DB writer with each batch; dashboards tail it by id."""
+    __tablename__ = 'status_events'
+    __table_args__ = {"sqlite_autoincrement": True}  # ids keep increasing even after retention empties the table
+
+    id = Column(Integer, primary_key=True)
+    website_id = Column(Integer, ForeignKey('websites.id'))
+    timestamp = Column(DateTime, default=datetime.utcnow)  # when the check ran
+    kind = Column(String(10)) # status (went UP/DOWN), check (new result, same status)
+    is_up = Column(Boolean)
+    status_code = Column(Integer)
+    response_time = Column(Float)
+
+class LatencySketchSlot(Base):
+    """
+    Latency sketch of one site for one slot of a rolling percentile window (see database/sketches.py).
+    The monitor keeps the sketches in memory and adds its new counts here every SKETCH_CHECKPOINT_INTERVAL.
+    """
+    __tablename__ = 'latency_sketch_slots'
+    __table_args__ = (
+        UniqueConstraint('website_id', 'window_name', 'slot_start'),
+        # Startup load and pruning scan one window's recent / expired slots across all sites
+        Index('ix_latency_sketch_slots_window_start', 'window_name', 'slot_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    website_id = Column(Integer, ForeignKey('websites.id'))
+    window_name = Column(String(10)) # 1h, 24h, 7d
+    slot_start = Column(DateTime)
+    sample_count = Column(Integer, default=0)
+    buckets = Column(Text) # "index:count,..." per sketches.SketchMapping bucket; successful checks only
+
+class ContentSnapshot(Base):
+    """
+    Normalized page text keyed by its content hash (the value in Website.last_content_hash), so identical
+    content is stored once however many sites or checks produce it. `data` is zlib-compressed: the full
+    text for a keyframe, or line ops against `base_hash` for a delta (see database/snapshots.py).
+    """
+    __tablename__ = 'content_snapshots'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    base_hash = Column(String(64), index=True) # NULL for keyframes
+    depth = Column(Integer, default=0)         # deltas between this snapshot and its keyframe
+    size = Column(Integer)                     # uncompressed text length
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class MonitorMeta(Base):
+    """Small key/value store for bookkeeping such as when rollups started being maintained."""
+    __tablename__ = 'monitor_meta'
+
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255))
+
+class AlertOutbox(Base):
+    """Notifications waiting for delivery. Written with the check's results, drained by AlertDispatcher."""
+    __tablename__ = 'alert_outbox'
+    __table_args__ = (Index('ix_alert_outbox_status_due', 'status', 'next_attempt_at'),)
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String(64))
+    website_id = Column(Integer, ForeignKey('websites.id'))
+    alert_type = Column(String(50))
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String(10), default="pending") # pending, failed (sent rows are deleted)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String(32)) # dispatcher currently holding the row, so two processes never both send it
+    last_error = Column(Text)
+
+class AlertCooldown(Base):
+    """Per-site, per-alert-type cooldown shared by every process using the database."""
+    __tablename__ = 'alert_cooldowns'
+
+    website_id = Column(Integer, primary_key=True, autoincrement=False)
+    alert_type = Column(String(50), primary_key=True)
+    expires_at = Column(DateTime, index=True)
+
+class WorkerLease(Base):
+    """One row per running checker process in sharded mode; a worker is alive while its heartbeat is fresh."""
+    __tablename__ = 'worker_leases'
+
+    worker_id = Column(String(64), primary_key=True)
+    hostname = Column(String(255))
+    pid = Column(Integer)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,131 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy import select
+from .models import AlertCooldown, AlertOutbox, CheckLog, CheckRollup, ContentSnapshot, MonitorMeta, StatusEvent, Website
+from .archive import CheckArchive
+from .rollups import apply_rollups
+from config import Config
+
+class RetentionJob:
+    """
+    Keeps check history bounded.
+    - Raw check_logs older than `raw_days` are deleted; their data survives in the rollups, and with
+      an `archive` (Config.ARCHIVE_ENABLED) every closed day is first written to the columnar archive.
+    - Rows written before rollups existed (see MonitorMeta "rollups_since") are folded into the rollups
+      first, once, so deleting them loses nothing.
+    - Minute and hour rollups are pruned after their own windows; day rollups are kept forever.
+    - Undeliverable alerts left in the outbox are dropped after `raw_days`, expired cooldowns right away.
+    - The status_events change feed only has to outlive a dashboard's poll, so it keeps `event_seconds`.
+    - Content snapshots older than `raw_days` go once nothing needs them: neither a site's current
+      hash nor the base of another snapshot's delta. Chains therefore shrink from the old end, a run at a time.
+    Everything runs in short transactions of `batch_size` rows with a pause in between, so the
+    DB writer is never locked out for long.
+    """
+
+    def __init__(self, db_manager, raw_days=Config.RETENTION_RAW_DAYS, minute_days=Config.RETENTION_MINUTE_DAYS,
+                 hour_days=Config.RETENTION_HOUR_DAYS, event_seconds=Config.STATUS_EVENT_RETENTION,
+                 batch_size=Config.RETENTION_BATCH_SIZE, pause=0.05, archive=None):
+        self.db = db_manager
+        self.raw_days = raw_days
+        self.minute_days = minute_days
+        self.hour_days = hour_days
+        self.event_seconds = event_seconds
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive = archive if archive is not None else CheckArchive() if Config.ARCHIVE_ENABLED else None
+
+    def run(self, now: datetime = None) -> dict:
+        now = now or datetime.utcnow()
+        stats = {"backfilled": 0, "check_logs": 0, "minute_rollups": 0, "hour_rollups": 0, "failed_alerts": 0,
+                 "status_events": 0, "content_snapshots": 0, "archived": 0}
+        try:
+            stats["backfilled"] = self.backfill_rollups()
+            if self.archive is not None:
+                # A failure here aborts the run, so raw rows are never deleted before they are archived
+                stats["archived"] = self.archive.archive_closed_days(self.db, now)
+            stats["check_logs"] = self._delete_chunked(CheckLog, CheckLog.timestamp < now - timedelta(days=self.raw_days))
+            stats["minute_rollups"] = self._delete_chunked(CheckRollup, CheckRollup.granularity == "minute",
+                                                           CheckRollup.bucket_start < now - timedelta(days=self.minute_days))
+            stats["hour_rollups"] = self._delete_chunked(CheckRollup, CheckRollup.granularity == "hour",
+                                                         CheckRollup.bucket_start < now - timedelta(days=self.hour_days))
+            stats["failed_alerts"] = self._delete_chunked(AlertOutbox, AlertOutbox.status == "failed",
+                                                          AlertOutbox.created_at < now - timedelta(days=self.raw_days))
+            # No timestamp index needed: ids grow with time, so the oldest rows come first in id order
+            stats["status_events"] = self._delete_chunked(StatusEvent, StatusEvent.timestamp < now - timedelta(seconds=self.event_seconds))
+            stats["content_snapshots"] = self._delete_chunked(
+                ContentSnapshot, ContentSnapshot.created_at < now - timedelta(days=self.raw_days),
+                # NOT IN against a NULL matches nothing, so both lists leave NULLs out
+                ContentSnapshot.content_hash.not_in(
+                    select(Website.last_content_hash).where(Website.last_content_hash.is_not(None))),
+                ContentSnapshot.content_hash.not_in(
+                    select(ContentSnapshot.base_hash).where(ContentSnapshot.base_hash.is_not(None))),
+            )
+            self._with_retry(self._delete_expired_cooldowns, now)
+        except Exception as e:
+            print(f"[!] Retention run failed: {e}")
+        if any(stats.values()):
+            print(f"[*] Retention: {stats}")
+        return stats
+
+    def backfill_rollups(self) -> int:
+        """Folds check_logs written before rollups existed into them, resuming from a stored id watermark."""
+        if self.db.get_meta("rollups_backfill_done"):
+            return 0
+        since = datetime.fromisoformat(self.db.get_meta("rollups_since"))
+        watermark = int(self.db.get_meta("rollups_backfill_id", 0))
+        total = 0
+        while True:
+            chunk = self._with_retry(self._backfill_chunk, since, watermark)
+            if chunk is None:
+                self.db.set_meta("rollups_backfill_done", "1")
+                return total
+            watermark, count = chunk
+            total += count
+            time.sleep(self.pause)
+
+    def _backfill_chunk(self, since, watermark):
+        with self.db.get_session() as session:
+            rows = session.query(
+                CheckLog.id, CheckLog.website_id, CheckLog.timestamp, CheckLog.is_up, CheckLog.response_time
+            ).filter(
+                CheckLog.id > watermark, CheckLog.timestamp < since
+            ).order_by(CheckLog.id).limit(self.batch_size).all()
+            if not rows:
+                return None
+            apply_rollups(session, [row._asdict() for row in rows])
+            # Watermark moves in the same transaction as the rollups, so a chunk is never counted twice
+            session.merge(MonitorMeta(key="rollups_backfill_id", value=str(rows[-1].id)))
+            return rows[-1].id, len(rows)
+
+    def _delete_expired_cooldowns(self, now):
+        # At most one row per site and alert type, so a single statement is fine
+        with self.db.get_session() as session:
+            session.query(AlertCooldown).filter(AlertCooldown.expires_at < now).delete(synchronize_session=False)
+
+    def _delete_chunked(self, model, *criteria) -> int:
+        total = 0
+        while True:
+            deleted = self._with_retry(self._delete_chunk, model, criteria)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            time.sleep(self.pause)
+
+    def _delete_chunk(self, model, criteria) -> int:
+        with self.db.get_session() as session:
+            ids = [row.id for row in session.query(model.id).filter(*criteria).limit(self.batch_size)]
+            if ids:
+                session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            return len(ids)
+
+    def _with_retry(self, func, *args, attempts=3):
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args)
+            except (OperationalError, IntegrityError) as e:
+                # Lock contention with the DB writer, or both inserting the same new rollup row
+                if attempt == attempts:
+                    raise
+                print(f"[!] Retention batch failed (attempt {attempt}/{attempts}): {e}")
+                time.sleep(0.5 * attempt)
@@ -0,0 +1,142 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, insert, update
+from .models import CheckRollup
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Upper bounds (seconds) of the latency histogram buckets; one extra overflow bucket follows the last bound
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+# CheckRollup columns a batch adds to
+STAT_FIELDS = ("check_count", "up_count", "latency_min", "latency_max", "latency_sum", "latency_histogram")
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def parse_histogram(encoded: str) -> list:
+    if not encoded:
+        return [0] * (len(LATENCY_BUCKETS) + 1)
+    return [int(count) for count in encoded.split(",")]
+
+def histogram_quantile(histogram: list, q: float, low: float = None, high: float = None) -> float:
+    """Estimates the q-quantile by interpolating inside the bucket it falls in, clamped to the observed min/max."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+            upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else (high or lower)
+            value = lower + (upper - lower) * (rank - seen) / count
+            if low is not None:
+                value = max(value, low)
+            if high is not None:
+                value = min(value, high)
+            return value
+        seen += count
+    return high
+
+class RollupStats:
+    __slots__ = ("check_count", "up_count", "latency_min", "latency_max", "latency_sum", "histogram")
+
+    def __init__(self):
+        self.check_count = 0
+        self.up_count = 0
+        self.latency_min = None
+        self.latency_max = None
+        self.latency_sum = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, is_up: bool, response_time: float):
+        self.check_count += 1
+        if not is_up:
+            return
+        self.up_count += 1
+        if response_time is None:
+            return
+        self.latency_min = response_time if self.latency_min is None else min(self.latency_min, response_time)
+        self.latency_max = response_time if self.latency_max is None else max(self.latency_max, response_time)
+        self.latency_sum += response_time
+        self.histogram[bisect_left(LATENCY_BUCKETS, response_time)] += 1
+
+    def merge_into(self, row: dict) -> dict:
+        """Adds these stats to a rollup row's column values (missing ones count as empty), in place."""
+        row["check_count"] = (row.get("check_count") or 0) + self.check_count
+        row["up_count"] = (row.get("up_count") or 0) + self.up_count
+        row["latency_sum"] = (row.get("latency_sum") or 0.0) + self.latency_sum
+        low, high = row.get("latency_min"), row.get("latency_max")
+        if self.latency_min is not None:
+            low = self.latency_min if low is None else min(low, self.latency_min)
+            high = self.latency_max if high is None else max(high, self.latency_max)
+        row["latency_min"], row["latency_max"] = low, high
+        merged = [a + b for a, b in zip(parse_histogram(row.get("latency_histogram")), self.histogram)]
+        row["latency_histogram"] = ",".join(map(str, merged))
+        return row
+
+def aggregate(check_logs) -> dict:
+    """Groups CheckLog mappings into {(website_id, granularity, bucket_start): RollupStats}."""
+    stats = {}
+    for log in check_logs:
+        for granularity in GRANULARITIES:
+            key = (log["website_id"], granularity, bucket_start(log["timestamp"], granularity))
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = RollupStats()
+            entry.add(log["is_up"], log.get("response_time"))
+    return stats
+
+def apply_rollups(session, check_logs):
+    """
+    Folds a batch of CheckLog mappings into the rollup tables within the caller's transaction.
+    Rows are read as plain tuples and written back with one executemany UPDATE and one INSERT:
+    ORM objects would be flushed one UPDATE per row on drivers without multi-row rowcounts (SQLite),
+    which made rollups most of the writer's flush time.
+    """
+    stats = aggregate(check_logs)
+    if not stats:
+        return
+    website_ids = {key[0] for key in stats}
+    inserts, updates = [], []
+    for granularity in GRANULARITIES:
+        starts = {key[2] for key in stats if key[1] == granularity}
+        existing = {
+            (row.website_id, row.bucket_start): row._asdict()
+            for row in session.query(
+                CheckRollup.id, CheckRollup.website_id, CheckRollup.bucket_start,
+                *(getattr(CheckRollup, field) for field in STAT_FIELDS)
+            ).filter(
+                CheckRollup.granularity == granularity,
+                CheckRollup.bucket_start.in_(starts),
+                CheckRollup.website_id.in_(website_ids),
+            )
+        }
+        for key, entry in stats.items():
+            if key[1] != granularity:
+                continue
+            row = existing.get((key[0], key[2]))
+            if row is None:
+                inserts.append(entry.merge_into({"website_id": key[0], "granularity": granularity, "bucket_start": key[2]}))
+            else:
+                updates.append(dict(entry.merge_into(row), row_id=row["id"]))
+    connection = session.connection()
+    if updates:
+        table = CheckRollup.__table__
+        connection.execute(
+            update(table).where(table.c.id == bindparam("row_id"))
+            .values({field: bindparam(field) for field in STAT_FIELDS}),
+            [{field: row[field] for field in STAT_FIELDS + ("row_id",)} for row in updates],
+        )
+    if inserts:
+        connection.execute(insert(CheckRollup.__table__), inserts)
+
+def window_start(days: int, now: datetime = None) -> datetime:
+    """First day bucket of a `days`-long window ending today (UTC)."""
+    now = now or datetime.utcnow()
+    return bucket_start(now, "day") - timedelta(days=days - 1)
@@ -0,0 +1,282 @@
+import math
+import threading
+from array import array
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import bindparam, insert, update
+from .models import LatencySketchSlot
+from config import Config
+
+# Rolling windows: name -> (span, slot) in seconds. A window is the last span/slot slots, the
+# current (partial) one included, so "1h" covers the last 55-60 minutes and "7d" the last 6.5-7 days.
+WINDOWS = {"1h": (3600, 300), "24h": (86400, 3600), "7d": (7 * 86400, 12 * 3600)}
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Latencies are clamped to this range (seconds) before bucketing
+MIN_LATENCY = 1e-4
+MAX_LATENCY = 1e4
+
+class SketchMapping:
+    """
+    Log-spaced buckets, DDSketch style: every value in bucket i lies in (gamma^(i-1), gamma^i], and
+    reporting 2*gamma^i/(gamma+1) keeps any quantile within `accuracy` relative error. Counts per
+    bucket simply add up, so sketches of different slots, processes or sites merge exactly.
+    """
+
+    def __init__(self, accuracy: float = None):
+        accuracy = Config.SKETCH_ACCURACY if accuracy is None else accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._inverse_log_gamma = 1 / math.log(self.gamma)
+
+    def index(self, value: float) -> int:
+        return math.ceil(math.log(min(max(value, MIN_LATENCY), MAX_LATENCY)) * self._inverse_log_gamma)
+
+    def value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, counts: dict, q: float) -> float:
+        total = sum(counts.values())
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(counts):
+            seen += counts[index]
+            if seen > rank:
+                return self.value(index)
+        return self.value(max(counts))
+
+def encode_counts(counts: dict) -> str:
+    return ",".join(f"{index}:{count}" for index, count in sorted(counts.items()))
+
+def decode_counts(encoded: str) -> dict:
+    counts = {}
+    for pair in (encoded or "").split(","):
+        if pair:
+            index, count = pair.split(":")
+            counts[int(index)] = int(count)
+    return counts
+
+def freeze_counts(counts: dict) -> tuple:
+    """(first bucket, dense array of counts): a closed slot's buckets in a fraction of a dict's memory."""
+    first = min(counts)
+    dense = array("H" if max(counts.values()) < 65536 else "I", [0]) * (max(counts) - first + 1)
+    for index, count in counts.items():
+        dense[index - first] = count
+    return first, dense
+
+def thaw_counts(counts) -> dict:
+    if isinstance(counts, dict):
+        return counts
+    first, dense = counts
+    return {first + offset: count for offset, count in enumerate(dense) if count}
+
+def merge_counts(target: dict, counts: dict) -> dict:
+    for index, count in counts.items():
+        target[index] = target.get(index, 0) + count
+    return target
+
+_EPOCH = datetime(1970, 1, 1)
+
+def slot_start(window: str, slot: int) -> datetime:
+    return datetime.utcfromtimestamp(slot * WINDOWS[window][1])
+
+def slot_of(window: str, start: datetime) -> int:
+    return int((start - _EPOCH).total_seconds()) // WINDOWS[window][1]
+
+def first_slot(window: str, now: float) -> int:
+    """Oldest slot still inside `window` at `now`."""
+    span, slot_seconds = WINDOWS[window]
+    return int(now // slot_seconds) - span // slot_seconds + 1
+
+def window_quantiles(mapping: SketchMapping, rows, now: float = None, quantiles=QUANTILES) -> dict:
+    """
+    {window: {"count": n, "p50": s, ...}} from (window, slot_start, buckets) rows or in-memory
+    (window, slot, counts) tuples; slots that have left their window are skipped.
+    """
+    now = time.time() if now is None else now
+    merged = {window: {} for window in WINDOWS}
+    for window, slot, counts in rows:
+        if isinstance(slot, datetime):
+            slot = slot_of(window, slot)
+        if slot >= first_slot(window, now):
+            merge_counts(merged[window], decode_counts(counts) if isinstance(counts, str) else counts)
+    result = {}
+    for window, counts in merged.items():
+        stats = {"count": sum(counts.values())}
+        for q in quantiles:
+            stats[f"p{q * 100:g}"] = mapping.quantile(counts, q)
+        result[window] = stats
+    return result
+
+class SketchStore:
+    """
+    In-memory rolling latency sketches for every site this process checks (Config.LATENCY_SKETCHES).
+    Each window is a ring of per-slot bucket counts: add() is O(1) (a slot is started, closed
+    slots frozen into dense arrays and slots that left the window dropped, once per slot). At 1%
+    accuracy a site checked every minute takes roughly 20-30 KB for all three windows.
+    Counts added since the last checkpoint() are also kept as deltas, which checkpoint() adds to the
+    latency_sketch_slots rows, so a restart or a site moving to another shard loses nothing and
+    other processes (the dashboard) read the same percentiles from the database.
+    """
+
+    def __init__(self, mapping: SketchMapping = None):
+        self.mapping = mapping or SketchMapping()
+        self._sites = {}    # website_id -> {window: {slot: {bucket: count} or frozen (first, array)}}
+        self._pending = {}  # (website_id, window, slot) -> {bucket: count} not yet checkpointed
+        self._lock = threading.Lock()
+
+    def add(self, website_id: int, latency: float, now: float = None):
+        now = time.time() if now is None else now
+        index = self.mapping.index(latency)
+        with self._lock:
+            rings = self._sites.get(website_id)
+            if rings is None:
+                rings = self._sites[website_id] = {window: {} for window in WINDOWS}
+            for window, (_, slot_seconds) in WINDOWS.items():
+                slot = int(now // slot_seconds)
+                ring = rings[window]
+                counts = ring.get(slot)
+                if counts is None:
+                    oldest = first_slot(window, now)
+                    for old in list(ring):
+                        if old < oldest:
+                            del ring[old]
+                        elif isinstance(ring[old], dict):
+                            ring[old] = freeze_counts(ring[old])
+                    counts = ring[slot] = {}
+                elif not isinstance(counts, dict):
+                    counts = ring[slot] = thaw_counts(counts)  # a late check for a slot already closed
+                counts[index] = counts.get(index, 0) + 1
+                pending = self._pending.setdefault((website_id, window, slot), {})
+                pending[index] = pending.get(index, 0) + 1
+
+    def quantiles(self, website_id: int, now: float = None) -> dict:
+        """Per-window count and p50/p95/p99 (seconds) from memory; None values until a window has data."""
+        with self._lock:
+            rings = self._sites.get(website_id) or {}
+            rows = [(window, slot, dict(thaw_counts(counts))) for window, ring in rings.items() for slot, counts in ring.items()]
+        return window_quantiles(self.mapping, rows, now)
+
+    def forget(self, website_id: int):
+        """Drops a site's in-memory rings (e.g. it moved to another shard); pending deltas are still checkpointed."""
+        with self._lock:
+            self._sites.pop(website_id, None)
+
+    def __len__(self):
+        return len(self._sites)
+
+    def load(self, db_manager, website_ids=None, owns=None, now: float = None) -> int:
+        """
+        Restores the rings from checkpointed slots still inside their windows, for `website_ids`
+        (default: every site) that `owns` accepts. Returns the number of sites loaded.
+        """
+        now = time.time() if now is None else now
+        sites = {}
+        id_batches = [None] if website_ids is None else [website_ids[n:n + 500] for n in range(0, len(website_ids), 500)]
+        with db_manager.get_session() as session:
+            for window in WINDOWS:
+                oldest = slot_start(window, first_slot(window, now))
+                for ids in id_batches:
+                    rows = session.query(
+                        LatencySketchSlot.website_id, LatencySketchSlot.slot_start, LatencySketchSlot.buckets
+                    ).filter(LatencySketchSlot.window_name == window, LatencySketchSlot.slot_start >= oldest)
+                    if ids is not None:
+                        rows = rows.filter(LatencySketchSlot.website_id.in_(ids))
+                    for website_id, start, buckets in rows.yield_per(10000):
+                        if owns is not None and not owns(website_id):
+                            continue
+                        rings = sites.setdefault(website_id, {name: {} for name in WINDOWS})
+                        rings[window][slot_of(window, start)] = decode_counts(buckets)
+        with self._lock:
+            for website_id, rings in sites.items():
+                # Checks recorded since startup are already pending, so they are added on top rather than lost
+                current = self._sites.get(website_id)
+                if current is not None:
+                    for window, ring in current.items():
+                        for slot, counts in ring.items():
+                            merge_counts(rings[window].setdefault(slot, {}), thaw_counts(counts))
+                for window, ring in rings.items():
+                    open_slot = int(now // WINDOWS[window][1])
+                    for slot in ring:
+                        if slot != open_slot:
+                            ring[slot] = freeze_counts(ring[slot])
+                self._sites[website_id] = rings
+        return len(sites)
+
+    def checkpoint(self, db_manager, batch_size: int = 500, now: float = None) -> int:
+        """
+        Adds the counts recorded since the last checkpoint to their latency_sketch_slots rows (read,
+        merge, executemany, like the rollups) and deletes slots that have left every window.
+        Returns the number of slot rows written. If a batch fails, its counts and the rest are kept
+        pending (merged with any added meanwhile) and the error is re-raised.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        items = iter(sorted(pending.items()))
+        written = 0
+        while True:
+            batch = dict(islice(items, batch_size * len(WINDOWS)))
+            if not batch:
+                break
+            try:
+                with db_manager.get_session() as session:
+                    written += self._merge_batch(session, batch)
+            except Exception:
+                # This batch was rolled back and later ones never ran: keep them for the next checkpoint
+                with self._lock:
+                    for key, counts in list(batch.items()) + list(items):
+                        merge_counts(self._pending.setdefault(key, {}), counts)
+                raise
+        self._prune(db_manager, now)
+        return written
+
+    @staticmethod
+    def _merge_batch(session, batch: dict) -> int:
+        inserts, updates = [], []
+        for window in WINDOWS:
+            keys = {(website_id, slot_start(window, slot)): counts
+                    for (website_id, name, slot), counts in batch.items() if name == window}
+            if not keys:
+                continue
+            existing = {
+                (row.website_id, row.slot_start): row for row in session.query(
+                    LatencySketchSlot.id, LatencySketchSlot.website_id, LatencySketchSlot.slot_start,
+                    LatencySketchSlot.buckets
+                ).filter(
+                    LatencySketchSlot.window_name == window,
+                    LatencySketchSlot.website_id.in_({key[0] for key in keys}),
+                    LatencySketchSlot.slot_start.in_({key[1] for key in keys}),
+                )
+            }
+            for (website_id, start), counts in keys.items():
+                row = existing.get((website_id, start))
+                if row is None:
+                    inserts.append({"website_id": website_id, "window_name": window, "slot_start": start,
+                                    "sample_count": sum(counts.values()), "buckets": encode_counts(counts)})
+                else:
+                    merged = merge_counts(decode_counts(row.buckets), counts)
+                    updates.append({"row_id": row.id, "sample_count": sum(merged.values()),
+                                    "buckets": encode_counts(merged)})
+        connection = session.connection()
+        table = LatencySketchSlot.__table__
+        if updates:
+            connection.execute(
+                update(table).where(table.c.id == bindparam("row_id"))
+                .values(sample_count=bindparam("sample_count"), buckets=bindparam("buckets")),
+                updates,
+            )
+        if inserts:
+            connection.execute(insert(table), inserts)
+        return len(inserts) + len(updates)
+
+    @staticmethod
+    def _prune(db_manager, now: float = None):
+        now = time.time() if now is None else now
+        with db_manager.get_session() as session:
+            for window in WINDOWS:
+                cutoff = slot_start(window, first_slot(window, now))
+                session.query(LatencySketchSlot).filter(
+                    LatencySketchSlot.window_name == window, LatencySketchSlot.slot_start < cutoff
+                ).delete(synchronize_session=False)
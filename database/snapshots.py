@@ -0,0 +1,163 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import ContentSnapshot
+from config import Config
+
+def diff_lines(old: list, new: list, max_lines: int = Config.SNAPSHOT_DIFF_MAX_LINES) -> list:
+    """
+    Opcodes (tag, i1, i2, j1, j2) turning `old` into `new`, like difflib's get_opcodes().
+    The common prefix and suffix are matched in linear time first, and SequenceMatcher only runs on
+    what is left when both sides are at most `max_lines` long; otherwise that middle is reported
+    as one replaced block. A changed headline on a huge page stays cheap, and a complete rewrite
+    can't go quadratic.
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old) - suffix, len(new) - suffix
+
+    opcodes = [("equal", 0, prefix, 0, prefix)] if prefix else []
+    if old_end - prefix <= max_lines and new_end - prefix <= max_lines:
+        matcher = SequenceMatcher(None, old[prefix:old_end], new[prefix:new_end])
+        opcodes.extend((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+                       for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+    elif old_end > prefix or new_end > prefix:
+        tag = "replace" if old_end > prefix and new_end > prefix else "delete" if old_end > prefix else "insert"
+        opcodes.append((tag, prefix, old_end, prefix, new_end))
+    if suffix:
+        opcodes.append(("equal", old_end, len(old), new_end, len(new)))
+    return opcodes
+
+def summarize(opcodes, old: list, new: list, limit: int = 5, width: int = 120) -> tuple:
+    """(lines added, lines removed, up to `limit` "+ line" / "- line" samples cut to `width` characters)."""
+    added = removed = 0
+    sample = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            continue
+        removed += i2 - i1
+        added += j2 - j1
+        for sign, lines in (("-", old[i1:i2]), ("+", new[j1:j2])):
+            for line in lines[:max(0, limit - len(sample))]:
+                sample.append(f"{sign} {line if len(line) <= width else line[:width - 1] + '…'}")
+    return added, removed, sample
+
+def encode_delta(opcodes, new: list) -> bytes:
+    # ["=", i1, i2] copies base lines, ["+", line, ...] inserts new ones
+    ops = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif j2 > j1:
+            ops.append(["+"] + new[j1:j2])
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"))
+
+def apply_delta(base: list, data: bytes) -> list:
+    lines = []
+    for op in json.loads(zlib.decompress(data)):
+        if op[0] == "=":
+            lines.extend(base[op[1]:op[2]])
+        else:
+            lines.extend(op[1:])
+    return lines
+
+def _keyframe(content_hash: str, lines: list) -> dict:
+    text = "\n".join(lines)
+    return {"content_hash": content_hash, "base_hash": None, "depth": 0, "size": len(text),
+            "data": zlib.compress(text.encode("utf-8"))}
+
+def insert_snapshots(session, rows):
+    """Inserts snapshot rows, skipping content hashes that are already stored (by anyone)."""
+    rows = list({row["content_hash"]: row for row in rows}.values())
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        session.connection().execute(
+            insert(ContentSnapshot).on_conflict_do_nothing(index_elements=["content_hash"]), rows
+        )
+        return
+    existing = {content_hash for (content_hash,) in session.query(ContentSnapshot.content_hash).filter(
+        ContentSnapshot.content_hash.in_([row["content_hash"] for row in rows]))}
+    session.bulk_insert_mappings(ContentSnapshot, [row for row in rows if row["content_hash"] not in existing])
+
+class SnapshotStore:
+    """
+    Content-addressed snapshots of normalized page text (Config.CONTENT_SNAPSHOTS).
+    - Deduplicated: a snapshot is keyed by the content hash, so unchanged pages, reverts and sites
+      serving the same text never store anything new.
+    - Delta-compressed: a new snapshot is stored as line ops against the site's previous one, up to
+      `max_chain` deltas deep, then as a full (zlib) keyframe again. The keyframe is also used
+      whenever it would be smaller than the delta.
+    record() runs on the checker side and only when the hash changed; the returned row is written
+    by BatchWriter with the check. Recent texts are kept in a small LRU, so the next change of a
+    site usually diffs without reading anything back from the database.
+    """
+
+    def __init__(self, db_manager, max_chain: int = Config.SNAPSHOT_MAX_CHAIN,
+                 max_diff_lines: int = Config.SNAPSHOT_DIFF_MAX_LINES, cache_size: int = 64):
+        self.db = db_manager
+        self.max_chain = max_chain
+        self.max_diff_lines = max_diff_lines
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # content hash -> (lines, depth)
+        self._lock = threading.Lock()
+
+    def load(self, content_hash: str):
+        """(lines, depth) of a stored snapshot, or None if it isn't stored (or its chain is incomplete)."""
+        with self._lock:
+            cached = self._cache.get(content_hash)
+            if cached is not None:
+                self._cache.move_to_end(content_hash)
+                return cached
+        chain = []
+        with self.db.get_session() as session:
+            next_hash = content_hash
+            while next_hash and len(chain) <= self.max_chain:
+                row = session.query(ContentSnapshot.base_hash, ContentSnapshot.depth, ContentSnapshot.data).filter(
+                    ContentSnapshot.content_hash == next_hash).first()
+                if row is None:
+                    return None
+                chain.append(row)
+                next_hash = row.base_hash
+        if chain[-1].base_hash:
+            return None
+        lines = zlib.decompress(chain[-1].data).decode("utf-8").split("\n")
+        for row in reversed(chain[:-1]):
+            lines = apply_delta(lines, row.data)
+        return self._remember(content_hash, lines, chain[0].depth)
+
+    def record(self, old_hash: str, new_hash: str, text: str) -> tuple:
+        """
+        Builds the row for a page whose hash moved from `old_hash` to `new_hash`.
+        Returns (row for insert_snapshots, (added, removed, sample lines) or None without a previous snapshot).
+        """
+        lines = text.split("\n") if text else []
+        base = self.load(old_hash) if old_hash else None
+        row = _keyframe(new_hash, lines)
+        if base is None:
+            self._remember(new_hash, lines, 0)
+            return row, None
+        base_lines, base_depth = base
+        opcodes = diff_lines(base_lines, lines, self.max_diff_lines)
+        if base_depth < self.max_chain:
+            delta = encode_delta(opcodes, lines)
+            if len(delta) < len(row["data"]):
+                row = dict(row, base_hash=old_hash, depth=base_depth + 1, data=delta)
+        self._remember(new_hash, lines, row["depth"])
+        return row, summarize(opcodes, base_lines, lines)
+
+    def _remember(self, content_hash, lines, depth):
+        with self._lock:
+            self._cache[content_hash] = (lines, depth)
+            self._cache.move_to_end(content_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return lines, depth
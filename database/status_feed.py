@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import deque
+from config import Config
+
+class StatusFeed:
+    """
+    In-memory copy of the dashboard's status snapshot, kept current by tailing the status_events
+    change feed the DB writer appends to.
+    One instance per dashboard server is shared by every viewer: poll() reads the feed at most once
+    per `poll_interval` however many sessions ask, and is usually a single indexed query that finds
+    a handful of rows. The full snapshot (uptime, added or removed sites) is reloaded every
+    `refresh_interval`, which also repairs anything the feed missed, e.g. after events were pruned.
+    Ids are handed out when a writer inserts but become visible when it commits, so with several
+    writers a lower id can show up after a higher one was read. Each poll therefore re-reads the last
+    `overlap` ids and skips the events it has already applied.
+    """
+
+    def __init__(self, db_manager, poll_interval=Config.DASHBOARD_POLL_SECONDS,
+                 refresh_interval=Config.DASHBOARD_SNAPSHOT_REFRESH, batch_size=5000, overlap=2000):
+        self.db = db_manager
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.overlap = overlap      # a few writer batches' worth of ids that may still commit late
+        self.version = 0            # bumps whenever any site changes
+        self.changes = deque(maxlen=50)  # recent UP/DOWN transitions as (version, site dict)
+        self._sites = {}            # website id -> snapshot row
+        self._site_versions = {}    # website id -> version of its last change
+        self._last_event_id = 0
+        self._seen = set()          # ids applied within the overlap window
+        self._loaded_at = None      # monotonic
+        self._polled_at = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self) -> int:
+        """Brings the snapshot up to date if it's due and returns the current version."""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.refresh_interval:
+                self._reload(now)
+            elif now - self._polled_at >= self.poll_interval:
+                self._apply_events(now)
+            return self.version
+
+    def invalidate(self):
+        """Forces a full reload on the next poll, e.g. after a site was added."""
+        with self._lock:
+            self._loaded_at = None
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return list(self._sites.values())
+
+    def site_version(self, website_id: int) -> int:
+        return self._site_versions.get(website_id, 0)
+
+    def _reload(self, now):
+        # High-water mark first: events committed while the snapshot is read are replayed on top of
+        # it, which is harmless because every event carries the site's full state
+        last_event_id = self.db.get_last_status_event_id()
+        rows = self.db.get_status_snapshot(days=7)
+        self.version += 1
+        self._sites = {row["id"]: row for row in rows}
+        self._site_versions = dict.fromkeys(self._sites, self.version)
+        self._last_event_id = last_event_id
+        self._seen = set()
+        self._loaded_at = now
+        self._apply_events(now)
+
+    def _apply_events(self, now):
+        self._polled_at = now
+        floor = max(0, self._last_event_id - self.overlap)
+        events = [
+            event for event in self.db.get_status_events(floor, limit=self.batch_size + self.overlap)
+            if event["id"] not in self._seen
+        ]
+        if not events:
+            return
+        self.version += 1
+        for event in events:
+            self._seen.add(event["id"])
+            site = self._sites.get(event["website_id"])
+            if site is None:
+                self._loaded_at = None  # a site added since the last reload
+                continue
+            if site["last_check_at"] is not None and event["timestamp"] <= site["last_check_at"]:
+                continue  # already in the snapshot, or older than what a later event applied
+            # Replace rather than mutate, so rows already handed out by snapshot() never change under a reader
+            site = self._sites[event["website_id"]] = dict(
+                site, is_up=event["is_up"], last_status_code=event["status_code"],
+                last_response_time=event["response_time"], last_check_at=event["timestamp"],
+            )
+            self._site_versions[site["id"]] = self.version
+            if event["kind"] == "status":
+                self.changes.append((self.version, site))
+        self._last_event_id = max(self._last_event_id, events[-1]["id"])
+        floor = self._last_event_id - self.overlap
+        self._seen = {event_id for event_id in self._seen if event_id > floor}
@@ -0,0 +1,90 @@
+import io
+from datetime import datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from config import Config
+
+def build_engine(db_url: str = Config.DATABASE_URL):
+    """
+    Engine tuned for the backend in `db_url`.
+    - SQLite: WAL journal so dashboard and API readers never block the single DB writer (or the
+      other way round), synchronous=NORMAL (durable at every checkpoint, safe with WAL), a
+      memory-mapped read path and a busy timeout, so the few real lock conflicts wait instead of
+      failing with "database is locked".
+    - PostgreSQL: a sized, pre-pinged connection pool shared by the writer, retention, alert
+      dispatcher and scheduler threads.
+    Settings are read when the engine is built, so benchmarks can override Config first.
+    """
+    backend = make_url(db_url).get_backend_name()
+    if backend == "sqlite":
+        busy_timeout = Config.SQLITE_BUSY_TIMEOUT_MS
+        engine = create_engine(db_url, connect_args={"check_same_thread": False, "timeout": busy_timeout / 1000})
+        pragmas = {
+            "busy_timeout": busy_timeout,
+            "synchronous": Config.SQLITE_SYNCHRONOUS,
+            "mmap_size": Config.SQLITE_MMAP_SIZE,
+        }
+        # In-memory databases have no journal file to switch
+        if make_url(db_url).database not in (None, "", ":memory:"):
+            pragmas = dict(journal_mode=Config.SQLITE_JOURNAL_MODE, **pragmas)
+
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+        return engine
+    if backend == "postgresql":
+        return create_engine(
+            db_url, pool_size=Config.DB_POOL_SIZE, max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT, pool_recycle=Config.DB_POOL_RECYCLE, pool_pre_ping=True,
+        )
+    return create_engine(db_url)
+
+def bulk_insert(session, model, rows):
+    """
+    Inserts a list of mappings into `model`'s table in the session's transaction.
+    On PostgreSQL (psycopg2 or psycopg 3) batches of at least PG_COPY_MIN_ROWS are streamed with
+    COPY ... FROM STDIN, several times faster than executemany INSERTs; everything else goes
+    through bulk_insert_mappings. Primary keys are not returned either way.
+    """
+    bind = session.get_bind()
+    if (Config.PG_COPY and bind.dialect.name == "postgresql" and bind.dialect.driver in ("psycopg2", "psycopg")
+            and len(rows) >= Config.PG_COPY_MIN_ROWS):
+        _copy_rows(session, model.__table__, rows, bind.dialect.driver)
+    else:
+        session.bulk_insert_mappings(model, rows)
+
+def _copy_rows(session, table, rows, driver):
+    keys = set().union(*rows)
+    columns = [column for column in table.columns if column.key in keys]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row.get(column.key)) for column in columns))
+        buffer.write("\n")
+    statement = f"COPY {table.name} ({', '.join(column.name for column in columns)}) FROM STDIN"
+    # The session's own DBAPI connection, so the COPY commits or rolls back with the rest of the batch
+    connection = session.connection().connection.driver_connection
+    cursor = connection.cursor()
+    try:
+        if driver == "psycopg2":
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+def _copy_value(value) -> str:
+    # COPY text format: \N is NULL; backslash, tab and line breaks must be escaped
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return str(value)
@@ -0,0 +1,207 @@
+import atexit
+import queue
+import threading
+import time
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .models import Website, CheckLog, AlertLog, AlertOutbox, StatusEvent
+from .rollups import apply_rollups
+from .snapshots import insert_snapshots
+from .storage import bulk_insert
+from monitors.metrics import DB_FLUSH, DB_FLUSH_ERRORS, DB_ROWS, WRITER_QUEUE
+from config import Config
+
+class _Barrier:
+    """Queue marker that makes the writer flush everything before it, optionally stopping afterwards."""
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+class BatchWriter:
+    """
+    Write-behind pipeline for check results.
+    Checks push (Website update, CheckLog, AlertLogs) onto a bounded queue and return immediately;
+    a single writer thread turns them into bulk inserts and bulk Website updates, one transaction
+    per `batch_size` results or every `flush_interval` seconds, whichever comes first.
+    The same transaction folds the batch into the minute/hour/day CheckRollup rows the dashboard reads
+    and appends one StatusEvent per site, the change feed live dashboards follow. Content snapshots
+    recorded for changed pages are inserted with them.
+    When the queue is full, submit() blocks, which slows the checks down instead of growing memory.
+    """
+
+    def __init__(self, db_manager, batch_size=Config.WRITE_BATCH_SIZE,
+                 flush_interval=Config.WRITE_FLUSH_MS / 1000, max_queue=Config.WRITE_QUEUE_SIZE):
+        self.db = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return self
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+        WRITER_QUEUE.set_function(self.qsize)
+        # Daemon threads die with the interpreter; make sure queued results reach the DB first
+        atexit.register(self.stop)
+        return self
+
+    def submit(self, website_update: dict = None, check_log: dict = None, alerts=(), outbox=(), event: dict = None,
+               snapshots=()):
+        """Queues one check's writes. `website_update` must contain the Website `id`."""
+        self._queue.put((website_update, check_log, list(alerts), list(outbox), event, list(snapshots)))
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Blocks until everything submitted so far has been written."""
+        self._send_barrier(_Barrier(), timeout)
+
+    def stop(self, timeout=None):
+        """Flushes pending writes and stops the writer thread. Safe to call more than once."""
+        self._send_barrier(_Barrier(stop=True), timeout)
+        atexit.unregister(self.stop)
+
+    def _send_barrier(self, barrier, timeout):
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._queue.put(barrier)
+        barrier.done.wait(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _Barrier):
+                self._flush(batch)
+                batch = []
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (item is None or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch, attempts=3):
+        if not batch:
+            return
+        # Several results for the same site in one batch collapse into a single UPDATE
+        updates = {}
+        logs = []
+        alerts = []
+        outbox = []
+        events = {}
+        snapshots = []
+        for website_update, check_log, alert_rows, outbox_rows, event, snapshot_rows in batch:
+            if website_update:
+                updates.setdefault(website_update["id"], {}).update(website_update)
+            if event:
+                # Latest state per site, but a status change anywhere in the batch is still reported as one
+                previous = events.get(event["website_id"])
+                events[event["website_id"]] = dict(event, kind="status") if previous and previous["kind"] == "status" else event
+            if check_log:
+                logs.append(check_log)
+            alerts.extend(alert_rows)
+            outbox.extend(outbox_rows)
+            snapshots.extend(snapshot_rows)
+
+        error = None
+        for attempt in range(1, attempts + 1):
+            start = time.perf_counter()
+            try:
+                with self.db.get_session() as session:
+                    if updates:
+                        _update_websites(session, updates)
+                    if logs:
+                        bulk_insert(session, CheckLog, logs)
+                        # Same transaction, so rollups never drift from the raw logs
+                        apply_rollups(session, logs)
+                    if alerts:
+                        session.bulk_insert_mappings(AlertLog, alerts)
+                    if outbox:
+                        # Committed with the alert itself; AlertDispatcher picks it up from here
+                        session.bulk_insert_mappings(AlertOutbox, outbox)
+                    if events:
+                        bulk_insert(session, StatusEvent, list(events.values()))
+                    if snapshots:
+                        insert_snapshots(session, snapshots)
+                DB_FLUSH.observe(time.perf_counter() - start)
+                DB_ROWS.inc(len(batch))
+                return
+            except (OperationalError, IntegrityError) as e:
+                DB_FLUSH_ERRORS.inc()
+                # Usually "database is locked" while another process writes, or a rollup row another
+                # writer inserted first; back off and retry
+                print(f"[!] DB writer flush failed (attempt {attempt}/{attempts}): {e}")
+                error = e
+                if attempt < attempts:
+                    time.sleep(0.5 * attempt)
+            except Exception as e:
+                DB_FLUSH_ERRORS.inc()
+                print(f"[!] DB writer flush failed: {e}")
+                error = e
+                break
+        self._salvage(batch, error)
+
+    def _salvage(self, batch, error):
+        """
+        Writes what it can of a batch that keeps failing. One bad result must not take the rest with it,
+        so the batch is split in halves until the culprit is alone. Splitting cannot help while the
+        database itself is failing (OperationalError), so then only the alerts get one more try on their own.
+        """
+        if len(batch) > 1 and not isinstance(error, OperationalError):
+            middle = len(batch) // 2
+            self._flush(batch[:middle], attempts=1)
+            self._flush(batch[middle:], attempts=1)
+            return
+        alerts = [row for item in batch for row in item[2]]
+        outbox = [row for item in batch for row in item[3]]
+        if alerts or outbox:
+            try:
+                with self.db.get_session() as session:
+                    if alerts:
+                        session.bulk_insert_mappings(AlertLog, alerts)
+                    if outbox:
+                        session.bulk_insert_mappings(AlertOutbox, outbox)
+                print(f"[!] DB writer dropped {len(batch)} results but kept their alerts: {error}")
+                return
+            except Exception as e:
+                DB_FLUSH_ERRORS.inc()
+                error = e
+        print(f"[!] DB writer dropped {len(batch)} results: {error}")
+
+def _update_websites(session, updates):
+    """
+    Writes the Website updates with one executemany UPDATE per set of columns. Unlike
+    bulk_update_mappings, a site deleted in the meantime matches no row instead of raising StaleDataError.
+    """
+    table = Website.__table__
+    groups = {}
+    for row in updates.values():
+        groups.setdefault(tuple(sorted(key for key in row if key != "id")), []).append(row)
+    connection = session.connection()
+    for fields, rows in groups.items():
+        if not fields:
+            continue
+        connection.execute(
+            update(table).where(table.c.id == bindparam("row_id")).values({field: bindparam(field) for field in fields}),
+            [dict({field: row[field] for field in fields}, row_id=row["id"]) for row in rows],
+        )
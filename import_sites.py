@@ -0,0 +1,65 @@
+"""
+Bulk-imports monitoring targets from CSV or JSON Lines, streaming the file in batches.
+
+    python import_sites.py sites.csv                 # header: name,url[,interval,is_active,min_interval,max_interval]
+                                                     #   optional ignore_selectors,ignore_regexes (one rule per line)
+                                                     #   optional check_mode (full|head|range|tcp|tls),full_check_every
+    python import_sites.py sites.jsonl --update      # one {"name": ..., "url": ..., "interval": ...} per line
+    cat sites.csv | python import_sites.py - --format csv
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from database.db_manager import DBManager
+
+def read_csv(handle):
+    sample = handle.readline()
+    if not sample.strip():
+        return
+    fields = [field.strip().lower() for field in next(csv.reader([sample]))]
+    if "url" not in fields:
+        # No header: columns are name,url[,interval]
+        fields = ["name", "url", "interval"]
+        yield dict(zip(fields, next(csv.reader([sample]))))
+    for values in csv.reader(handle):
+        if values:
+            yield dict(zip(fields, values))
+
+def read_jsonl(handle):
+    for number, line in enumerate(handle, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            print(f" [!] Line {number}: not valid JSON, skipped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import monitoring targets from a CSV or JSONL file")
+    parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--interval", type=int, default=300, help="check interval for rows without one, seconds")
+    parser.add_argument("--update", action="store_true", help="update name/interval/bounds/rules/is_active of URLs already tracked")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    handle = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    db = DBManager()
+    start = time.perf_counter()
+    try:
+        rows = read_jsonl(handle) if fmt == "jsonl" else read_csv(handle)
+        result = db.bulk_upsert_websites(rows, interval=args.interval, update_existing=args.update,
+                                         batch_size=args.batch_size)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+    print(f"[+] Imported in {time.perf_counter() - start:.1f}s: {result['inserted']} inserted, "
+          f"{result['updated']} updated, {result['skipped']} skipped")
+    print("Running monitors pick up new sites at their next reconcile.")
+
+if __name__ == "__main__":
+    main()
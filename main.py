@@ -1,34 +1,17 @@
-from apscheduler.schedulers.background import BackgroundScheduler
 from database.db_manager import DBManager
 from monitors.checker import SiteChecker
+from monitors.scheduler import MonitorScheduler
+from monitors.metrics import start_metrics_server
+from monitors.sharding import ShardCoordinator
+from config import Config
+import argparse
+import asyncio
 import time
 import signal
 import sys
 
-def check_task(site_id, checker):
-    try:
-        checker.check_site(site_id)
-    except Exception as e:
-        print(f"Error checking site {site_id}: {e}")
-
-def main():
-    print("Initializing Website Monitoring System...")
-    db = DBManager()
-    checker = SiteChecker(db)
-    scheduler = BackgroundScheduler()
-    
-    # Load active websites and schedule them
-    websites = db.get_active_websites()
-    for site in websites:
-        print(f"[*] Scheduling {site.name} every {site.check_interval}s")
-        scheduler.add_job(
-            check_task, 
-            'interval', 
-            seconds=site.check_interval, 
-            args=[site.id, checker],
-            id=f"site_{site.id}"
-        )
-    
+def run_threaded(db, checker):
+    scheduler = MonitorScheduler(checker)
     scheduler.start()
     print("Scheduler started. Monitoring active websites.")
 
@@ -36,17 +19,53 @@ def main():
     def signal_handler(sig, frame):
         print("\nShutting down scheduler...")
         scheduler.shutdown()
+        print("Flushing pending results...")
+        checker.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
-    
-    # Keep the main thread alive
+
+    # Keep the main thread alive; new, removed and re-intervaled sites are picked up by the reconcile job
     try:
         while True:
             time.sleep(1)
-            # Future Improvement: Periodically check DB for new sites to add to scheduler
     except (KeyboardInterrupt, SystemExit):
+        # signal_handler may already have shut everything down before exiting
         scheduler.shutdown()
+        checker.close()
+
+def run_async(db, checker):
+    from monitors.async_checker import AsyncCheckEngine
+    engine = AsyncCheckEngine(checker)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        print("\nShutting down async engine...")
+    finally:
+        checker.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Website Monitoring System")
+    parser.add_argument("--mode", choices=["threaded", "async"], default=Config.ENGINE_MODE,
+                        help="check engine to run (default: ENGINE_MODE from .env)")
+    parser.add_argument("--shard", action="store_true", default=Config.SHARDING,
+                        help="share the sites with other worker processes on the same database (default: SHARDING from .env)")
+    parser.add_argument("--worker-id", help="stable name for this worker in sharded mode (default: host-pid-random)")
+    parser.add_argument("--metrics-port", type=int, default=Config.METRICS_PORT,
+                        help="port for the /metrics endpoint, 0 to disable (default: METRICS_PORT from .env)")
+    args = parser.parse_args()
+
+    print("Initializing Website Monitoring System...")
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, Config.METRICS_HOST)
+    db = DBManager()
+    shard = ShardCoordinator(db, worker_id=args.worker_id) if args.shard else None
+    checker = SiteChecker(db, shard=shard)
+
+    if args.mode == "async":
+        run_async(db, checker)
+    else:
+        run_threaded(db, checker)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,56 @@
+from config import Config
+
+class IntervalPolicy:
+    """
+    Adapts each site's check interval to how it behaves (Config.ADAPTIVE_INTERVALS).
+    - A failed check drops to the site's minimum interval, so a DOWN is confirmed (or cleared) within
+      a few short checks instead of CONSECUTIVE_FAILURES_THRESHOLD full intervals. Once the site is
+      declared down it goes back to its configured interval while waiting for recovery, and the first
+      successful check after failures restores that interval too.
+    - A content change tightens the interval multiplicatively; every unchanged check (including 304s)
+      backs it off a little. Pages that change often settle near the minimum, static ones at the maximum.
+    Failures and recoveries count on every run; only full content checks tighten or back off, since
+    probe runs compare no content.
+    Website.check_interval stays the configured base; bounds come from Website.min_interval /
+    max_interval or default to base / ADAPTIVE_RANGE .. base * ADAPTIVE_RANGE.
+    """
+
+    def __init__(self, tighten=Config.ADAPTIVE_TIGHTEN, backoff=Config.ADAPTIVE_BACKOFF,
+                 spread=Config.ADAPTIVE_RANGE, floor=Config.ADAPTIVE_MIN_INTERVAL):
+        self.tighten = tighten
+        self.backoff = backoff
+        self.spread = spread
+        self.floor = floor
+
+    def bounds(self, state):
+        base = state.check_interval
+        low = state.min_interval or min(base, max(self.floor, int(base / self.spread)))
+        high = state.max_interval or int(base * self.spread)
+        return low, max(low, high)
+
+    def next_interval(self, state, is_up: bool, content_changed: bool, full: bool = True,
+                      recovered: bool = False) -> int:
+        low, high = self.bounds(state)
+        base = min(max(state.check_interval, low), high)
+        if not is_up:
+            if state.consecutive_failures < Config.CONSECUTIVE_FAILURES_THRESHOLD:
+                return low
+            return base
+        interval = base if recovered else state.interval
+        if not full:
+            return interval
+        if content_changed:
+            return max(low, int(interval * self.tighten))
+        # Round up, or short intervals would never grow by a fractional step
+        return min(high, max(int(interval * self.backoff), interval + 1))
+
+    def update(self, state, is_up: bool, content_changed: bool, full: bool = True, recovered: bool = False) -> bool:
+        """
+        Moves the site's effective interval; returns True if it changed. `recovered` marks a successful
+        check after failures, `full` one that compared content.
+        """
+        interval = self.next_interval(state, is_up, content_changed, full, recovered)
+        if interval == state.interval:
+            return False
+        state.effective_interval = interval
+        return True
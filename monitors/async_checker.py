@@ -0,0 +1,277 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.utils import get_encoding_from_headers
+from .checker import CheckResult, SiteChecker
+from .content_diff import StreamingHasher
+from .metrics import CHECKS_IN_FLIGHT, CHECKS_WAITING, SCHEDULER_LAG
+from .politeness import AsyncHostLimiter, AsyncRequestCoalescer, request_key, retry_after
+from .probes import CONNECT_MODES, async_connect_probe, probe_up, range_header
+from .scheduler import next_slot, schedule_jitter, scheduled_slot
+from database.retention import RetentionJob
+from config import Config
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency, only needed for ENGINE_MODE=async
+    aiohttp = None
+
+def _build_trace_config():
+    """Records connection setup and time-to-headers into the per-request `trace_request_ctx` dict."""
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        # Redirect hops fire this again; keep the first so timings cover the whole check
+        ctx.trace_request_ctx.setdefault("start", time.perf_counter())
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        timings = ctx.trace_request_ctx
+        timings["connect_time"] = timings.get("connect_time", 0.0) + time.perf_counter() - ctx.connect_start
+
+    async def on_request_end(session, ctx, params):
+        timings = ctx.trace_request_ctx
+        timings["first_byte_time"] = time.perf_counter() - timings["start"]
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_start.append(on_connection_create_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+class AsyncCheckEngine:
+    """
+    Runs every check on a single asyncio event loop instead of one blocking thread per check.
+    A global semaphore caps the number of requests in flight, per-host limits queue checks before
+    they take a global slot, and identical checks in flight share one request. Results are handed to
+    SiteChecker.record_result so state transitions, CheckLog rows and alerts are identical
+    to the threaded engine.
+    """
+
+    def __init__(self, checker: SiteChecker, max_concurrency: int = None):
+        if aiohttp is None:
+            raise RuntimeError("The async engine requires aiohttp (pip install aiohttp)")
+        self.checker = checker
+        self.max_concurrency = Config.MAX_CONCURRENT_CHECKS if max_concurrency is None else max_concurrency
+        self.retention = RetentionJob(checker.db)
+        # Result handling can block (writer backpressure, alert delivery), so it runs off the event loop
+        self._result_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-results")
+        self._semaphore = None
+        self._session = None
+        self.hosts = AsyncHostLimiter()
+        self.coalescer = AsyncRequestCoalescer() if Config.COALESCE_REQUESTS else None
+        self._tasks = {}  # site_id -> asyncio.Task
+
+    async def fetch(self, url: str, headers: dict = None, rules=None, mode: str = "full") -> CheckResult:
+        if self.coalescer is None:
+            return await self._limited_fetch(url, headers, rules, mode)
+        return await self.coalescer.run(request_key(url, mode, headers, rules),
+                                        lambda: self._limited_fetch(url, headers, rules, mode))
+
+    async def _limited_fetch(self, url: str, headers: dict, rules, mode: str) -> CheckResult:
+        # The host slot comes first, so checks queued behind a busy host don't hold global slots
+        async with self.hosts.slot(url):
+            result = await self._fetch_slot(url, headers, rules, mode)
+        if result.retry_after:
+            self.hosts.pause(url, result.retry_after)
+        return result
+
+    async def _fetch_slot(self, url: str, headers: dict, rules, mode: str) -> CheckResult:
+        CHECKS_WAITING.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            CHECKS_WAITING.dec()
+        CHECKS_IN_FLIGHT.inc()
+        try:
+            if mode != "full":
+                return await self._probe(url, mode)
+            return await self._fetch(url, headers, rules)
+        finally:
+            CHECKS_IN_FLIGHT.dec()
+            self._semaphore.release()
+
+    async def _fetch(self, url: str, headers: dict = None, rules=None) -> CheckResult:
+        # Timing starts once a slot is free so queueing doesn't count as server latency
+        start_time = time.time()
+        # aiohttp reports DNS, TCP and TLS together, so the TLS share is folded into connect_time
+        timings = {}
+        try:
+            async with self._session.get(url, headers=headers, trace_request_ctx=timings) as response:
+                status_code = response.status
+                # Same charset rules as requests, so both engines produce the same hashes
+                encoding = get_encoding_from_headers(response.headers)
+                content_hash, parse_time, body, text = None, None, None, None
+                if status_code != 304 and self.checker.hash_pool:
+                    body = await self._read_body(response)
+                elif status_code != 304:
+                    hasher = StreamingHasher(encoding, rules=rules)
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        if not hasher.update(chunk):
+                            break
+                    content_hash = hasher.hexdigest()
+                    parse_time = hasher.parse_time
+                    text = hasher.text
+                response_time = time.time() - start_time - (parse_time or 0.0)
+            if body is not None:
+                # Parsing runs in a worker process, so the event loop keeps serving other checks
+                parse_start = time.time()
+                content_hash, text = await asyncio.wrap_future(self.checker.hash_pool.submit(body, encoding, rules))
+                parse_time = time.time() - parse_start
+            return CheckResult(
+                status_code, response_time, status_code < 400, content_hash,
+                connect_time=timings.get("connect_time"), first_byte_time=timings.get("first_byte_time"),
+                etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+                parse_time=parse_time, text=text,
+                retry_after=retry_after(status_code, response.headers.get("Retry-After"))
+            )
+        except Exception as e:
+            return CheckResult(0, time.time() - start_time, False, error_msg=str(e) or type(e).__name__,
+                               connect_time=timings.get("connect_time"))
+
+    async def _probe(self, url: str, mode: str) -> CheckResult:
+        """Uptime-only check, same modes and fallbacks as SiteChecker.probe()."""
+        start_time = time.time()
+        timings = {}
+        try:
+            if mode in CONNECT_MODES:
+                connect_time, tls_time = await async_connect_probe(url, mode)
+                return CheckResult(None, time.time() - start_time, True, connect_time=connect_time,
+                                   tls_time=tls_time, mode=mode)
+            if mode not in ("head", "range"):
+                raise ValueError(f"Unknown check mode {mode!r}")
+            if mode == "head":
+                async with self._session.head(url, allow_redirects=True, trace_request_ctx=timings) as response:
+                    status_code = response.status
+                    wait = retry_after(status_code, response.headers.get("Retry-After"))
+                if status_code in (405, 501):
+                    mode = "range"
+            if mode == "range":
+                async with self._session.get(url, headers=range_header(), trace_request_ctx=timings) as response:
+                    status_code = response.status
+                    wait = retry_after(status_code, response.headers.get("Retry-After"))
+                    # Leaving the block with unread body closes the connection instead of draining it
+                    await response.content.read(Config.PROBE_RANGE_BYTES)
+            return CheckResult(status_code, time.time() - start_time, probe_up(status_code, mode),
+                               connect_time=timings.get("connect_time"),
+                               first_byte_time=timings.get("first_byte_time"), mode=mode, retry_after=wait)
+        except Exception as e:
+            return CheckResult(0, time.time() - start_time, False, error_msg=str(e) or type(e).__name__,
+                               connect_time=timings.get("connect_time"), mode=mode)
+
+    async def _read_body(self, response) -> bytes:
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body.extend(chunk)
+            if Config.MAX_CONTENT_BYTES and len(body) >= Config.MAX_CONTENT_BYTES:
+                del body[Config.MAX_CONTENT_BYTES:]
+                break
+        return bytes(body)
+
+    async def check_site(self, site):
+        if not self.checker.owns(site.id):
+            return
+        print(f"[*] Checking {site.name} ({site.url})...")
+        mode = site.next_check_mode()
+        headers, rules = (site.conditional_headers(), site.content_rules) if mode == "full" else (None, None)
+        result = await self.fetch(site.url, headers, rules, mode)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._result_executor, self.checker.record_result, site.id, result)
+        except Exception as e:
+            print(f"Error checking site {site.id}: {e}")
+
+    async def _run_site(self, site):
+        # Same epoch-anchored phase and jitter as the threaded scheduler; the interval is re-read every
+        # round, so adaptive changes apply from the next slot
+        while True:
+            slot = next_slot(site.id, site.interval)
+            await asyncio.sleep(slot - time.time() + random.uniform(0, schedule_jitter(site.interval)))
+            SCHEDULER_LAG.observe(time.time() - slot)
+            scheduled_slot.set(slot)
+            await self.check_site(site)
+
+    def _add_site(self, site):
+        print(f"[*] Scheduling {site.name} every {site.interval}s")
+        self._tasks[site.id] = asyncio.create_task(self._run_site(site))
+
+    def _remove_site(self, site_id: int):
+        task = self._tasks.pop(site_id, None)
+        if task:
+            task.cancel()
+
+    async def _reconcile(self):
+        loop = asyncio.get_running_loop()
+        try:
+            websites = await loop.run_in_executor(self._result_executor, self.checker.db.get_active_websites)
+        except Exception as e:
+            print(f"[!] Reconcile failed: {e}")
+            return
+        added, removed, rescheduled = self.checker.states.sync(websites)
+        for site in removed:
+            print(f"[-] Unscheduling {site.name}")
+            self._remove_site(site.id)
+        # Rescheduled sites just pick up the new interval on their next slot
+        for site in added:
+            self._add_site(site)
+        if added or removed:
+            await loop.run_in_executor(self._result_executor, self.checker.track_sites, added, removed)
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(Config.RECONCILE_INTERVAL)
+            await self._reconcile()
+
+    async def _retention_loop(self):
+        # Default executor, not the result thread: a long retention run must not hold up check results
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(Config.RETENTION_INTERVAL)
+            shard = self.checker.shard
+            if shard is None or shard.is_leader():
+                await loop.run_in_executor(None, self.retention.run)
+
+    async def _sketch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(Config.SKETCH_CHECKPOINT_INTERVAL)
+            await loop.run_in_executor(None, self.checker.checkpoint_sketches)
+
+    async def _heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        shard = self.checker.shard
+        while True:
+            await asyncio.sleep(shard.heartbeat_interval)
+            if await loop.run_in_executor(None, shard.heartbeat):
+                # Ring changed: pick up or drop sites now rather than at the next reconcile
+                await self._reconcile()
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Keep-alive connections and resolved addresses are reused across checks, like the threaded pool
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=Config.DNS_CACHE_TTL)
+        timeout = aiohttp.ClientTimeout(total=Config.REQUEST_TIMEOUT)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers={"User-Agent": Config.USER_AGENT},
+            cookie_jar=aiohttp.DummyCookieJar(), trace_configs=[_build_trace_config()]
+        ) as session:
+            self._session = session
+            for site in self.checker.states:
+                self._add_site(site)
+            print(f"Async engine started. Monitoring {len(self._tasks)} websites (max {self.max_concurrency} in flight).")
+            background = [asyncio.create_task(self._retention_loop())]
+            if self.checker.sketches is not None:
+                background.append(asyncio.create_task(self._sketch_loop()))
+            if self.checker.shard is not None:
+                background.append(asyncio.create_task(self._heartbeat_loop()))
+            try:
+                await self._reconcile_loop()
+            finally:
+                for task in background:
+                    task.cancel()
+                for task in self._tasks.values():
+                    task.cancel()
+                self._result_executor.shutdown(wait=True)
@@ -1,101 +1,376 @@
-import requests
 import time
 from datetime import datetime
 from database.db_manager import DBManager
-from .content_diff import get_content_hash, detect_change
-from alerts.telegram_bot import TelegramBot
+from database.sketches import SketchStore
+from database.snapshots import SnapshotStore
+from database.writer import BatchWriter
+from .content_diff import hash_response, read_body, detect_change
+from .adaptive import IntervalPolicy
+from .hash_pool import HashPool
+from .http_pool import build_session, reset_timings, get_timings
+from .metrics import CHECK_DURATION, CHECKS, CHECKS_IN_FLIGHT
+from .politeness import HostLimiter, RequestCoalescer, request_key, retry_after
+from .probes import CONNECT_MODES, connect_probe, probe_up, range_header
+from .state import StateTable
+from alerts.dispatcher import AlertDispatcher
+from alerts.telegram_bot import escape_markdown
 from config import Config
 
+_NETWORK_TIME = CHECK_DURATION.labels("network")
+_PARSE_TIME = CHECK_DURATION.labels("parse")
+_DB_TIME = CHECK_DURATION.labels("db")
+
+class CheckResult:
+    """Outcome of a single fetch, independent of which engine performed it."""
+
+    def __init__(self, status_code, response_time, is_up, content_hash=None, error_msg=None,
+                 connect_time=None, tls_time=None, first_byte_time=None, etag=None, last_modified=None,
+                 parse_time=None, text=None, mode="full", retry_after=None, deferred=None):
+        self.status_code = status_code
+        self.response_time = response_time
+        self.is_up = is_up
+        self.content_hash = content_hash
+        self.error_msg = error_msg
+        self.connect_time = connect_time
+        self.tls_time = tls_time
+        self.first_byte_time = first_byte_time
+        self.etag = etag
+        self.last_modified = last_modified
+        self.parse_time = parse_time  # seconds spent normalizing and hashing the body
+        self.text = text  # normalized page text, only captured for content snapshots
+        self.mode = mode  # probe modes never carry a content hash or validators
+        self.retry_after = retry_after  # seconds a 429/503 asked us to leave the host alone
+        self.deferred = deferred  # not checked: seconds until the host's limits let the request through
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
 class SiteChecker:
-    def __init__(self, db_manager: DBManager):
+    def __init__(self, db_manager: DBManager, writer: BatchWriter = None, states: StateTable = None, shard=None,
+                 dispatcher: AlertDispatcher = None):
         self.db = db_manager
-        self.notifier = TelegramBot()
-
-    def check_site(self, website_id: int):
-        with self.db.get_session() as session:
-            # Need to re-query within the session for thread safety
-            from database.models import Website
-            website = session.query(Website).get(website_id)
-            if not website:
-                return
-
-            print(f"[*] Checking {website.name} ({website.url})...")
-            start_time = time.time()
-            
-            try:
-                response = requests.get(
-                    website.url, 
-                    timeout=Config.REQUEST_TIMEOUT,
-                    headers={"User-Agent": Config.USER_AGENT}
-                )
+        # Sharded mode: this process only checks the sites the coordinator assigns to it
+        self.shard = shard
+        if shard is not None:
+            shard.heartbeat()
+        # Monitor state lives in memory; the DB copy is only written, never re-read per check
+        self.states = states if states is not None else StateTable(db_manager, shard).load()
+        # Alerts are queued in the outbox with the check's writes and sent by a background thread
+        self.dispatcher = dispatcher or AlertDispatcher(db_manager).start()
+        # One pooled session for every check: keep-alive connections and cached DNS across runs
+        self.http = build_session()
+        # Per-host concurrency/rate caps, and one shared request for identical checks in flight
+        self.hosts = HostLimiter()
+        self.coalescer = RequestCoalescer() if Config.COALESCE_REQUESTS else None
+        # Results are written behind by a single thread instead of one transaction per check
+        self.writer = writer or BatchWriter(db_manager).start()
+        # Optional process pool so HTML parsing doesn't hold the GIL in the checking threads
+        self.hash_pool = HashPool() if Config.HASH_WORKERS > 0 else None
+        # Per-site intervals that follow failures and content churn; the engines reschedule from state.interval
+        self.intervals = IntervalPolicy() if Config.ADAPTIVE_INTERVALS else None
+        # Deduplicated, delta-compressed page text so change alerts can say what changed
+        self.snapshots = SnapshotStore(db_manager) if Config.CONTENT_SNAPSHOTS else None
+        # Rolling latency percentiles per site, restored from the last checkpoint of the sites we own
+        self.sketches = None
+        if Config.LATENCY_SKETCHES:
+            self.sketches = SketchStore()
+            self.sketches.load(db_manager, owns=self.owns if shard is not None else None)
+
+    def close(self):
+        """Flushes results still queued for the database and gives up this worker's shard."""
+        self.writer.stop()
+        self.checkpoint_sketches()
+        self.dispatcher.stop(timeout=5)
+        if self.shard is not None:
+            self.shard.leave()
+        if self.hash_pool:
+            self.hash_pool.shutdown()
+
+    def fetch(self, url: str, headers: dict = None, rules=None) -> CheckResult:
+        reset_timings()
+        start_time = time.time()
+        try:
+            response = self.http.get(url, timeout=Config.REQUEST_TIMEOUT, headers=headers, stream=True)
+            status_code = response.status_code
+            parse_time = None
+            text = None
+            if status_code == 304:
+                # Unchanged since our validators: no body to download or parse
+                response.close()
+                content_hash = None
                 response_time = time.time() - start_time
-                status_code = response.status_code
-                is_up = status_code < 400
-                content_hash = get_content_hash(response.text)
-                error_msg = None
-            except Exception as e:
+            elif self.hash_pool:
+                # Network stage ends with the download; hashing happens in a worker process
+                body = read_body(response)
                 response_time = time.time() - start_time
-                status_code = 0
-                is_up = False
-                content_hash = None
-                error_msg = str(e)
-
-            # --- Evaluate Status Changes ---
-            was_up = website.is_up
-            old_hash = website.last_content_hash
-            
-            # --- Logic: Handle Alerts ---
-            
-            # 1. UP/DOWN Alerts
-            if is_up:
-                website.consecutive_failures = 0
-                if not was_up:
-                    website.is_up = True
-                    self._trigger_alert(website, "UP", f"RECOVERED: {website.name} is back online!")
+                content_hash, text = self.hash_pool.hash(body, response.encoding, rules)
+                parse_time = time.time() - start_time - response_time
             else:
-                website.consecutive_failures += 1
-                if was_up and website.consecutive_failures >= Config.CONSECUTIVE_FAILURES_THRESHOLD:
-                    website.is_up = False
-                    self._trigger_alert(website, "DOWN", f"DOWN: {website.name} is unreachable!\nReason: {error_msg or f'Status {status_code}'}")
-
-            # 2. Content Change (OSINT)
-            if is_up and website.last_content_hash and detect_change(website.last_content_hash, content_hash):
-                self._trigger_alert(website, "CONTENT_CHANGE", f"CHANGE DETECTED: Content modified on {website.name}!")
-
-            # 3. Slow Response
-            if is_up and response_time > Config.RESPONSE_TIME_THRESHOLD:
-                self._trigger_alert(website, "SLOW_RESPONSE", f"SLOW: {website.name} response time: {response_time:.2f}s")
-
-            # --- Update Website State ---
-            website.last_status_code = status_code
-            website.last_response_time = response_time
-            website.last_check_at = datetime.utcnow()
-            website.last_content_hash = content_hash or website.last_content_hash
-            
-            # --- Log result ---
-            from database.models import CheckLog
-            log = CheckLog(
-                website_id=website.id,
-                status_code=status_code,
-                response_time=response_time,
-                is_up=is_up,
-                content_hash=content_hash,
-                error_message=error_msg
+                # The body is hashed while it downloads; hashing CPU is kept out of the measured latency
+                content_hash, parse_time, text = hash_response(response, rules=rules)
+                response_time = time.time() - start_time - parse_time
+            connect_time, tls_time = get_timings()
+            return CheckResult(
+                status_code, response_time, status_code < 400, content_hash,
+                connect_time=connect_time, tls_time=tls_time,
+                first_byte_time=response.elapsed.total_seconds(),
+                etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+                parse_time=parse_time, text=text,
+                retry_after=retry_after(status_code, response.headers.get("Retry-After"))
             )
-            session.add(log)
-            # Commit happens via DBManager's context manager
+        except Exception as e:
+            connect_time, tls_time = get_timings()
+            return CheckResult(0, time.time() - start_time, False, error_msg=str(e),
+                               connect_time=connect_time, tls_time=tls_time)
+
+    def probe(self, url: str, mode: str) -> CheckResult:
+        """Uptime-only check: HEAD, a small byte-range GET, a TCP connect or a TLS handshake. Nothing is hashed."""
+        reset_timings()
+        start_time = time.time()
+        try:
+            if mode in CONNECT_MODES:
+                connect_time, tls_time = connect_probe(url, mode)
+                return CheckResult(None, time.time() - start_time, True, connect_time=connect_time,
+                                   tls_time=tls_time, mode=mode)
+            if mode not in ("head", "range"):
+                raise ValueError(f"Unknown check mode {mode!r}")
+            if mode == "head":
+                response = self.http.head(url, timeout=Config.REQUEST_TIMEOUT, allow_redirects=True)
+                if response.status_code in (405, 501):
+                    # Some servers refuse HEAD; a byte-range GET costs about the same
+                    mode = "range"
+            if mode == "range":
+                response = self.http.get(url, timeout=Config.REQUEST_TIMEOUT, headers=range_header(), stream=True)
+                # Servers that ignore Range send the whole page; read one chunk at most and drop the connection
+                next(response.iter_content(Config.PROBE_RANGE_BYTES), None)
+                response.close()
+            status_code = response.status_code
+            connect_time, tls_time = get_timings()
+            return CheckResult(status_code, time.time() - start_time, probe_up(status_code, mode),
+                               connect_time=connect_time, tls_time=tls_time,
+                               first_byte_time=response.elapsed.total_seconds(), mode=mode,
+                               retry_after=retry_after(status_code, response.headers.get("Retry-After")))
+        except Exception as e:
+            connect_time, tls_time = get_timings()
+            return CheckResult(0, time.time() - start_time, False, error_msg=str(e) or type(e).__name__,
+                               connect_time=connect_time, tls_time=tls_time, mode=mode)
+
+    def request(self, url: str, mode: str = "full", headers: dict = None, rules=None) -> CheckResult:
+        """Fetches or probes `url` within its host's limits; an identical request already in flight is joined instead."""
+        if self.coalescer is None:
+            return self._limited_request(url, mode, headers, rules)
+        return self.coalescer.run(request_key(url, mode, headers, rules), self._limited_request, url, mode, headers, rules)
+
+    def _limited_request(self, url, mode, headers, rules) -> CheckResult:
+        wait = self.hosts.acquire(url)
+        if wait:
+            return CheckResult(None, None, False, mode=mode, deferred=wait)
+        try:
+            result = self.fetch(url, headers, rules) if mode == "full" else self.probe(url, mode)
+        finally:
+            self.hosts.release(url)
+        if result.retry_after:
+            self.hosts.pause(url, result.retry_after)
+        return result
+
+    def checkpoint_sketches(self):
+        """Writes latency sketch counts recorded since the last checkpoint; run periodically by the engines."""
+        if self.sketches is None:
+            return
+        try:
+            self.sketches.checkpoint(self.db)
+        except Exception as e:
+            print(f"[!] Latency sketch checkpoint failed: {e}")
+
+    def track_sites(self, added, removed):
+        """Follows a StateTable.sync(): sketches of sites gained from another shard are loaded, lost ones dropped."""
+        if self.sketches is None:
+            return
+        for site in removed:
+            self.sketches.forget(site.id)
+        if added:
+            self.sketches.load(self.db, website_ids=[site.id for site in added])
+
+    def owns(self, website_id: int) -> bool:
+        """False when another worker is responsible for the site (sharded mode only)."""
+        return self.shard is None or self.shard.owns(website_id)
+
+    def check_site(self, website_id: int) -> float:
+        """Checks one site; returns the seconds to wait before retrying if its host's limits put the check off."""
+        website = self.states.get(website_id)
+        # The ring can change between reconciles; re-check ownership so a moved site isn't checked twice
+        if not website or not self.owns(website_id):
+            return
+
+        print(f"[*] Checking {website.name} ({website.url})...")
+        CHECKS_IN_FLIGHT.inc()
+        try:
+            runs_since_full = website.runs_since_full
+            mode = website.next_check_mode()
+            headers, rules = (website.conditional_headers(), website.content_rules) if mode == "full" else (None, None)
+            result = self.request(website.url, mode, headers, rules)
+            if result.deferred:
+                # Nothing was sent, so nothing is recorded and the retry is the same run
+                website.runs_since_full = runs_since_full
+                print(f"[*] {website.name}: host busy, retrying in {result.deferred:.1f}s")
+                return result.deferred
+            self._apply_result(website, result)
+        finally:
+            CHECKS_IN_FLIGHT.dec()
 
-    def _trigger_alert(self, website, alert_type, message):
+    def record_result(self, website_id: int, result: CheckResult):
+        """Applies a result fetched outside this checker (e.g. by the async engine)."""
+        website = self.states.get(website_id)
+        if not website:
+            return
+        self._apply_result(website, result)
+
+    def _apply_result(self, website, result: CheckResult):
+        is_up = result.is_up
+        status_code = result.status_code
+        response_time = result.response_time
+        content_hash = result.content_hash
+        error_msg = result.error_msg
+        alerts = []
+        outbox = []
+        snapshots = []
+
+        if result.not_modified:
+            # 304: the page is exactly what we hashed last time
+            content_hash = website.last_content_hash
+
+        # --- Evaluate Status Changes ---
+        was_up = website.is_up
+        recovered = is_up and website.consecutive_failures > 0
+
+        # --- Logic: Handle Alerts ---
+        # Alerts go out as Markdown; an unescaped "_" or "[" in a name or error would make Telegram reject them
+        name = escape_markdown(website.name)
+
+        # 1. UP/DOWN Alerts
+        if is_up:
+            website.consecutive_failures = 0
+            if not was_up:
+                website.is_up = True
+                self._trigger_alert(website, "UP", f"RECOVERED: {name} is back online!", alerts, outbox)
+        else:
+            website.consecutive_failures += 1
+            if was_up and website.consecutive_failures >= Config.CONSECUTIVE_FAILURES_THRESHOLD:
+                website.is_up = False
+                self._trigger_alert(website, "DOWN", f"DOWN: {name} is unreachable!\nReason: {escape_markdown(error_msg or f'Status {status_code}')}", alerts, outbox)
+
+        # 2. Content Change (OSINT); probes saw no content, so only full checks compare hashes
+        full = result.mode == "full"
+        content_changed = bool(full and is_up and website.last_content_hash
+                               and detect_change(website.last_content_hash, content_hash))
+        if content_changed:
+            message = f"CHANGE DETECTED: Content modified on {name}!"
+            diff = self._record_snapshot(website, content_hash, result.text, snapshots)
+            if diff:
+                message += "\n" + diff
+            self._trigger_alert(website, "CONTENT_CHANGE", message, alerts, outbox)
+        elif is_up and content_hash and not website.last_content_hash:
+            # First hash (or first after a rule change): the baseline later changes diff against
+            self._record_snapshot(website, content_hash, result.text, snapshots)
+
+        # 3. Slow Response
+        if is_up and response_time > Config.RESPONSE_TIME_THRESHOLD:
+            self._trigger_alert(website, "SLOW_RESPONSE", f"SLOW: {name} response time: {response_time:.2f}s", alerts, outbox)
+
+        # --- Update Website State ---
+        if self.sketches is not None and is_up and response_time is not None:
+            # Successful checks only, like the rollups: failures are mostly timeouts
+            self.sketches.add(website.id, response_time)
+        if self.intervals is not None:
+            self.intervals.update(website, is_up, content_changed, full, recovered)
+        checked_at = datetime.utcnow()
+        website.last_content_hash = content_hash or website.last_content_hash
+        if result.not_modified:
+            website.etag = result.etag or website.etag
+            website.last_modified = result.last_modified or website.last_modified
+        elif is_up and full:
+            website.etag = result.etag
+            website.last_modified = result.last_modified
+        website_update = {
+            "id": website.id,
+            "is_up": website.is_up,
+            "consecutive_failures": website.consecutive_failures,
+            "last_status_code": status_code,
+            "last_response_time": response_time,
+            "last_check_at": checked_at,
+            "last_content_hash": website.last_content_hash,
+            "etag": website.etag,
+            "last_modified": website.last_modified,
+            "effective_interval": website.effective_interval,
+        }
+
+        # --- Log result ---
+        log = {
+            "website_id": website.id,
+            "timestamp": checked_at,
+            "status_code": status_code,
+            "response_time": response_time,
+            "is_up": is_up,
+            "content_hash": content_hash,
+            "error_message": error_msg,
+        }
+        if Config.RECORD_TIMINGS:
+            log["connect_time"] = result.connect_time
+            log["tls_time"] = result.tls_time
+            log["first_byte_time"] = result.first_byte_time
+
+        event = None
+        if Config.STATUS_EVENTS:
+            event = {
+                "website_id": website.id,
+                "timestamp": checked_at,
+                "kind": "status" if website.is_up != was_up else "check",
+                "is_up": website.is_up,
+                "status_code": status_code,
+                "response_time": response_time,
+            }
+
+        submit_start = time.perf_counter()
+        self.writer.submit(website_update, log, alerts, outbox, event, snapshots)
+
+        # Metrics: db is the enqueue time, which only grows when the writer applies backpressure
+        _DB_TIME.observe(time.perf_counter() - submit_start)
+        _NETWORK_TIME.observe(response_time)
+        if result.parse_time is not None:
+            _PARSE_TIME.observe(result.parse_time)
+        CHECKS.labels("not_modified" if result.not_modified else "up" if is_up else "down").inc()
+
+    def _record_snapshot(self, website, content_hash, text, snapshots):
+        """Queues a snapshot of the new page text; returns a short diff against the previous one, if stored."""
+        if self.snapshots is None or text is None:
+            return None
+        try:
+            row, diff = self.snapshots.record(website.last_content_hash, content_hash, text)
+        except Exception as e:
+            print(f"[-] Snapshot failed for {website.name}: {e}")
+            return None
+        snapshots.append(row)
+        if diff is None:
+            return None
+        added, removed, sample = diff
+        # Page text would otherwise be read as markup, and Telegram rejects unbalanced entities
+        lines = [f"+{added} / -{removed} lines"] + [escape_markdown(line) for line in sample]
+        if added + removed > len(sample):
+            lines.append("…")
+        return "\n".join(lines)
+
+    def _trigger_alert(self, website, alert_type, message, alerts, outbox):
         print(f"[!] Alert: {message}")
-        # Add to DB
-        from database.models import AlertLog
-        alert = AlertLog(website_id=website.id, alert_type=alert_type, message=message)
-        # We handle session via the caller's session, but for AlertLog we might want a separate entry
-        # Actually, since we are inside a context manager, adding to session is fine.
-        # But we need to ensure the session is passed or accessible.
-        # In this implementation, check_site holds the session.
-        # So we should pass the session or just rely on the fact that 'website' is attached to it.
-        website.alerts.append(alert)
-        
-        # Send Notification
-        self.notifier.send_message(message, website_id=website.id, alert_type=alert_type)
+        # Queued with the check's other writes
+        alerts.append({
+            "website_id": website.id,
+            "timestamp": datetime.utcnow(),
+            "alert_type": alert_type,
+            "message": message,
+        })
+
+        # Send Notification (enqueue only; delivery happens on the dispatcher thread)
+        notification = self.dispatcher.prepare(message, website_id=website.id, alert_type=alert_type)
+        if notification:
+            outbox.append(notification)
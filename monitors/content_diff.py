@@ -1,34 +1,370 @@
+import codecs
 import hashlib
+import html
+import time
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+from requests.compat import chardet
 import re
+from config import Config
 
-def get_content_hash(html_content: str) -> str:
-    """
-    Generates a SHA256 hash of the website content.
-    Strips scripts, styles, and extra whitespace to focus on visible content changes (OSINT).
-    """
-    if not html_content:
-        return ""
-        
+# Noisy elements that often change without meaningful content changes
+NOISY_TAGS = frozenset(["script", "style", "meta", "noscript", "iframe"])
+
+# Tags BeautifulSoup treats as empty elements: they never have children
+VOID_TAGS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+])
+
+# Elements that start a new line in a snapshot, so diffs are per paragraph/heading/row rather than per page
+BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure", "footer",
+    "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "option", "p", "pre",
+    "section", "table", "td", "th", "title", "tr", "ul",
+])
+
+_WHITESPACE = re.compile(r'\s+')
+_SELECTOR = re.compile(r'^([a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)((?:\[[\w-]+(?:=[^\]]*)?\])*)$')
+_NUMERIC_REFERENCE = re.compile(r'^([0-9]+)(.*)', re.S)
+_HEX_REFERENCE = re.compile(r'^([0-9a-fA-F]+)(.*)', re.S)
+
+def _soup_content_hash(html_content: str) -> str:
     try:
         soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove noisy elements that often change without meaningful content changes
-        for element in soup(["script", "style", "meta", "noscript", "iframe"]):
+
+        for element in soup(list(NOISY_TAGS)):
             element.decompose()
-            
+
         # Get visible text
         text = soup.get_text()
-        
+
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
+        text = _WHITESPACE.sub(' ', text).strip()
+
         return hashlib.sha256(text.encode('utf-8')).hexdigest()
     except Exception as e:
         print(f"Error generating content hash: {e}")
         # Fallback to raw content if parsing fails
         return hashlib.sha256(html_content.encode('utf-8')).hexdigest()
 
+def _parse_selector(selector: str):
+    # tag, .class, #id, [attr], [attr=value] and combinations of them; no descendant/child combinators
+    match = _SELECTOR.match(selector.strip())
+    if not match or not selector.strip():
+        print(f"[!] Ignoring unsupported content selector: {selector!r}")
+        return None
+    tag, simple, attributes = match.groups()
+    ids = [part[1:] for part in re.findall(r'[.#][\w-]+', simple) if part[0] == "#"]
+    classes = frozenset(part[1:] for part in re.findall(r'[.#][\w-]+', simple) if part[0] == ".")
+    attrs = []
+    for attribute in re.findall(r'\[([^\]]+)\]', attributes):
+        name, _, value = attribute.partition("=")
+        attrs.append((name.lower(), value.strip('"\'') if _ else None))
+    return (tag.lower() if tag else None, ids[0] if ids else None, classes, tuple(attrs))
+
+def _split_rules(text) -> list:
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.splitlines()
+    return [line.strip() for line in text if line.strip()]
+
+class ContentRules:
+    """
+    Per-site normalization options for ContentHasher: elements (simple CSS selectors) and text patterns
+    (regexes, applied per block) left out of the hash, and whether to keep the normalized text for a
+    snapshot. Plain data, so it can be sent to HashPool worker processes.
+    """
+
+    def __init__(self, selectors=(), regexes=(), capture=False):
+        # Equal keys normalize pages identically, so their checks can share one request
+        self.key = (tuple(selectors), tuple(regexes), capture)
+        self.selectors = [parsed for parsed in map(_parse_selector, selectors) if parsed]
+        self.regexes = []
+        for pattern in regexes:
+            try:
+                self.regexes.append(re.compile(pattern))
+            except re.error as e:
+                print(f"[!] Ignoring invalid content regex {pattern!r}: {e}")
+        self.capture = capture
+
+    @classmethod
+    def build(cls, selectors=None, regexes=None, capture: bool = False):
+        """Site rules (newline-separated text) plus the global CONTENT_IGNORE_* settings; None if there are none."""
+        selectors = _split_rules(Config.CONTENT_IGNORE_SELECTORS.split(",")) + _split_rules(selectors)
+        regexes = _split_rules([Config.CONTENT_IGNORE_REGEX]) + _split_rules(regexes)
+        if not selectors and not regexes and not capture:
+            return None
+        return cls(selectors, regexes, capture)
+
+    @property
+    def buffered(self) -> bool:
+        return bool(self.regexes) or self.capture
+
+    def ignores(self, tag: str, attrs) -> bool:
+        if not self.selectors:
+            return False
+        attributes = dict(attrs)
+        classes = set((attributes.get("class") or "").split())
+        for sel_tag, sel_id, sel_classes, sel_attrs in self.selectors:
+            if sel_tag and sel_tag != tag:
+                continue
+            if sel_id and attributes.get("id") != sel_id:
+                continue
+            if not sel_classes <= classes:
+                continue
+            if any(name not in attributes or (value is not None and attributes[name] != value)
+                   for name, value in sel_attrs):
+                continue
+            return True
+        return False
+
+class ContentHasher(HTMLParser):
+    """
+    Incremental version of the BeautifulSoup normalizer: feed() markup in any number of pieces and
+    visible text is whitespace-collapsed straight into sha256, without building a tree or keeping a copy
+    of the document. Text inside NOISY_TAGS is skipped using the same open-tag stack rules as
+    BeautifulSoup's html.parser builder, so well-formed pages hash identically to the soup path.
+    With ContentRules, matching elements are skipped like NOISY_TAGS; when regexes or snapshot capture
+    are on, text is collected one block (BLOCK_TAGS) at a time, cleaned, then hashed. Block
+    boundaries add nothing to the hash, so without regexes the digest is unchanged.
+    """
+
+    def __init__(self, rules: ContentRules = None):
+        super().__init__(convert_charrefs=False)
+        self._sha = hashlib.sha256()
+        self._raw = hashlib.sha256()  # fallback if the markup can't be parsed, as in the soup path
+        self._failed = False
+        self._stack = []
+        self._ignored = []  # per _stack entry: whether its content is skipped
+        self._noisy_depth = 0
+        self._started = False
+        self._pending_space = False
+        self._rules = rules
+        self._block = [] if rules is not None and rules.buffered else None
+        self._lines = [] if rules is not None and rules.capture else None
+
+    def feed(self, data: str):
+        self._raw.update(data.encode('utf-8'))
+        if self._failed:
+            return
+        try:
+            super().feed(data)
+        except Exception as e:
+            print(f"Error generating content hash: {e}")
+            self._failed = True
+
+    def hexdigest(self) -> str:
+        if not self._failed:
+            try:
+                self.close()
+                self._end_block()
+            except Exception as e:
+                print(f"Error generating content hash: {e}")
+                self._failed = True
+        return (self._raw if self._failed else self._sha).hexdigest()
+
+    @property
+    def text(self) -> str:
+        """Normalized text, one block per line, when the rules capture it (after hexdigest())."""
+        if self._lines is None or self._failed:
+            return None
+        return "\n".join(self._lines)
+
+    def _write_text(self, text: str):
+        if self._noisy_depth:
+            return
+        if self._block is not None:
+            self._block.append(text)
+        else:
+            self._hash_text(text)
+
+    def _end_block(self):
+        if not self._block:
+            return
+        text = "".join(self._block)
+        self._block.clear()
+        for regex in self._rules.regexes:
+            text = regex.sub("", text)
+        self._hash_text(text)
+        if self._lines is not None:
+            line = _WHITESPACE.sub(" ", text).strip()
+            if line:
+                self._lines.append(line)
+
+    def _hash_text(self, text: str):
+        for index, word in enumerate(_WHITESPACE.split(text)):
+            # split() yields a (possibly empty) word around every whitespace run
+            if index:
+                self._pending_space = True
+            if word:
+                if self._pending_space and self._started:
+                    self._sha.update(b' ')
+                self._sha.update(word.encode('utf-8'))
+                self._started = True
+                self._pending_space = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._block is not None and tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in VOID_TAGS:
+            return
+        ignored = tag in NOISY_TAGS or (self._rules is not None and self._rules.ignores(tag, attrs))
+        self._stack.append(tag)
+        self._ignored.append(ignored)
+        if ignored:
+            self._noisy_depth += 1
+
+    def handle_endtag(self, tag):
+        if self._block is not None and tag in BLOCK_TAGS:
+            self._end_block()
+        # Like BeautifulSoup, an end tag closes the most recent open tag of that name and everything inside it
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index] == tag:
+                self._noisy_depth -= sum(self._ignored[index:])
+                del self._stack[index:]
+                del self._ignored[index:]
+                return
+
+    def handle_data(self, data):
+        self._write_text(data)
+
+    def handle_charref(self, name):
+        # html.parser hands over unterminated references with trailing text attached; split it off
+        match = _HEX_REFERENCE.match(name[1:]) if name[:1] in ("x", "X") else _NUMERIC_REFERENCE.match(name)
+        if match is None:
+            self._write_text(name)
+            return
+        base = 16 if name[:1] in ("x", "X") else 10
+        # unescape() applies the HTML5 replacements (windows-1252 range, invalid code points)
+        self._write_text(html.unescape(f"&#{int(match.group(1), base)};"))
+        self._write_text(match.group(2))
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self._write_text(character if character is not None else f"&{name}")
+
+    def unknown_decl(self, data):
+        # CDATA sections count as text for BeautifulSoup's get_text()
+        if data.upper().startswith("CDATA["):
+            self._write_text(data[len("CDATA["):])
+
+def get_content_hash(html_content: str) -> str:
+    """
+    Generates a SHA256 hash of the website content.
+    Strips scripts, styles, and extra whitespace to focus on visible content changes (OSINT).
+    """
+    if not html_content:
+        return ""
+
+    if Config.CONTENT_HASH_MODE == "soup":
+        return _soup_content_hash(html_content)
+
+    hasher = ContentHasher()
+    hasher.feed(html_content)
+    return hasher.hexdigest()
+
+def decode_body(body: bytes, encoding: str = None) -> str:
+    """Decodes a body the same way requests' `Response.text` does: declared charset, else detected."""
+    if encoding is None:
+        encoding = chardet.detect(body)["encoding"] if body else "utf-8"
+    try:
+        return str(body, encoding or "utf-8", errors="replace")
+    except (LookupError, TypeError):
+        return str(body, errors="replace")
+
+class StreamingHasher:
+    """
+    Hashes a response body as it arrives, reading at most `max_bytes` (0 = unlimited).
+    In "stream" mode chunks are decoded incrementally into a ContentHasher; in "soup" mode they are
+    buffered and hashed with BeautifulSoup at the end, matching the pre-streaming output exactly.
+    `encoding` is the charset declared by the server; when it is missing, "stream" mode detects it
+    from the first chunk instead of the whole body.
+    `rules` (ContentRules) only apply in "stream" mode; the legacy soup path hashes as it always did.
+    """
+
+    def __init__(self, encoding: str = None, max_bytes: int = Config.MAX_CONTENT_BYTES,
+                 mode: str = Config.CONTENT_HASH_MODE, rules: ContentRules = None):
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.parse_time = 0.0  # seconds of CPU spent hashing, so callers can keep it out of latency
+        self._buffer = bytearray() if mode == "soup" else None
+        self._hasher = None if mode == "soup" else ContentHasher(rules)
+        self._decoder = None
+
+    def update(self, chunk: bytes) -> bool:
+        """Consumes a chunk; returns False once the byte cap is reached and reading should stop."""
+        if self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.bytes_read]
+        self.bytes_read += len(chunk)
+        start = time.perf_counter()
+        if self._buffer is not None:
+            self._buffer.extend(chunk)
+        elif chunk:
+            if self._decoder is None:
+                self._decoder = _incremental_decoder(self.encoding or detect_encoding(chunk))
+            self._hasher.feed(self._decoder.decode(chunk))
+        self.parse_time += time.perf_counter() - start
+        return not self.max_bytes or self.bytes_read < self.max_bytes
+
+    def hexdigest(self) -> str:
+        start = time.perf_counter()
+        if self._buffer is not None:
+            digest = get_content_hash(decode_body(bytes(self._buffer), self.encoding))
+        elif not self.bytes_read:
+            digest = ""
+        else:
+            self._hasher.feed(self._decoder.decode(b"", final=True))
+            digest = self._hasher.hexdigest()
+        self.parse_time += time.perf_counter() - start
+        return digest
+
+    @property
+    def text(self) -> str:
+        """Snapshot text when the rules ask for it and the body was parsed, else None."""
+        return self._hasher.text if self._hasher is not None and self.bytes_read else None
+
+def detect_encoding(sample: bytes) -> str:
+    return chardet.detect(sample)["encoding"] or "utf-8"
+
+def _incremental_decoder(encoding: str):
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+def hash_response(response, max_bytes: int = Config.MAX_CONTENT_BYTES, rules: ContentRules = None):
+    """
+    Streams a `requests` response opened with stream=True through a StreamingHasher and closes it.
+    Returns (content hash, seconds spent hashing, snapshot text or None).
+    """
+    hasher = StreamingHasher(response.encoding, max_bytes, rules=rules)
+    try:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if not hasher.update(chunk):
+                break
+    finally:
+        response.close()
+    digest = hasher.hexdigest()
+    return digest, hasher.parse_time, hasher.text
+
+def read_body(response, max_bytes: int = Config.MAX_CONTENT_BYTES) -> bytes:
+    """Downloads at most `max_bytes` of a `requests` response opened with stream=True, then closes it."""
+    body = bytearray()
+    try:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            if max_bytes and len(body) >= max_bytes:
+                del body[max_bytes:]
+                break
+    finally:
+        response.close()
+    return bytes(body)
+
 def detect_change(old_hash: str, new_hash: str) -> bool:
     """Compares two hashes to detect change."""
     if not old_hash:
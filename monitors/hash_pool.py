@@ -0,0 +1,73 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from .content_diff import StreamingHasher
+from config import Config
+
+def hash_body(body: bytes, encoding: str = None, rules=None) -> tuple:
+    """Normalizes and hashes a complete body; runs in a worker process. Returns (hash, snapshot text or None)."""
+    hasher = StreamingHasher(encoding, max_bytes=0, rules=rules)
+    hasher.update(body)
+    digest = hasher.hexdigest()
+    return digest, hasher.text
+
+def _hash_item(item):
+    return hash_body(*item)
+
+class HashPool:
+    """
+    Process pool for content normalization and hashing, kept apart from network I/O.
+    Checker threads (or the event loop) download the body, then hand it here, so parsing never holds
+    the GIL the network-bound checks need. Bodies smaller than `min_bytes` are hashed inline because
+    shipping them to a worker costs more than hashing them. The whole pool is replaced after
+    `recycle_after` tasks so long-running workers can't accumulate memory.
+    """
+
+    def __init__(self, workers: int = Config.HASH_WORKERS, recycle_after: int = Config.HASH_WORKER_RECYCLE,
+                 min_bytes: int = Config.HASH_OFFLOAD_MIN_BYTES):
+        self.workers = workers
+        self.recycle_after = recycle_after
+        self.min_bytes = min_bytes
+        self._executor = None
+        self._submitted = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is not None and self.recycle_after and self._submitted >= self.recycle_after:
+                # Work already queued on the old pool still completes before its processes exit
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                # spawn, not fork: the parent runs scheduler and writer threads whose locks must not be copied
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._submitted = 0
+            self._submitted += 1
+            return self._executor
+
+    def submit(self, body: bytes, encoding: str = None, rules=None) -> Future:
+        """Future of hash_body()'s (hash, snapshot text) pair."""
+        if len(body) < self.min_bytes:
+            future = Future()
+            future.set_result(hash_body(body, encoding, rules))
+            return future
+        return self._get_executor().submit(hash_body, body, encoding, rules)
+
+    def hash(self, body: bytes, encoding: str = None, rules=None) -> tuple:
+        return self.submit(body, encoding, rules).result()
+
+    def hash_many(self, items) -> list:
+        """Hashes an iterable of (body, encoding[, rules]) tuples in bulk, preserving order."""
+        items = list(items)
+        if not items:
+            return []
+        chunksize = max(1, len(items) // (self.workers * 4))
+        return list(self._get_executor().map(_hash_item, items, chunksize=chunksize))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,141 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from http import cookiejar
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+from config import Config
+
+class DNSCache:
+    """
+    Thread-safe, size-bounded TTL cache in front of socket.getaddrinfo.
+    Entries expire after `ttl` seconds; the oldest entry is evicted once `max_entries` is reached.
+    Every address is kept, in getaddrinfo's preference order, so a connection can fall back to the next
+    one (say IPv4 when the host's IPv6 address isn't routed from here).
+    """
+
+    def __init__(self, ttl: int = Config.DNS_CACHE_TTL, max_entries: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (host, port) -> (expires_at, addresses)
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> tuple:
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        # Resolve outside the lock so one slow lookup doesn't block every other host
+        infos = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+        addresses = tuple(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return addresses
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+dns_cache = DNSCache()
+
+# Connection timings are recorded per thread: a check runs start to finish on one worker thread
+_timings = threading.local()
+
+def reset_timings():
+    _timings.connect_time = None
+    _timings.tls_time = None
+
+def get_timings():
+    """Returns (connect_time, tls_time) for connections opened since reset_timings(); None when a pooled connection was reused."""
+    return getattr(_timings, "connect_time", None), getattr(_timings, "tls_time", None)
+
+def _is_ip_literal(host: str) -> bool:
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host.strip("[]"))
+            return True
+        except OSError:
+            pass
+    return False
+
+class _CachedDNSMixin:
+    def _new_conn(self):
+        start = time.perf_counter()
+        hostname = self._dns_host
+        try:
+            addresses = (hostname,) if _is_ip_literal(hostname) else dns_cache.resolve(hostname, self.port)
+        except OSError:
+            # Let urllib3 resolve (and report the failure) the usual way
+            addresses = (hostname,)
+        # _dns_host is only used to open the socket; SNI and the Host header use the real hostname.
+        # Addresses are tried in order, like urllib3 does with its own lookup
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except ConnectTimeoutError:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = hostname
+        _timings.connect_time = (getattr(_timings, "connect_time", None) or 0.0) + time.perf_counter() - start
+        return sock
+
+class TimedHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        connect_before = getattr(_timings, "connect_time", None) or 0.0
+        super().connect()
+        connect_time = (getattr(_timings, "connect_time", None) or 0.0) - connect_before
+        _timings.tls_time = (getattr(_timings, "tls_time", None) or 0.0) + time.perf_counter() - start - connect_time
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections resolve through the shared DNS cache and record connect/TLS timings."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+class _RejectCookies(cookiejar.DefaultCookiePolicy):
+    # Checks must stay stateless like the old module-level requests.get
+    def set_ok(self, cookie, request):
+        return False
+
+def build_session(pool_hosts: int = Config.HTTP_POOL_HOSTS, per_host: int = Config.HTTP_POOL_PER_HOST) -> requests.Session:
+    """
+    Creates the shared session used by SiteChecker.
+    Up to `pool_hosts` host pools are kept warm, each holding at most `per_host` idle keep-alive
+    connections, so repeat checks skip the TCP and TLS handshakes as well as the DNS lookup.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(_RejectCookies())
+    adapter = PooledAdapter(pool_connections=pool_hosts, pool_maxsize=per_host)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = Config.USER_AGENT
+    return session
@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit
+from .metrics import COALESCED_CHECKS, HOST_DEFERRED, HOST_WAIT
+from .probes import CONNECT_MODES, probe_address
+from config import Config
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Threaded engine: seconds before a check turned away by a host with every slot taken is tried again,
+# and how early a deferred check may come back for its rate slot (scheduler wakeups aren't exact)
+BUSY_HOST_RETRY = 1.0
+RETRY_SLACK = 0.05
+
+def host_key(url: str) -> str:
+    """host:port the per-host limits apply to (the bench farm's fake hosts differ only by port)."""
+    parts = urlsplit(url)
+    return f"{parts.hostname or ''}:{parts.port or _DEFAULT_PORTS.get(parts.scheme.lower(), 0)}"
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host, no default port or fragment, "/" for an empty path."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    netloc = f"[{host}]" if ":" in host else host
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+    if "@" in parts.netloc:
+        netloc = parts.netloc.rsplit("@", 1)[0] + "@" + netloc
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+def request_key(url: str, mode: str, headers: dict = None, rules=None) -> tuple:
+    """Checks with equal keys send the same request and may share its result; connect probes only depend on the address."""
+    if mode in CONNECT_MODES and urlsplit(url).hostname:
+        return (mode,) + probe_address(url, mode)
+    return (mode, normalize_url(url), tuple(sorted((headers or {}).items())), rules.key if rules else None)
+
+def retry_after(status_code: int, value: str) -> float:
+    """Seconds a 429/503 Retry-After header (delta-seconds or HTTP date) asks us to wait, capped; None without one."""
+    if status_code not in (429, 503) or not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), Config.HOST_RETRY_AFTER_MAX) or None
+
+class _Host:
+    __slots__ = ("active", "queued", "next_start", "next_retry", "wakeup")
+
+    def __init__(self, wakeup):
+        self.active = 0       # checks holding a slot
+        self.queued = 0       # checks waiting for one (event loop)
+        self.next_start = 0.0 # monotonic time the next request may start
+        self.next_retry = 0.0 # threads: monotonic time the next deferred check is told to come back
+        self.wakeup = wakeup  # deque of waiting futures (event loop)
+
+class _HostLimits:
+    """Bookkeeping shared by both engines' limiters; callers provide the locking and the waiting."""
+
+    def __init__(self, max_concurrency: int = None, rate: float = None):
+        # Read here rather than as argument defaults, so settings changed after import (bench, tests) apply
+        self.max_concurrency = Config.HOST_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        rate = Config.HOST_RATE if rate is None else rate
+        self.spacing = 1.0 / rate if rate > 0 else 0.0
+        self._hosts = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_concurrency or self.spacing)
+
+    def _host(self, key: str) -> _Host:
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _Host(self._new_wakeup())
+        return host
+
+    def _reserve(self, host: _Host):
+        """Takes a slot and returns the monotonic time the request may start, or None if the host is full."""
+        if self.max_concurrency and host.active >= self.max_concurrency:
+            return None
+        start = max(time.monotonic(), host.next_start)
+        host.next_start = start + self.spacing
+        host.active += 1
+        return start
+
+    def _release(self, key: str, host: _Host):
+        host.active -= 1
+        # Forget idle hosts, unless a rate spacing or Retry-After pause is still running
+        if not host.active and not host.queued and host.next_start <= time.monotonic():
+            self._hosts.pop(key, None)
+
+    def _pause(self, url: str, seconds: float):
+        host = self._host(host_key(url))
+        host.next_start = max(host.next_start, time.monotonic() + seconds)
+
+    def __len__(self):
+        return len(self._hosts)
+
+class HostLimiter(_HostLimits):
+    """
+    Per-host politeness for the threaded engine: at most `max_concurrency` checks in flight per
+    host:port, request starts at least 1/`rate` seconds apart, and a pause after a 429/503 with
+    Retry-After. A check the host can't take now isn't held on its worker thread (a Retry-After
+    pause alone could tie up every worker): acquire() says how long until the host is free, and
+    the scheduler runs the check again then.
+    """
+
+    def __init__(self, max_concurrency: int = None, rate: float = None):
+        super().__init__(max_concurrency, rate)
+        self._lock = threading.Lock()
+
+    def _new_wakeup(self):
+        return None  # nothing ever waits
+
+    def acquire(self, url: str) -> float:
+        """
+        Takes a slot on `url`'s host for a request starting now and returns 0, or returns the seconds
+        until the host may take one and takes nothing. Every successful acquire() needs a release().
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            host = self._host(host_key(url))
+            now = time.monotonic()
+            if self.max_concurrency and host.active >= self.max_concurrency:
+                # There's no telling when a request in flight finishes
+                retry = max(host.next_start, now + BUSY_HOST_RETRY)
+            elif host.next_start > now + RETRY_SLACK:
+                retry = host.next_start
+            else:
+                self._reserve(host)
+                return 0.0
+            # Deferred checks are given successive rate slots instead of all coming back at once
+            retry = max(retry, host.next_retry)
+            host.next_retry = retry + self.spacing
+        HOST_DEFERRED.inc()
+        return retry - now
+
+    def release(self, url: str):
+        if not self.enabled:
+            return
+        key = host_key(url)
+        with self._lock:
+            self._release(key, self._hosts[key])
+
+    def pause(self, url: str, seconds: float):
+        with self._lock:
+            self._pause(url, seconds)
+
+class AsyncHostLimiter(_HostLimits):
+    """HostLimiter for the event loop; waiting checks are queued in arrival order per host."""
+
+    def _new_wakeup(self):
+        return deque()
+
+    @staticmethod
+    def _wake_next(host: _Host):
+        while host.wakeup:
+            waiter = host.wakeup.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        if not self.enabled:
+            yield
+            return
+        key = host_key(url)
+        wait_start = time.monotonic()
+        host = self._host(key)
+        start = None if host.queued else self._reserve(host)
+        if start is None:
+            host.queued += 1
+            try:
+                while start is None:
+                    waiter = asyncio.get_running_loop().create_future()
+                    host.wakeup.append(waiter)
+                    try:
+                        await waiter
+                    except asyncio.CancelledError:
+                        # A wakeup this check can no longer use goes to the next one in line
+                        if waiter.done() and not waiter.cancelled():
+                            self._wake_next(host)
+                        raise
+                    start = self._reserve(host)
+            finally:
+                host.queued -= 1
+        try:
+            delay = start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            HOST_WAIT.observe(time.monotonic() - wait_start)
+            yield
+        finally:
+            self._release(key, host)
+            self._wake_next(host)
+
+    def pause(self, url: str, seconds: float):
+        self._pause(url, seconds)
+
+class RequestCoalescer:
+    """Threaded engine: callers with the same key while a request is in flight wait for it and share its result."""
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func, *args):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            COALESCED_CHECKS.inc()
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(result)
+        return result
+
+class AsyncRequestCoalescer:
+    """RequestCoalescer for the event loop. The shared request keeps running if one of its waiters is cancelled."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def run(self, key, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        else:
+            COALESCED_CHECKS.inc()
+        return await asyncio.shield(task)
@@ -0,0 +1,71 @@
+import asyncio
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+from .http_pool import _is_ip_literal, dns_cache
+from config import CHECK_MODES, Config
+
+# CHECK_MODES (defined in config so CHECK_MODE is validated on load):
+# full: GET + content hash; head: HEAD request; range: GET of the first PROBE_RANGE_BYTES;
+# tcp: connect only; tls: connect + TLS handshake (certificate verified)
+CONNECT_MODES = ("tcp", "tls")
+
+_TLS_CONTEXT = ssl.create_default_context()
+
+def range_header() -> dict:
+    return {"Range": f"bytes=0-{Config.PROBE_RANGE_BYTES - 1}"}
+
+def probe_up(status_code: int, mode: str) -> bool:
+    # An empty resource answers a byte range with 416, which still means the server is up
+    return status_code < 400 or (mode == "range" and status_code == 416)
+
+def probe_address(url: str, mode: str) -> tuple:
+    """(host, port) to connect to; a TLS probe of an http:// URL without a port goes to 443."""
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise ValueError(f"No host in {url!r}")
+    port = parts.port or (443 if parts.scheme == "https" or mode == "tls" else 80)
+    return parts.hostname, port
+
+def connect_probe(url: str, mode: str, timeout: float = Config.REQUEST_TIMEOUT) -> tuple:
+    """Opens (and closes) a TCP connection, plus a TLS handshake in "tls" mode. Returns (connect_time, tls_time)."""
+    host, port = probe_address(url, mode)
+    start = time.perf_counter()
+    addresses = (host,) if _is_ip_literal(host) else dns_cache.resolve(host, port)
+    for i, address in enumerate(addresses):
+        try:
+            sock = socket.create_connection((address, port), timeout=timeout)
+            break
+        except OSError:
+            # Next address, as in http_pool; only the last one's error is reported
+            if i == len(addresses) - 1:
+                raise
+    try:
+        connect_time = time.perf_counter() - start
+        if mode != "tls":
+            return connect_time, None
+        tls_start = time.perf_counter()
+        # wrap_socket() performs the handshake; closing the TLS socket closes the TCP one too
+        _TLS_CONTEXT.wrap_socket(sock, server_hostname=host).close()
+        return connect_time, time.perf_counter() - tls_start
+    finally:
+        sock.close()
+
+async def async_connect_probe(url: str, mode: str, timeout: float = Config.REQUEST_TIMEOUT) -> tuple:
+    """Event-loop version of connect_probe(); the handshake runs as a separate step so it is timed on its own."""
+    host, port = probe_address(url, mode)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    transport, protocol = await asyncio.wait_for(loop.create_connection(asyncio.Protocol, host, port), timeout)
+    try:
+        connect_time = time.perf_counter() - start
+        if mode != "tls":
+            return connect_time, None
+        tls_start = time.perf_counter()
+        transport = await asyncio.wait_for(
+            loop.start_tls(transport, protocol, _TLS_CONTEXT, server_hostname=host), timeout
+        )
+        return connect_time, time.perf_counter() - tls_start
+    finally:
+        transport.close()
@@ -0,0 +1,241 @@
+import copy
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.base import BaseTrigger
+from database.retention import RetentionJob
+from .metrics import CHECKS_WAITING, SCHEDULER_LAG
+from config import Config
+
+_GOLDEN_RATIO = 0.6180339887498949
+
+# Epoch slot the running check was scheduled for (without jitter), set by both engines for instrumentation
+scheduled_slot = ContextVar("scheduled_slot", default=None)
+
+def schedule_phase(site_id: int, interval: int) -> float:
+    """
+    Deterministic start offset in [0, interval) for a site.
+    Multiples of the golden ratio are a low-discrepancy sequence, so consecutive ids land evenly spread
+    across the interval instead of all firing at second zero.
+    """
+    return (site_id * _GOLDEN_RATIO) % 1.0 * interval
+
+def next_slot(site_id: int, interval: int, now: float = None) -> float:
+    """Epoch timestamp of the site's next run. Slots are anchored to the epoch, so every process agrees on them."""
+    now = time.time() if now is None else now
+    phase = schedule_phase(site_id, interval)
+    return (now - phase) // interval * interval + phase + interval
+
+def schedule_jitter(interval: int) -> float:
+    # Never let jitter eat more than a tenth of a short interval
+    return min(Config.SCHEDULE_JITTER, interval * 0.1)
+
+def check_task(site_id, checker, scheduler=None, scheduled_at: float = None, retry: bool = False):
+    CHECKS_WAITING.dec()
+    state = checker.states.get(site_id)
+    # A deferred check's retry keeps its original slot, whose lag was counted on the first attempt
+    if scheduled_at is not None and not retry:
+        SCHEDULER_LAG.observe(time.time() - scheduled_at)
+    token = scheduled_slot.set(scheduled_at)
+    deferred = None
+    try:
+        deferred = checker.check_site(site_id)
+    except Exception as e:
+        print(f"Error checking site {site_id}: {e}")
+    finally:
+        scheduled_slot.reset(token)
+    if scheduler is not None and state is not None:
+        if deferred:
+            scheduler.defer(state, deferred, scheduled_at)
+        scheduler.follow_interval(state)
+
+# Fire times round-trip through microsecond datetimes, which can land them just short of their slot
+_ROUNDING = 0.001
+
+class SlotTrigger(BaseTrigger):
+    """
+    Fires at a site's epoch-anchored slots (next_slot) plus fresh jitter every run, like the async
+    engine's loop. IntervalTrigger adds the interval to the previous *jittered* fire time instead, so
+    its jitter accumulates and a site drifts off its phase.
+    """
+
+    def __init__(self, site_id: int, interval: int, jitter: float = 0.0):
+        self.site_id = site_id
+        self.interval = interval
+        self.jitter = jitter
+        self.retry = None  # (fire time, slot) of a deferred check's retry, see MonitorScheduler.defer
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        base = now.timestamp()
+        if previous_fire_time is not None:
+            base = max(base, previous_fire_time.timestamp())
+        fire = next_slot(self.site_id, self.interval, base + _ROUNDING) + random.uniform(0, self.jitter)
+        return datetime.fromtimestamp(fire, now.tzinfo)
+
+    def slot(self, fire_time: float) -> float:
+        """The slot a fire time belongs to; jitter is always less than the interval."""
+        return next_slot(self.site_id, self.interval, fire_time + _ROUNDING) - self.interval
+
+    def __str__(self):
+        return f"slot[every {self.interval}s, phase {schedule_phase(self.site_id, self.interval):.1f}s]"
+
+class _SiteExecutor(ThreadPoolExecutor):
+    """Thread pool that passes each site check the slot its run was scheduled for, to measure lag against."""
+
+    def _do_submit_job(self, job, run_times):
+        if job.id.startswith("site_"):
+            # The stored job's kwargs are shared by every run, so each submission gets its own copy.
+            # The slot excludes jitter, so lag still includes it, as in the async engine.
+            trigger, fire_time = job.trigger, run_times[-1].timestamp()
+            retry = trigger.retry is not None and abs(fire_time - trigger.retry[0]) < _ROUNDING
+            slot = trigger.retry[1] if retry else trigger.slot(fire_time)
+            if retry:
+                trigger.retry = None
+            alias, job = job._jobstore_alias, copy.copy(job)
+            job._jobstore_alias = alias  # not part of a Job's copied state
+            job.kwargs = dict(job.kwargs, scheduled_at=slot, retry=retry)
+        super()._do_submit_job(job, run_times)
+
+class MonitorScheduler:
+    """
+    APScheduler wrapper for the threaded engine.
+    - Each site's job starts at its own phase within the interval, plus random jitter per run.
+    - The executor's pool size caps how many checks are in flight; a site never overlaps itself.
+    - With adaptive intervals, a job is re-triggered after any check that moved its site's interval.
+    - A check put off by its host's limits (SiteChecker.hosts) is retried at the time the host gives
+      it, by moving the site's next run, instead of holding a worker thread while it waits.
+    - Every `reconcile_interval` seconds, active websites in the DB are diffed against registered jobs
+      so sites are added, removed or re-intervaled without a restart.
+    - Every RETENTION_INTERVAL seconds, old check history is downsampled and pruned (by the ring
+      leader only, when sharded).
+    - Every SKETCH_CHECKPOINT_INTERVAL seconds, new latency sketch counts are written to the DB.
+    - When sharded, the worker lease is renewed every heartbeat and a ring change triggers a reconcile.
+    """
+
+    def __init__(self, checker, max_workers: int = Config.SCHEDULER_WORKERS,
+                 reconcile_interval: int = Config.RECONCILE_INTERVAL):
+        self.checker = checker
+        self.db = checker.db
+        self.reconcile_interval = reconcile_interval
+        self.retention = RetentionJob(self.db)
+        self._intervals = {}  # site id -> interval its job was last triggered with
+        self.scheduler = BackgroundScheduler(
+            executors={"default": _SiteExecutor(max_workers)},
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 30},
+        )
+        # Submitted site jobs wait in the executor's queue until a worker thread picks them up
+        self.scheduler.add_listener(self._on_submitted, EVENT_JOB_SUBMITTED)
+        self.scheduler.add_listener(self._on_missed, EVENT_JOB_MISSED)
+
+    @staticmethod
+    def _on_submitted(event):
+        if event.job_id.startswith("site_"):
+            CHECKS_WAITING.inc()
+
+    @staticmethod
+    def _on_missed(event):
+        # A run still queued misfire_grace_time after its slot is dropped without calling check_task;
+        # its lag is recorded here, so overload shows up in the histogram instead of vanishing from it
+        if event.job_id.startswith("site_"):
+            CHECKS_WAITING.dec()
+            SCHEDULER_LAG.observe(time.time() - event.scheduled_run_time.timestamp())
+
+    @property
+    def running(self) -> bool:
+        return self.scheduler.running
+
+    def _trigger(self, site) -> SlotTrigger:
+        return SlotTrigger(site.id, site.interval, schedule_jitter(site.interval))
+
+    def add_site(self, site):
+        print(f"[*] Scheduling {site.name} every {site.interval}s")
+        self._intervals[site.id] = site.interval
+        self.scheduler.add_job(
+            check_task,
+            self._trigger(site),
+            args=[site.id, self.checker, self],
+            id=f"site_{site.id}",
+            replace_existing=True
+        )
+
+    def follow_interval(self, site):
+        """Re-triggers the site's job if its interval no longer matches the one it was scheduled with."""
+        # Compared without the scheduler: get_job() takes the job store lock, which shutdown(wait=True)
+        # holds while it waits for running checks, so calling it from every check could deadlock
+        if self._intervals.get(site.id, site.interval) == site.interval or not self.scheduler.running:
+            return
+        job = self.scheduler.get_job(f"site_{site.id}")
+        if job is not None:
+            self._intervals[site.id] = site.interval
+            job.reschedule(self._trigger(site))
+
+    def defer(self, site, seconds: float, scheduled_at: float = None):
+        """
+        Moves the site's next run to `seconds` from now, when its host has promised it a request slot.
+        The job itself is moved, so the site never overlaps itself; a retry past the next regular slot
+        takes that slot's place, so an overloaded host's sites are checked in turn at the rate it allows.
+        Only that one run moves: the trigger picks up at the first slot after it, keeping the site's phase.
+        """
+        # Same shutdown caveat as follow_interval(): don't touch the job store once the scheduler stops
+        if not self.scheduler.running:
+            return
+        run_at = time.time() + seconds
+        job = self.scheduler.get_job(f"site_{site.id}")
+        if job is None:
+            return  # removed by a reconcile in the meantime
+        if scheduled_at is not None:
+            job.trigger.retry = (run_at, scheduled_at)
+        try:
+            self.scheduler.modify_job(f"site_{site.id}", next_run_time=datetime.fromtimestamp(run_at))
+        except JobLookupError:
+            pass  # removed by a reconcile in the meantime
+
+    def remove_site(self, site_id: int):
+        self._intervals.pop(site_id, None)
+        job = self.scheduler.get_job(f"site_{site_id}")
+        if job:
+            job.remove()
+
+    def reconcile(self):
+        try:
+            added, removed, rescheduled = self.checker.states.sync(self.db.get_active_websites())
+        except Exception as e:
+            print(f"[!] Reconcile failed: {e}")
+            return
+        for site in removed:
+            print(f"[-] Unscheduling {site.name}")
+            self.remove_site(site.id)
+        for site in added + rescheduled:
+            self.add_site(site)
+        self.checker.track_sites(added, removed)
+
+    def heartbeat(self):
+        if self.checker.shard.heartbeat():
+            self.reconcile()
+
+    def run_retention(self):
+        shard = self.checker.shard
+        if shard is None or shard.is_leader():
+            self.retention.run()
+
+    def start(self):
+        for site in self.checker.states:
+            self.add_site(site)
+        self.scheduler.add_job(self.reconcile, "interval", seconds=self.reconcile_interval, id="reconcile")
+        self.scheduler.add_job(self.run_retention, "interval", seconds=Config.RETENTION_INTERVAL, id="retention")
+        if self.checker.sketches is not None:
+            self.scheduler.add_job(self.checker.checkpoint_sketches, "interval",
+                                   seconds=Config.SKETCH_CHECKPOINT_INTERVAL, id="sketches")
+        if self.checker.shard is not None:
+            self.scheduler.add_job(self.heartbeat, "interval", seconds=self.checker.shard.heartbeat_interval,
+                                   id="heartbeat")
+        self.scheduler.start()
+
+    def shutdown(self, wait: bool = True):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=wait)
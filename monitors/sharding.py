@@ -0,0 +1,119 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+from bisect import bisect
+from datetime import datetime, timedelta
+from database.models import WorkerLease
+from config import Config
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """
+    Consistent hash ring over worker ids. Each worker owns `vnodes` points, so sites spread evenly and
+    adding or removing a worker only moves the sites that land on its points (about 1/N of them).
+    """
+
+    def __init__(self, workers=(), vnodes: int = Config.SHARD_VNODES):
+        self.workers = tuple(sorted(workers))
+        points = sorted((_ring_hash(f"{worker}#{i}"), worker) for worker in self.workers for i in range(vnodes))
+        self._hashes = [point[0] for point in points]
+        self._owners = [point[1] for point in points]
+
+    def owner(self, site_id: int) -> str:
+        if not self._hashes:
+            return None
+        index = bisect(self._hashes, _ring_hash(f"site:{site_id}")) % len(self._hashes)
+        return self._owners[index]
+
+class ShardCoordinator:
+    """
+    Splits the active sites between checker processes that share one database.
+    Every worker keeps a row in worker_leases fresh with heartbeat(); the ring is built from the
+    live leases, so all workers derive the same owner for every site without talking to each other.
+    - A worker whose lease has gone stale (missed heartbeats) owns nothing until it renews, so it
+      can't keep checking sites the others have already taken over.
+    - A worker joins the ring two heartbeats after it started, by which time every other worker has
+      read its lease. Membership is evaluated against that fixed time rather than whenever each
+      worker happens to heartbeat, so they all switch together; sites change hands with a possible
+      skipped run rather than a doubled one.
+    - Check slots are anchored to the epoch (scheduler.next_slot), so a site keeps its timing when
+      it moves to another worker.
+    Membership is judged with each worker's own clock, so nodes need NTP-synchronized clocks.
+    """
+
+    def __init__(self, db_manager, worker_id: str = None, heartbeat_interval: int = Config.SHARD_HEARTBEAT,
+                 lease_ttl: int = Config.SHARD_LEASE_TTL, vnodes: int = Config.SHARD_VNODES):
+        self.db = db_manager
+        self.hostname = socket.gethostname()
+        self.worker_id = worker_id or f"{self.hostname}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = lease_ttl
+        self.vnodes = vnodes
+        self.started_at = datetime.utcnow()
+        self.ring = HashRing((), vnodes)
+        self._leases = []        # (worker_id, started_at) of live workers as of the last heartbeat
+        self._reported = ()      # membership last returned as a change by heartbeat()
+        self._renewed_at = None  # monotonic time of the last successful heartbeat
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        # Give up ownership a heartbeat before the others could declare this worker dead
+        return self._renewed_at is not None and \
+            time.monotonic() - self._renewed_at < self.lease_ttl - self.heartbeat_interval
+
+    def heartbeat(self) -> bool:
+        """Renews this worker's lease and refreshes the ring. Returns True if ownership changed."""
+        now = datetime.utcnow()
+        try:
+            with self.db.get_session() as session:
+                session.merge(WorkerLease(worker_id=self.worker_id, hostname=self.hostname, pid=os.getpid(),
+                                          started_at=self.started_at, heartbeat_at=now))
+                session.query(WorkerLease).filter(
+                    WorkerLease.heartbeat_at < now - timedelta(seconds=self.lease_ttl)
+                ).delete(synchronize_session=False)
+                leases = session.query(WorkerLease.worker_id, WorkerLease.started_at).all()
+        except Exception as e:
+            print(f"[!] Shard heartbeat failed: {e}")
+            return False
+        self._renewed_at = time.monotonic()
+        self._leases = leases
+        # Compared with what heartbeat last reported, since owns() also moves the ring as workers settle
+        ring = self._current_ring()
+        if ring.workers == self._reported:
+            return False
+        self._reported = ring.workers
+        print(f"[*] Shard ring: {len(ring.workers)} worker(s); this worker is {self.worker_id}")
+        return True
+
+    def _current_ring(self) -> HashRing:
+        # Settled = started two heartbeats ago; even a lone worker waits, so two workers starting
+        # together never each see only themselves
+        settled_before = datetime.utcnow() - timedelta(seconds=2 * self.heartbeat_interval)
+        members = tuple(sorted(worker_id for worker_id, started_at in self._leases if started_at <= settled_before))
+        with self._lock:
+            if members != self.ring.workers:
+                self.ring = HashRing(members, self.vnodes)
+            return self.ring
+
+    def owns(self, site_id: int) -> bool:
+        return self.alive and self._current_ring().owner(site_id) == self.worker_id
+
+    def is_leader(self) -> bool:
+        """One worker (the lowest id in the ring) runs cluster-wide housekeeping such as retention."""
+        workers = self._current_ring().workers
+        return self.alive and bool(workers) and workers[0] == self.worker_id
+
+    def leave(self):
+        """Drops the lease on shutdown so the other workers take over right away instead of after the TTL."""
+        self._renewed_at = None
+        try:
+            with self.db.get_session() as session:
+                session.query(WorkerLease).filter(WorkerLease.worker_id == self.worker_id).delete()
+        except Exception as e:
+            print(f"[!] Could not release shard lease: {e}")
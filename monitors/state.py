@@ -0,0 +1,194 @@
+import threading
+from database.db_manager import DBManager
+from .content_diff import ContentRules
+from config import Config
+
+class SiteState:
+    """
+    Compact per-site record of everything the checker needs between runs.
+    __slots__ keeps it to a few hundred bytes per site, so 100k targets fit in tens of MB.
+    """
+    __slots__ = ("id", "name", "url", "check_interval", "is_up", "consecutive_failures", "last_content_hash",
+                 "etag", "last_modified", "min_interval", "max_interval", "effective_interval",
+                 "ignore_selectors", "ignore_regexes", "content_rules", "check_mode", "full_check_every",
+                 "runs_since_full")
+
+    def __init__(self, id, name, url, check_interval, is_up=True, consecutive_failures=0, last_content_hash=None,
+                 etag=None, last_modified=None, min_interval=None, max_interval=None, effective_interval=None,
+                 ignore_selectors=None, ignore_regexes=None, check_mode=None, full_check_every=None):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.check_interval = check_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.effective_interval = effective_interval  # set by monitors.adaptive; None = check_interval
+        self.is_up = is_up
+        self.consecutive_failures = consecutive_failures
+        self.last_content_hash = last_content_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.ignore_selectors = ignore_selectors
+        self.ignore_regexes = ignore_regexes
+        self.content_rules = self._build_rules()
+        self.check_mode = check_mode or Config.CHECK_MODE
+        self.full_check_every = Config.FULL_CHECK_EVERY if full_check_every is None else full_check_every
+        self.runs_since_full = 0
+
+    def _build_rules(self):
+        # None (the common case) keeps the plain hashing path
+        return ContentRules.build(self.ignore_selectors, self.ignore_regexes, capture=Config.CONTENT_SNAPSHOTS)
+
+    def set_ignore_rules(self, selectors, regexes) -> bool:
+        """
+        Applies edited ignore rules; returns True if they changed. The stored hash was computed with
+        the old rules, so it is dropped: the next check re-baselines instead of alerting on the rule change.
+        """
+        if (selectors, regexes) == (self.ignore_selectors, self.ignore_regexes):
+            return False
+        self.ignore_selectors = selectors
+        self.ignore_regexes = regexes
+        self.content_rules = self._build_rules()
+        self.last_content_hash = None
+        return True
+
+    @classmethod
+    def from_website(cls, website):
+        return cls(
+            website.id, website.name, website.url, website.check_interval,
+            is_up=website.is_up if website.is_up is not None else True,
+            consecutive_failures=website.consecutive_failures or 0,
+            last_content_hash=website.last_content_hash,
+            etag=website.etag,
+            last_modified=website.last_modified,
+            min_interval=website.min_interval,
+            max_interval=website.max_interval,
+            # A leftover adaptive interval is ignored once the feature is switched off
+            effective_interval=website.effective_interval if Config.ADAPTIVE_INTERVALS else None,
+            ignore_selectors=website.ignore_selectors,
+            ignore_regexes=website.ignore_regexes,
+            check_mode=website.check_mode,
+            full_check_every=website.full_check_every,
+        )
+
+    @property
+    def interval(self) -> int:
+        """Seconds between checks as actually scheduled."""
+        return self.effective_interval or self.check_interval
+
+    def next_check_mode(self) -> str:
+        """
+        Mode for the run about to start. Probe sites get a full content check every `full_check_every`
+        runs, and straight away while there is no content hash yet to compare later full checks with.
+        """
+        if self.check_mode == "full":
+            return "full"
+        if self.full_check_every and (not self.last_content_hash or self.runs_since_full + 1 >= self.full_check_every):
+            self.runs_since_full = 0
+            return "full"
+        self.runs_since_full += 1
+        return self.check_mode
+
+    def conditional_headers(self) -> dict:
+        """Validators for a conditional GET; only sent once there is a content hash a 304 can stand for."""
+        headers = {}
+        if self.last_content_hash:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def __repr__(self):
+        return f"<SiteState(id={self.id}, name='{self.name}', is_up={self.is_up})>"
+
+class StateTable:
+    """
+    Authoritative in-process monitor state, keyed by Website.id.
+    Loaded once from the database; afterwards the checker reads and updates it in memory and
+    the DB copy is only written (asynchronously, by BatchWriter), never read back on the hot path.
+    With a ShardCoordinator, only the sites this worker owns are kept.
+    """
+
+    def __init__(self, db_manager: DBManager, shard=None):
+        self.db = db_manager
+        self.shard = shard
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _owned(self, websites):
+        if self.shard is None:
+            return list(websites)
+        return [website for website in websites if self.shard.owns(website.id)]
+
+    def load(self):
+        states = {site.id: SiteState.from_website(site) for site in self._owned(self.db.get_active_websites())}
+        with self._lock:
+            self._states = states
+        return self
+
+    def get(self, website_id: int):
+        state = self._states.get(website_id)
+        if state is None:
+            # Site added after startup: fall back to the DB once, then keep it in memory
+            state = self._load_one(website_id)
+        return state
+
+    def _load_one(self, website_id: int):
+        from database.models import Website
+        with self.db.get_session() as session:
+            website = session.query(Website).get(website_id)
+            if not website:
+                return None
+            state = SiteState.from_website(website)
+        with self._lock:
+            return self._states.setdefault(website_id, state)
+
+    def sync(self, websites):
+        """
+        Brings the table in line with the given (active) websites without touching in-memory monitor state.
+        Returns (added, removed, rescheduled) lists of SiteState, the last being sites whose interval changed.
+        A new configured interval also restarts adaptive scheduling from it.
+        Sites owned by another shard count as removed.
+        """
+        active = {website.id: website for website in self._owned(websites)}
+        added, removed, rescheduled = [], [], []
+        with self._lock:
+            for website_id in list(self._states):
+                if website_id not in active:
+                    removed.append(self._states.pop(website_id))
+            for website_id, website in active.items():
+                state = self._states.get(website_id)
+                if state is None:
+                    state = SiteState.from_website(website)
+                    self._states[website_id] = state
+                    added.append(state)
+                    continue
+                state.name = website.name
+                state.url = website.url
+                state.min_interval = website.min_interval
+                state.max_interval = website.max_interval
+                state.set_ignore_rules(website.ignore_selectors, website.ignore_regexes)
+                state.check_mode = website.check_mode or Config.CHECK_MODE
+                state.full_check_every = (Config.FULL_CHECK_EVERY if website.full_check_every is None
+                                          else website.full_check_every)
+                if state.check_interval != website.check_interval:
+                    state.check_interval = website.check_interval
+                    state.effective_interval = None
+                    rescheduled.append(state)
+        return added, removed, rescheduled
+
+    def put(self, state: SiteState):
+        with self._lock:
+            self._states[state.id] = state
+
+    def remove(self, website_id: int):
+        with self._lock:
+            self._states.pop(website_id, None)
+
+    def __len__(self):
+        return len(self._states)
+
+    def __iter__(self):
+        # Iterate over a snapshot so callers can't trip over concurrent put/remove
+        return iter(list(self._states.values()))
@@ -67,12 +67,8 @@ def reset_and_seed():
     ]
     
     print(f"Seeding {len(sites)} categorized websites...")
-    for name, url in sites:
-        try:
-            db.add_website(name, url, 300) # Setting default interval to 5 mins for bulk
-            print(f" [+] Added: {name}")
-        except Exception as e:
-            print(f" [!] Error adding {name}: {e}")
+    result = db.bulk_upsert_websites(sites, interval=300) # Setting default interval to 5 mins for bulk
+    print(f" [+] Added: {result['inserted']}, Skipped: {result['skipped']}")
             
     print("\nDatabase reset and seeded successfully.")
     print("Restart your background monitor script to start tracking these sites!")